@@ -0,0 +1,208 @@
+# ai_cache.py
+"""
+Cache persistente para os resultados das seções geradas pela IA.
+
+A chave de cada entrada é um hash (SHA-256) do nome da seção, da versão dos
+prompts, do nome do modelo e dos dados exatos do perfil/plano usados pela seção.
+Assim, uma nova análise após uma pequena edição só paga pelas seções afetadas.
+
+Backends disponíveis:
+    DiskCache       -> arquivos JSON em um diretório local
+    FirestoreCache  -> documentos em uma coleção do Firestore
+
+Os dois aceitam `compress=True`, que guarda o valor em JSON comprimido com zlib
+(usado pelo cache de perfis, em profile_cache.py, para textos longos).
+"""
+import os
+import json
+import time
+import zlib
+import hashlib
+import threading
+from pathlib import Path
+
+# Configuração via variáveis de ambiente.
+CACHE_BACKEND = os.environ.get("PDI_AI_CACHE_BACKEND", "disk")  # "disk", "firestore" ou "none"
+CACHE_DIR = Path(os.environ.get("PDI_AI_CACHE_DIR", "data_pdi/ai_cache"))
+CACHE_COLLECTION = os.environ.get("PDI_AI_CACHE_COLLECTION", "pdi_ai_cache")
+CACHE_TTL_SECONDS = int(os.environ.get("PDI_AI_CACHE_TTL_DAYS", "30")) * 24 * 3600
+CACHE_MAX_ENTRIES = int(os.environ.get("PDI_AI_CACHE_MAX_ENTRIES", "5000"))
+CACHE_MAX_BYTES = int(os.environ.get("PDI_AI_CACHE_MAX_MB", "50")) * 1024 * 1024
+# Intervalo mínimo (s) entre duas limpezas do mesmo cache em um processo.
+CACHE_EVICT_INTERVAL = float(os.environ.get("PDI_AI_CACHE_EVICT_INTERVAL_S", "600"))
+
+_last_eviction = {}  # local do cache -> instante da última limpeza neste processo
+_eviction_lock = threading.Lock()
+
+
+def _eviction_due(location, interval) -> bool:
+    """
+    True se o cache em `location` não foi limpo neste processo há `interval` segundos.
+    A limpeza percorre o cache inteiro, então não é feita a cada gravação.
+    """
+    now = time.monotonic()
+    with _eviction_lock:
+        last = _last_eviction.get(location)
+        if last is not None and now - last < interval:
+            return False
+        _last_eviction[location] = now
+        return True
+
+
+def _compress(value) -> bytes:
+    return zlib.compress(json.dumps(value, ensure_ascii=False).encode("utf-8"), 6)
+
+
+def _decompress(data: bytes):
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+def make_cache_key(section: str, prompt_version, model_name: str, inputs) -> str:
+    """Gera a chave de conteúdo (hash) para uma seção."""
+    payload = json.dumps(
+        {"section": section, "prompt_version": prompt_version, "model": model_name, "inputs": inputs},
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """Cache em disco: um arquivo JSON por chave, com TTL e remoção dos menos usados quando cheio."""
+
+    def __init__(self, directory=CACHE_DIR, ttl=CACHE_TTL_SECONDS,
+                 max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES,
+                 evict_interval=CACHE_EVICT_INTERVAL, compress=False):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evict_interval = evict_interval
+        self.compress = compress
+        self.suffix = ".json.z" if compress else ".json"
+
+    def _path(self, key):
+        return self.directory / f"{key}{self.suffix}"
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if self.compress:
+                entry = _decompress(path.read_bytes())
+            else:
+                entry = json.loads(path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, zlib.error, json.JSONDecodeError):
+            return None
+        if entry.get("expires_at", 0) < time.time():
+            path.unlink(missing_ok=True)
+            return None
+        # Atualiza o mtime para que a remoção por tamanho funcione como LRU.
+        os.utime(path)
+        return entry.get("value")
+
+    def set(self, key, value):
+        now = time.time()
+        entry = {"created_at": now, "expires_at": now + self.ttl, "value": value}
+        tmp_path = self._path(key).with_suffix(f".{os.getpid()}.tmp")
+        if self.compress:
+            tmp_path.write_bytes(_compress(entry))
+        else:
+            tmp_path.write_text(json.dumps(entry, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self._path(key))
+        if _eviction_due(("disk", str(self.directory.resolve())), self.evict_interval):
+            self.evict()
+
+    def evict(self):
+        """Remove entradas expiradas e, se necessário, as menos usadas até respeitar os limites."""
+        now = time.time()
+        files = []
+        for path in self.directory.glob(f"*{self.suffix}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime + self.ttl < now:
+                path.unlink(missing_ok=True)
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        files.sort()
+        total_bytes = sum(size for _, size, _ in files)
+        while files and (len(files) > self.max_entries or total_bytes > self.max_bytes):
+            _, size, path = files.pop(0)
+            path.unlink(missing_ok=True)
+            total_bytes -= size
+
+
+class FirestoreCache:
+    """Cache em uma coleção do Firestore: um documento por chave, com TTL e limite de entradas."""
+
+    def __init__(self, collection=CACHE_COLLECTION, ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES,
+                 evict_interval=CACHE_EVICT_INTERVAL, compress=False):
+        from auth import get_db
+        self.db = get_db()
+        self.collection = collection
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evict_interval = evict_interval
+        self.compress = compress
+
+    def _ref(self):
+        return self.db.collection(self.collection)
+
+    def get(self, key):
+        if self.db is None:
+            return None
+        doc = self._ref().document(key).get()
+        if not doc.exists:
+            return None
+        entry = doc.to_dict()
+        if entry.get("expires_at", 0) < time.time():
+            doc.reference.delete()
+            return None
+        # O valor é guardado como JSON para preservar listas aninhadas e chaves arbitrárias.
+        try:
+            if self.compress:
+                return _decompress(entry["data"])
+            return json.loads(entry["value"])
+        except (KeyError, zlib.error, json.JSONDecodeError):
+            return None
+
+    def set(self, key, value):
+        if self.db is None:
+            return
+        now = time.time()
+        entry = {"created_at": now, "expires_at": now + self.ttl}
+        if self.compress:
+            entry["data"] = _compress(value)
+        else:
+            entry["value"] = json.dumps(value, ensure_ascii=False)
+        self._ref().document(key).set(entry)
+        if _eviction_due(("firestore", self.collection), self.evict_interval):
+            self.evict()
+
+    def evict(self):
+        """Remove entradas expiradas e, se a coleção passar do limite, as mais antigas."""
+        now = time.time()
+        for doc in self._ref().where("expires_at", "<", now).limit(100).stream():
+            doc.reference.delete()
+
+        total = self._ref().count().get()[0][0].value
+        excess = total - self.max_entries
+        if excess > 0:
+            for doc in self._ref().order_by("created_at").limit(excess).stream():
+                doc.reference.delete()
+
+
+def get_section_cache():
+    """Retorna o backend de cache configurado, ou None se o cache estiver desativado/indisponível."""
+    try:
+        if CACHE_BACKEND == "disk":
+            return DiskCache()
+        if CACHE_BACKEND == "firestore":
+            return FirestoreCache()
+    except Exception as e:
+        print(f"AVISO: Cache da IA indisponível ({CACHE_BACKEND}): {e}")
+    return None
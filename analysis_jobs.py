@@ -0,0 +1,216 @@
+# analysis_jobs.py
+"""
+Pool persistente de processos para as análises de PDI.
+
+Em vez de criar um multiprocessing.Manager() e um Process a cada clique, o servidor
+mantém um número fixo de processos de trabalho (PDI_MAX_PARALLEL_ANALYSES) que
+consomem uma fila explícita de jobs. Cada job tem um ID, e a posição na fila e o
+último status de progresso podem ser consultados a qualquer momento.
+"""
+import os
+import time
+import uuid
+import queue
+import threading
+import multiprocessing
+
+from pdi_analyzer import run_full_analysis_process
+from timing import recent_timings
+
+MAX_PARALLEL_ANALYSES = int(os.environ.get("PDI_MAX_PARALLEL_ANALYSES", "2"))
+# Jobs finalizados e não lidos por nenhuma sessão são descartados após este tempo (s).
+FINISHED_JOB_RETENTION = int(os.environ.get("PDI_FINISHED_JOB_RETENTION", "3600"))
+# Os processos de trabalho não podem nascer de um fork do servidor: o despachante os
+# recria a qualquer momento, e um fork feito enquanto outra thread segura uma trava
+# (timing, caixa de saída, pool do bcrypt...) herda essa trava fechada para sempre.
+# O "forkserver" cria os processos a partir de um servidor de fork de uma thread só.
+START_METHOD = os.environ.get(
+    "PDI_ANALYSIS_START_METHOD",
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn",
+)
+
+TERMINAL_STATUSES = ("complete", "error")
+
+
+class _JobProgress:
+    """Adaptador com a interface .put() esperada por run_full_analysis_process."""
+
+    def __init__(self, events_q, job_id):
+        self.events_q = events_q
+        self.job_id = job_id
+
+    def put(self, msg):
+        self.events_q.put((self.job_id, msg))
+
+
+def _worker_loop(jobs_q, events_q, target):
+    """Laço de um processo de trabalho: executa jobs até receber None."""
+    while True:
+        job = jobs_q.get()
+        if job is None:
+            break
+        job_id, user_email, kwargs = job
+        events_q.put((job_id, {"status": "started", "pid": os.getpid()}))
+        try:
+            target(_JobProgress(events_q, job_id), user_email, **kwargs)
+        except Exception as e:
+            events_q.put((job_id, {"status": "error", "message": f"Ocorreu um erro no processo: {e}"}))
+        events_q.put((job_id, {"status": "finished"}))
+
+
+class AnalysisJobManager:
+    """Fila de jobs de análise atendida por um pool limitado de processos."""
+
+    def __init__(self, max_workers=MAX_PARALLEL_ANALYSES, target=run_full_analysis_process):
+        self.max_workers = max(1, max_workers)
+        self.target = target
+        self._ctx = multiprocessing.get_context(START_METHOD)
+        if START_METHOD == "forkserver" and getattr(target, "__module__", "__main__") != "__main__":
+            # O servidor de fork importa o módulo do alvo uma vez; cada processo já nasce com ele.
+            self._ctx.set_forkserver_preload([target.__module__])
+        self._jobs_q = self._ctx.Queue()
+        self._events_q = self._ctx.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._pending = []  # IDs dos jobs aguardando um processo livre, em ordem de chegada
+        self._jobs = {}
+        self._closed = False
+        self._ensure_workers()
+        self._dispatcher = threading.Thread(target=self._dispatch, name="analysis-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    # --- API pública ---
+
+    def submit(self, user_email, **kwargs) -> str:
+        """Enfileira uma análise e retorna o ID do job."""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = {
+                "status": "queued",
+                "last": None,
+                "sections": {},  # seções já prontas, exibidas antes do fim da análise
+                "metrics": None,
+                "spans": None,  # tempo de cada etapa, medido no processo de análise
+                "pid": None,
+                "submitted_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+            }
+            self._pending.append(job_id)
+        self._ensure_workers()
+        self._jobs_q.put((job_id, user_email, kwargs))
+        return job_id
+
+    def status(self, job_id):
+        """
+        Retorna uma cópia do estado do job, incluindo "position" (1 = próximo a ser
+        atendido, 0 = já em execução ou finalizado), ou None se o job não existir.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            state = dict(job)
+            state["sections"] = dict(job["sections"])
+            state["position"] = self._pending.index(job_id) + 1 if job_id in self._pending else 0
+            return state
+
+    def forget(self, job_id):
+        """Descarta um job finalizado depois que a sessão já consumiu o resultado."""
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            if job_id in self._pending:
+                self._pending.remove(job_id)
+
+    def stats(self):
+        with self._lock:
+            running = sum(1 for job in self._jobs.values() if job["status"] == "running")
+            return {
+                "workers": len(self._workers),
+                "max_workers": self.max_workers,
+                "queued": len(self._pending),
+                "running": running,
+                "worker_pids": [w.pid for w in self._workers],
+            }
+
+    def shutdown(self):
+        self._closed = True
+        for _ in self._workers:
+            self._jobs_q.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5)
+
+    # --- Internos ---
+
+    def _ensure_workers(self):
+        """Mantém o pool completo, substituindo processos que morreram."""
+        with self._lock:
+            alive = []
+            for worker in self._workers:
+                if worker.is_alive():
+                    alive.append(worker)
+                    continue
+                # Um job em execução em um processo morto nunca vai terminar sozinho.
+                for job in self._jobs.values():
+                    if job["pid"] == worker.pid and job["status"] not in TERMINAL_STATUSES:
+                        job["status"] = "error"
+                        job["last"] = {"status": "error", "message": "O processo de análise foi interrompido inesperadamente."}
+                        job["finished_at"] = time.time()
+            while not self._closed and len(alive) < self.max_workers:
+                worker = self._ctx.Process(
+                    target=_worker_loop,
+                    args=(self._jobs_q, self._events_q, self.target),
+                    daemon=True,
+                )
+                worker.start()
+                alive.append(worker)
+            self._workers = alive
+
+    def _dispatch(self):
+        """Recebe os eventos dos processos e atualiza o estado dos jobs."""
+        while not self._closed:
+            try:
+                job_id, msg = self._events_q.get(timeout=1)
+            except queue.Empty:
+                self._ensure_workers()
+                self._purge_finished()
+                continue
+            except (EOFError, OSError):
+                break
+
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    continue
+                status = msg.get("status")
+                if status == "started":
+                    if job_id in self._pending:
+                        self._pending.remove(job_id)
+                    job["status"] = "running"
+                    job["pid"] = msg.get("pid")
+                    job["started_at"] = time.time()
+                elif status == "finished":
+                    if job["status"] not in TERMINAL_STATUSES:
+                        job["status"] = "error"
+                        job["last"] = {"status": "error", "message": "A análise terminou sem resultado."}
+                    job["finished_at"] = job["finished_at"] or time.time()
+                elif status == "section":
+                    job["sections"][msg["key"]] = msg["value"]
+                elif status == "metrics":
+                    job["metrics"] = msg["data"]
+                elif status == "spans":
+                    job["spans"] = msg["data"]
+                    # Alimenta o painel de desempenho deste servidor.
+                    recent_timings.extend(msg["data"])
+                else:
+                    job["last"] = msg
+                    if status in TERMINAL_STATUSES:
+                        job["status"] = status
+                        job["finished_at"] = time.time()
+
+    def _purge_finished(self):
+        limit = time.time() - FINISHED_JOB_RETENTION
+        with self._lock:
+            for job_id in [jid for jid, job in self._jobs.items()
+                           if job["finished_at"] and job["finished_at"] < limit]:
+                del self._jobs[job_id]
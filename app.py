@@ -1,14 +1,17 @@
 # app.py
 import os
 import re
+import copy
 import json
+import hashlib
 import time
-import queue
 import textwrap
+import threading
 import firebase_admin
 from fpdf import FPDF
 import streamlit as st
 import multiprocessing
+from analysis_jobs import AnalysisJobManager
 from pathlib import Path
 from firebase_admin import credentials
 from datetime import datetime, timedelta
@@ -21,9 +24,19 @@ from auth import (
     set_password_reset_token, 
     reset_password_with_token,
     load_pdi_data_from_firestore,
-    save_pdi_data_to_firestore
+    save_pdi_data_to_firestore,
+    save_analysis_result,
+    reserve_analysis_slot,
+    release_analysis_slot,
+    warm_up_db,
+    get_db_stats,
+    get_email_outbox,
 )
-from pdi_analyzer import run_full_analysis_process
+from password_hashing import HashingBusy
+from linkedin_scraper import SCRAPING_ENABLED
+from browser_setup import start_browser_provisioning
+from pdf_fonts import add_cached_font
+from timing import span, recent_timings
 
 # --- CONFIGURAÇÃO INICIAL E FUNÇÕES AUXILIARES ---
 # **NOVO:** A função de inicialização agora mora aqui.
@@ -71,13 +84,99 @@ from pdi_analyzer import run_full_analysis_process
 DATA_PATH = Path("data_pdi")
 DATA_PATH.mkdir(parents=True, exist_ok=True)
 
+@st.cache_resource
+def provision_browser_once():
+    """Instala o navegador do Playwright uma única vez por início do servidor (só se o scraping estiver ativo)."""
+    if SCRAPING_ENABLED:
+        start_browser_provisioning()
+    return True
+
+@st.cache_resource
+def warm_up_firestore_once():
+    """Cria o cliente Firestore e abre a conexão uma única vez, no início do servidor."""
+    warm_up_db()
+    return True
+
+@st.cache_resource
+def start_email_outbox_once():
+    """Inicia o envio em segundo plano no início do servidor (mensagens pendentes de antes são enviadas)."""
+    get_email_outbox()
+    return True
+
+@st.cache_resource
+def get_job_manager():
+    """Pool de processos de análise compartilhado por todas as sessões do servidor."""
+    return AnalysisJobManager()
+
+# --- CACHE DO DOCUMENTO DO USUÁRIO ---
+# Cada rerun do Streamlit chamava load_pdi_data; agora o documento fica em cache na sessão
+# (e, opcionalmente, entre sessões do mesmo usuário) até ser invalidado por um save ou
+# expirar. A expiração limita o quanto uma aba pode ficar atrás de outra do mesmo usuário;
+# o limite de análises não depende dela (ver reserve_analysis_slot).
+SESSION_USER_CACHE_TTL = int(os.environ.get("PDI_SESSION_USER_CACHE_TTL", "60"))  # segundos
+SHARED_USER_CACHE_TTL = int(os.environ.get("PDI_SHARED_USER_CACHE_TTL", "0"))  # segundos; 0 = desativado
+
+@st.cache_resource
+def get_shared_user_cache():
+    """Cache entre sessões (por usuário) e contadores, compartilhados por todo o servidor."""
+    return {
+        "lock": threading.Lock(),
+        "docs": {},  # user_id -> (timestamp, dados)
+        "stats": {"hits": 0, "shared_hits": 0, "misses": 0, "invalidations": 0},
+    }
+
+def _count(stat):
+    shared = get_shared_user_cache()
+    with shared["lock"]:
+        shared["stats"][stat] += 1
+
+def get_user_cache_stats():
+    """Retorna os contadores do cache. Cada acerto é uma leitura do Firestore economizada."""
+    shared = get_shared_user_cache()
+    with shared["lock"]:
+        stats = dict(shared["stats"])
+    stats["firestore_reads_saved"] = stats["hits"] + stats["shared_hits"]
+    return stats
+
+def invalidate_pdi_data(user_id):
+    """Remove o documento do usuário dos caches da sessão e do servidor."""
+    st.session_state.setdefault("pdi_data_cache", {}).pop(user_id, None)
+    shared = get_shared_user_cache()
+    with shared["lock"]:
+        shared["docs"].pop(user_id, None)
+        shared["stats"]["invalidations"] += 1
+
 def save_pdi_data(user_id, data):
-    """Salva todos os dados do PDI do usuário no Firestore."""
-    save_pdi_data_to_firestore(user_id, data)
+    """Salva no Firestore apenas o que mudou em relação à última versão lida nesta sessão."""
+    cached = st.session_state.setdefault("pdi_data_cache", {}).get(user_id)
+    save_pdi_data_to_firestore(user_id, data, snapshot=cached[1] if cached else None)
+    invalidate_pdi_data(user_id)
 
 def load_pdi_data(user_id):
-    """Carrega os dados do PDI de um arquivo JSON, se ele existir."""
-    return load_pdi_data_from_firestore(user_id)
+    """Carrega os dados do PDI do usuário, lendo o Firestore apenas quando não há cópia recente em cache."""
+    session_cache = st.session_state.setdefault("pdi_data_cache", {})
+    cached = session_cache.get(user_id)
+    if cached and time.time() - cached[0] < SESSION_USER_CACHE_TTL:
+        _count("hits")
+        return copy.deepcopy(cached[1])
+
+    if SHARED_USER_CACHE_TTL > 0:
+        shared = get_shared_user_cache()
+        with shared["lock"]:
+            cached = shared["docs"].get(user_id)
+        if cached and time.time() - cached[0] < SHARED_USER_CACHE_TTL:
+            _count("shared_hits")
+            session_cache[user_id] = cached
+            return copy.deepcopy(cached[1])
+
+    _count("misses")
+    data = load_pdi_data_from_firestore(user_id)
+    session_cache[user_id] = (time.time(), copy.deepcopy(data))
+    if SHARED_USER_CACHE_TTL > 0:
+        shared = get_shared_user_cache()
+        with shared["lock"]:
+            shared["docs"][user_id] = session_cache[user_id]
+    return data
 
 # --- FUNÇÃO GERADORA DE PDF (CORRIGIDA E APRIMORADA) ---
 def generate_pdi_pdf(pdi_data):
@@ -96,7 +195,8 @@ def generate_pdi_pdf(pdi_data):
             f"Fonte não encontrada em {font_path}. Baixe DejaVuSans.ttf e coloque em /fonts"
         )
     #pdf.add_font("DejaVu", "", font_path, uni=True)
-    pdf.add_font("DejaVu", "", font_path)
+    # A fonte é processada uma vez por processo e reaproveitada entre PDFs (pdf_fonts.py).
+    add_cached_font(pdf, "DejaVu", "", font_path)
     pdf.set_font("DejaVu", "", 16)
 
     # --- Helpers ---
@@ -348,9 +448,160 @@ def generate_pdi_pdf(pdi_data):
 
     return bytes(pdf.output())
 
+# --- CACHE DO PDF ---
+PDF_CACHE_MAX_ENTRIES = int(os.environ.get("PDI_PDF_CACHE_MAX_ENTRIES", "32"))
+
+def pdf_cache_key(pdi_data):
+    """Hash do conteúdo que aparece no PDF (análise da IA + nome do perfil)."""
+    payload = json.dumps(
+        {
+            "ai_analysis": pdi_data.get("ai_analysis", {}),
+            "nome": (pdi_data.get("profile", {}) or {}).get("nome"),
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+@st.cache_data(max_entries=PDF_CACHE_MAX_ENTRIES, show_spinner="Gerando PDF...")
+def get_pdi_pdf_bytes(cache_key, _pdi_data):
+    """
+    Retorna os bytes do PDF, montando-o apenas na primeira vez para cada `cache_key`.
+    O cache é limitado a PDF_CACHE_MAX_ENTRIES itens, descartando os menos usados.
+    """
+    with span("pdf_build"):
+        return generate_pdi_pdf(_pdi_data)
+
+# --- ACOMPANHAMENTO DA ANÁLISE ---
+@st.fragment(run_every=1)
+def render_analysis_status(user_email):
+    """
+    Região de status da análise em andamento. Só este fragmento é reexecutado a cada
+    segundo; o resto da página (e o documento no Firestore) não é relido enquanto se espera.
+    """
+    job_manager = get_job_manager()
+    job_id = st.session_state.analysis_job_id
+    if job_id is None:
+        return
+    job = job_manager.status(job_id)
+    msg = job.get("last") if job else {"status": "error", "message": "A análise não foi encontrada. Tente novamente."}
+    if msg:
+        st.session_state.last_status = msg
+    if isinstance(msg, dict):
+        if msg.get("status") == "complete":
+            st.success("Análise concluída!")
+            st.balloons()
+            # Só o resultado é gravado: o resto do documento lido pelo processo pode estar desatualizado.
+            save_analysis_result(user_email, msg.get("data"))
+            invalidate_pdi_data(user_email)
+            st.session_state.analysis_slot = None
+            job_manager.forget(job_id)
+            st.session_state.analysis_job_id = None
+            st.rerun(scope="app")
+        elif msg.get("status") == "error":
+            st.error(f"Erro: {msg.get('message')}")
+            # Uma análise sem resultado não conta para o limite mensal.
+            release_analysis_slot(user_email, st.session_state.get("analysis_slot"))
+            st.session_state.analysis_slot = None
+            invalidate_pdi_data(user_email)
+            job_manager.forget(job_id)
+            st.session_state.analysis_job_id = None
+            st.rerun(scope="app")
+    if job and job["status"] == "queued":
+        st.info(f"Sua análise está na fila (posição {job['position']}). Ela começará em breve...")
+    elif st.session_state.last_status and isinstance(st.session_state.last_status, dict):
+        if st.session_state.last_status.get("status") == "info":
+            st.info(st.session_state.last_status.get("message"))
+
+    # Seções que já ficaram prontas aparecem enquanto as demais ainda estão sendo geradas.
+    if job and job.get("sections"):
+        st.markdown("---")
+        st.caption("Prévia do diagnóstico (atualizada à medida que cada seção fica pronta)")
+        for key, title in PARTIAL_SECTION_TITLES.items():
+            if key in job["sections"]:
+                render_partial_section(title, job["sections"][key])
+
+PARTIAL_SECTION_TITLES = {
+    "analise_geral": "💡 Análise Geral da IA",
+    "tipo_empresa_ideal": "🏢 Perfil de Empresa Ideal",
+    "plano_smart_1_ano": "🎯 Plano SMART (Próximo Ano)",
+    "proximos_passos": "🗺️ Próximos Passos (3 Meses)",
+    "sugestao_cargos_similares": "🤔 Cargos Similares Sugeridos",
+    "recomendacoes_focadas": "⭐ Recomendações Focadas",
+    "plano_de_acao_ia": "🗺️ Plano de Ação Detalhado (Sugerido pela IA)",
+}
+
+def render_partial_section(title, value):
+    """Exibição simplificada de uma seção durante a análise (a versão completa aparece ao final)."""
+    with st.expander(title, expanded=True):
+        if isinstance(value, str):
+            st.write(value)
+        elif isinstance(value, list) and all(isinstance(item, str) for item in value):
+            for item in value:
+                st.markdown(f"- {item}")
+        else:
+            st.json(value)
+
+def get_client_ip():
+    """IP de quem acessa (usado no limite de tentativas de login), ou None se indisponível."""
+    context = getattr(st, "context", None)
+    ip = getattr(context, "ip_address", None)
+    if ip:
+        return ip
+    headers = getattr(context, "headers", None) or {}
+    forwarded = headers.get("X-Forwarded-For")
+    return forwarded.split(",")[0].strip() if forwarded else None
+
+# --- PAINEL DE DESEMPENHO (ADMIN) ---
+# Usuários que veem o painel de desempenho, separados por vírgula.
+ADMIN_USERS = [email.strip() for email in os.environ.get("PDI_ADMIN_USERS", "daniel.castroh7@gmail.com").split(",") if email.strip()]
+
+def render_performance_panel(pdi_data):
+    """p50/p95 recentes de cada etapa neste servidor e o detalhamento da última análise do usuário."""
+    st.header("⏱️ Desempenho")
+    summary = recent_timings.summary()
+    if summary:
+        st.markdown("**Etapas recentes (todas as análises deste servidor)**")
+        st.dataframe(
+            [{"Etapa": step, "Medições": v["n"], "p50 (s)": v["p50_s"], "p95 (s)": v["p95_s"], "Máx. (s)": v["max_s"]}
+             for step, v in summary.items()],
+            use_container_width=True,
+            hide_index=True,
+        )
+    else:
+        st.info("Nenhuma etapa medida desde o início do servidor.")
+
+    last = pdi_data.get("analysis_timings")
+    if last:
+        st.markdown(f"**Sua última análise** ({last.get('recorded_at', '')})")
+        st.dataframe(
+            [{"Etapa": s["step"], "Início (s)": s["start_s"], "Duração (s)": s["duration_s"]} for s in last.get("spans", [])],
+            use_container_width=True,
+            hide_index=True,
+        )
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.markdown("**Fila de análises**")
+        st.json(get_job_manager().stats())
+    with col2:
+        st.markdown("**Cache de documentos**")
+        st.json(get_user_cache_stats())
+    with col3:
+        st.markdown("**Cliente Firestore**")
+        st.json(get_db_stats())
+    outbox = get_email_outbox()
+    if outbox is not None:
+        st.markdown("**Caixa de saída de e-mails**")
+        st.json(outbox.stats())
+
 # --- FUNÇÃO PRINCIPAL DO APP ---
 def main():
     st.set_page_config(page_title="PDI Agente", layout="wide", initial_sidebar_state="auto")
+    provision_browser_once()
+    warm_up_firestore_once()
+    start_email_outbox_once()
 
     st.markdown("""
         <style>
@@ -416,9 +667,9 @@ def main():
     # --- INICIALIZAÇÃO DO ESTADO DA SESSÃO ---
     if 'logged_in_user' not in st.session_state: st.session_state.logged_in_user = None
     if 'page' not in st.session_state: st.session_state.page = "Login"
-    if 'analysis_process' not in st.session_state: st.session_state.analysis_process = None
-    if 'q_from_process' not in st.session_state: st.session_state.q_from_process = None
+    if 'analysis_job_id' not in st.session_state: st.session_state.analysis_job_id = None
     if 'last_status' not in st.session_state: st.session_state.last_status = None
+    if 'analysis_slot' not in st.session_state: st.session_state.analysis_slot = None
 
     # --- LÓGICA DE AUTENTICAÇÃO ---
     if not st.session_state.logged_in_user:
@@ -443,11 +694,12 @@ def main():
                     email = st.text_input("E-mail")
                     password = st.text_input("Senha", type="password")
                     if st.form_submit_button("Entrar"):
-                        if login_user(email, password):
+                        success, message = login_user(email, password, client_ip=get_client_ip())
+                        if success:
                             st.session_state.logged_in_user = email
                             st.rerun()
                         else:
-                            st.error("E-mail ou senha inválidos.")
+                            st.error(message)
             
             with register_tab:
                 #st.subheader("Criar Nova Conta")
@@ -456,10 +708,15 @@ def main():
                     email = st.text_input("E-mail para login")
                     password = st.text_input("Crie uma senha", type="password")
                     if st.form_submit_button("Registrar"):
-                        if register_user(email, password, name):
-                            st.success("Usuário registrado com sucesso! Faça o login para continuar.")
+                        try:
+                            registered = register_user(email, password, name)
+                        except HashingBusy as e:
+                            st.error(str(e))
                         else:
-                            st.error("Este e-mail já está em uso.")
+                            if registered:
+                                st.success("Usuário registrado com sucesso! Faça o login para continuar.")
+                            else:
+                                st.error("Este e-mail já está em uso.")
 
             with forgot_tab:
                 #st.subheader("Recuperar Senha")
@@ -499,11 +756,12 @@ def main():
 
         st.info(f"**Usuário:** {user_email}")
 
+        is_admin = user_email in ADMIN_USERS
         page = option_menu(
             menu_title=None,
             #menu_title="Menu Principal", # Título do menu
-            options=["Meu Perfil", "Plano de Carreira", "Meu Diagnóstico"], # Opções
-            icons=["person-circle", "rocket-takeoff", "clipboard-data-fill"], # Ícones do Bootstrap
+            options=["Meu Perfil", "Plano de Carreira", "Meu Diagnóstico"] + (["Desempenho"] if is_admin else []), # Opções
+            icons=["person-circle", "rocket-takeoff", "clipboard-data-fill"] + (["speedometer2"] if is_admin else []), # Ícones do Bootstrap
             menu_icon="cast", # Ícone do menu
             default_index=0, # Item que começa selecionado
             #orientation="horizontal",
@@ -517,6 +775,7 @@ def main():
 
     if st.sidebar.button("Logout"):
         st.session_state.logged_in_user = None
+        st.session_state.pdi_data_cache = {}
         st.rerun()
 
     st.title("👨‍🚀 PDI Agente")
@@ -633,22 +892,22 @@ def main():
         
         # Função para iniciar a análise (evita repetição de código)
         def start_analysis():
-            # Registra o novo timestamp de uso ANTES de iniciar
-            new_timestamp = datetime.now().isoformat()
-            analysis_timestamps_str.append(new_timestamp)
-            pdi_data.setdefault("usage_tracking", {})["analysis_timestamps"] = analysis_timestamps_str
-            save_pdi_data(user_email, pdi_data)
-
-            # Inicia o processo de análise
-            q = multiprocessing.Manager().Queue()
-            proc = multiprocessing.Process(target=run_full_analysis_process, args=(q, user_email), daemon=True)
-            st.session_state.q_from_process = q
-            st.session_state.analysis_process = proc
-            proc.start()
+            # Registra o novo timestamp de uso ANTES de iniciar. A cota é conferida de novo
+            # no Firestore, em transação: os dados desta página podem estar desatualizados.
+            reserved, result = reserve_analysis_slot(user_email, max_recent=2, window_days=30, bypass_limit=is_power_user)
+            invalidate_pdi_data(user_email)
+            if not reserved:
+                st.warning(result)
+                return
+            st.session_state.analysis_slot = result
+
+            # Enfileira a análise no pool de processos do servidor
+            st.session_state.analysis_job_id = get_job_manager().submit(user_email)
+            st.session_state.last_status = None
             st.rerun()
 
         # Verifica se um processo já está rodando (lógica anterior mantida)
-        if st.session_state.analysis_process is None:
+        if st.session_state.analysis_job_id is None:
             
             if not limit_reached or is_power_user:
                 # Se o limite NÃO foi atingido OU se é um power user
@@ -689,40 +948,25 @@ def main():
         
         # --- FIM DA LÓGICA DE LIMITE DE ANÁLISE ---
 
-        if st.session_state.analysis_process is not None:
-            status_placeholder = st.empty()
-            try:
-                msg = st.session_state.q_from_process.get_nowait()
-                st.session_state.last_status = msg
-                if isinstance(msg, dict):
-                    if msg.get("status") == "complete":
-                        st.success("Análise concluída!")
-                        st.balloons()
-                        # A linha abaixo já salva o pdi_data, que agora contém o novo timestamp
-                        save_pdi_data(user_email, msg.get("data"))
-                        st.session_state.analysis_process = None
-                        st.rerun()
-                    elif msg.get("status") == "error":
-                        st.error(f"Erro: {msg.get('message')}")
-                        st.session_state.analysis_process = None
-                        st.rerun()
-            except (queue.Empty, EOFError): pass
-            if st.session_state.last_status and isinstance(st.session_state.last_status, dict):
-                if st.session_state.last_status.get("status") == "info":
-                    status_placeholder.info(st.session_state.last_status.get("message"))
-            if st.session_state.analysis_process and st.session_state.analysis_process.is_alive():
-                time.sleep(1)
-                st.rerun()
+        if st.session_state.analysis_job_id is not None:
+            render_analysis_status(user_email)
 
         if "ai_analysis" in pdi_data and pdi_data["ai_analysis"]:
             analysis = pdi_data["ai_analysis"]
             
-            st.download_button(
-                label="📥 Baixar Diagnóstico em PDF",
-                data=generate_pdi_pdf(pdi_data),
-                file_name=f"PDI_Diagnostico_{user_email.split('@')[0]}.pdf",
-                mime="application/pdf"
-            )
+            # O PDF só é montado quando o usuário pede, e fica em cache para os próximos reruns.
+            pdf_key = pdf_cache_key(pdi_data)
+            requested_pdfs = st.session_state.setdefault("requested_pdfs", set())
+            if pdf_key not in requested_pdfs:
+                if st.button("📄 Gerar Diagnóstico em PDF"):
+                    requested_pdfs.add(pdf_key)
+            if pdf_key in requested_pdfs:
+                st.download_button(
+                    label="📥 Baixar Diagnóstico em PDF",
+                    data=get_pdi_pdf_bytes(pdf_key, pdi_data),
+                    file_name=f"PDI_Diagnostico_{user_email.split('@')[0]}.pdf",
+                    mime="application/pdf"
+                )
 
             st.markdown("---")
             st.subheader("💡 Análise Geral da IA")
@@ -889,9 +1133,12 @@ def main():
                     for item in plano_ia.get("10_anos", ["N/A"]):
                         st.checkbox(item, key=f"10_anos_{item}")
         
-        elif st.session_state.analysis_process is None:
+        elif st.session_state.analysis_job_id is None:
             st.info("Nenhuma análise foi realizada ainda.")
 
+    elif page == "Desempenho" and is_admin:
+        render_performance_panel(pdi_data)
+
 if __name__ == "__main__":
     multiprocessing.freeze_support()
     main()
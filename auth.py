@@ -1,16 +1,22 @@
 # auth.py
-import bcrypt
+import os
 import json
+import time
+import hashlib
 import secrets
+import threading
 import datetime
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import sqlite3
 import streamlit as st
 
 # Importações do Firebase
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.api_core.exceptions import NotFound
+
+from timing import span
+from password_hashing import get_password_hasher, login_throttle, HashingBusy
+from email_outbox import EmailOutbox, SMTPSettings
 
 # Tenta importar as credenciais de e-mail do config.py para desenvolvimento local
 try:
@@ -45,6 +51,7 @@ def init_firebase():
             }
             cred = credentials.Certificate(creds_dict)
             firebase_admin.initialize_app(cred)
+            _count_db_stat("firebase_inits")
             print("Firebase inicializado com sucesso via Streamlit Secrets [firebase].")
         except KeyError:
             st.error("As credenciais do Firebase não estão configuradas no formato [firebase] no Streamlit Secrets.")
@@ -52,50 +59,150 @@ def init_firebase():
     return True
 
 
+# Tokens de redefinição de senha: um documento por token, com o hash do token como ID.
+RESET_TOKENS_COLLECTION = os.environ.get("PDI_RESET_TOKENS_COLLECTION", "pdi_reset_tokens")
+RESET_TOKEN_TTL_HOURS = int(os.environ.get("PDI_RESET_TOKEN_TTL_HOURS", "1"))
+
+
+# --- CLIENTE FIRESTORE DO PROCESSO ---
+# Um único cliente por processo, criado na primeira chamada a get_db(). Os canais gRPC do
+# cliente não sobrevivem a um fork, então um processo filho (ex.: os workers de análise)
+# descarta o cliente herdado e cria o seu próprio.
+_db_lock = threading.Lock()
+_db_client = None
+_db_client_pid = None
+_db_stats_lock = threading.Lock()
+_db_stats = {"get_db_calls": 0, "firebase_inits": 0, "clients_created": 0, "fork_resets": 0, "warmups": 0}
+
+
+def _count_db_stat(name, amount=1):
+    with _db_stats_lock:
+        _db_stats[name] = _db_stats.get(name, 0) + amount
+
+
+def _reset_db_after_fork():
+    global _db_lock, _db_stats_lock, _db_client, _db_client_pid
+    # Os locks podem ter sido copiados travados por outra thread do processo pai.
+    _db_lock = threading.Lock()
+    _db_stats_lock = threading.Lock()
+    if _db_client is not None:
+        _count_db_stat("fork_resets")
+    _db_client = None
+    _db_client_pid = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_db_after_fork)
+
+
+def _create_db_client():
+    """Cria um cliente novo com as credenciais do app Firebase (sem o cliente em cache do firebase_admin)."""
+    app = firebase_admin.get_app()
+    client = firestore.Client(project=app.project_id, credentials=app.credential.get_credential())
+    _count_db_stat("clients_created")
+    return client
+
+
 def get_db():
-    """Retorna uma instância do cliente Firestore."""
-    if not init_firebase():
+    """Retorna o cliente Firestore do processo, criando-o (e inicializando o Firebase) só na primeira vez."""
+    global _db_client, _db_client_pid
+    _count_db_stat("get_db_calls")
+    client = _db_client
+    if client is not None and _db_client_pid == os.getpid():
+        return client
+    with _db_lock:
+        if _db_client is None or _db_client_pid != os.getpid():
+            if not init_firebase():
+                return None
+            _db_client = _create_db_client()
+            _db_client_pid = os.getpid()
+        return _db_client
+
+
+def warm_up_db():
+    """Cria o cliente e abre a conexão com uma leitura mínima, para o primeiro login não pagar esse custo."""
+    start = time.perf_counter()
+    db = get_db()
+    if db is None:
         return None
-    return firestore.client()
+    try:
+        db.collection('pdi_users').limit(1).get()
+    except Exception as e:
+        print(f"AVISO: Falha no aquecimento da conexão com o Firestore: {e}")
+    _count_db_stat("warmups")
+    elapsed = time.perf_counter() - start
+    print(f"Conexão com o Firestore aquecida em {elapsed:.2f}s.")
+    return elapsed
+
+
+def get_db_stats():
+    """Contadores do cliente Firestore deste processo (clients_created deve ficar em 1)."""
+    with _db_stats_lock:
+        stats = dict(_db_stats)
+    stats["pid"] = os.getpid()
+    stats["client_ready"] = _db_client is not None and _db_client_pid == os.getpid()
+    return stats
 
 
 # --- FUNÇÕES DE AUTENTICAÇÃO ---
 def hash_password(password: str) -> str:
-    """Gera um hash seguro para a senha usando bcrypt."""
-    salt = bcrypt.gensalt()
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
-    return hashed_password.decode('utf-8')
+    """Gera um hash seguro para a senha usando bcrypt (no pool de password_hashing.py)."""
+    return get_password_hasher().hash(password)
 
 
 def check_password(password: str, hashed_password: str) -> bool:
     """Verifica se a senha fornecida corresponde ao hash armazenado."""
-    return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+    return get_password_hasher().verify(password, hashed_password)
 
 
-def send_reset_email(recipient_email: str, token: str):
-    """
-    Envia um e-mail de redefinição de senha usando o SMTP do Outlook.
-    Usa st.secrets em produção ou config.py em desenvolvimento.
-    """
-    smtp_server = "smtp.office365.com"
-    smtp_port = 587
-    
+def get_smtp_settings():
+    """Servidor e credenciais do SMTP. Usa st.secrets em produção ou config.py em desenvolvimento."""
     try:
         sender_email = st.secrets["email_sender"]
         password = st.secrets["email_password"]
     except (AttributeError, KeyError, FileNotFoundError):
         sender_email = EMAIL_SENDER
         password = EMAIL_PASSWORD
+    sender_email = sender_email or os.environ.get("PDI_EMAIL_SENDER")
+    if not sender_email:
+        return None
+    return SMTPSettings(
+        host=os.environ.get("PDI_SMTP_HOST", "smtp.office365.com"),
+        port=int(os.environ.get("PDI_SMTP_PORT", "587")),
+        sender=sender_email,
+        username=sender_email,
+        password=password,
+        starttls=os.environ.get("PDI_SMTP_STARTTLS", "1") == "1",
+    )
+
 
-    if not sender_email or not password:
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_email_outbox():
+    """Caixa de saída do processo, com a thread de envio já iniciada (None sem credenciais de e-mail)."""
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            settings = get_smtp_settings()
+            if settings is None:
+                return None
+            _outbox = EmailOutbox(settings).start()
+        return _outbox
+
+
+def send_reset_email(recipient_email: str, token: str):
+    """
+    Coloca o e-mail de redefinição de senha na caixa de saída (email_outbox.py).
+    O envio acontece em segundo plano; o clique do usuário não espera pelo SMTP.
+    """
+    outbox = get_email_outbox()
+    if outbox is None:
         print("ERRO: Credenciais de e-mail não configuradas em st.secrets ou config.py")
         return False
 
-    message = MIMEMultipart("alternative")
-    message["Subject"] = "PDI Agente - Redefinição de Senha"
-    message["From"] = sender_email
-    message["To"] = recipient_email
-
+    subject = "PDI Agente - Redefinição de Senha"
     text = f"""
     Olá,
     Você solicitou a redefinição de sua senha na plataforma PDI Agente.
@@ -119,21 +226,13 @@ def send_reset_email(recipient_email: str, token: str):
     </html>
     """
 
-    part1 = MIMEText(text, "plain")
-    part2 = MIMEText(html, "html")
-    message.attach(part1)
-    message.attach(part2)
-
     try:
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(sender_email, password)
-            server.sendmail(sender_email, recipient_email, message.as_string())
-        print(f"E-mail de redefinição enviado com sucesso para {recipient_email}")
-        return True
-    except Exception as e:
-        print(f"Falha ao enviar e-mail: {e}")
+        message_id = outbox.enqueue(recipient_email, subject, text, html)
+    except sqlite3.Error as e:
+        print(f"Falha ao enfileirar e-mail: {e}")
         return False
+    print(f"E-mail de redefinição para {recipient_email} enfileirado (id {message_id}).")
+    return True
 
 
 def register_user(email: str, password: str, name: str) -> bool:
@@ -174,27 +273,68 @@ def register_user(email: str, password: str, name: str) -> bool:
     return True
 
 
-def login_user(email: str, password: str) -> bool:
-    """Autentica um usuário com base nos dados do Firestore."""
+def login_user(email: str, password: str, client_ip: str = None) -> tuple[bool, str]:
+    """
+    Autentica um usuário com base nos dados do Firestore.
+    Contas ou IPs com falhas demais na janela recente são recusados antes de qualquer bcrypt.
+    Se o hash salvo usa um custo diferente do configurado, ele é refeito com a senha correta.
+    """
+    invalid = "E-mail ou senha inválidos."
+    retry_after = login_throttle.retry_after(email, client_ip)
+    if retry_after > 0:
+        return False, f"Muitas tentativas de login. Tente novamente em {int(retry_after // 60) + 1} minuto(s)."
+
     db = get_db()
     if db is None:
-        return False
+        return False, "Conexão com o banco de dados falhou."
     user_ref = db.collection('pdi_users').document(email)
     doc = user_ref.get()
 
-    if not doc.exists:
-        return False
-
-    data = doc.to_dict()
-    hashed_pw = data.get("security", {}).get("password_hash")
+    hashed_pw = doc.to_dict().get("security", {}).get("password_hash") if doc.exists else None
     if not hashed_pw:
-        return False
+        login_throttle.record_failure(email, client_ip)
+        return False, invalid
+
+    hasher = get_password_hasher()
+    try:
+        if not hasher.verify(password, hashed_pw):
+            login_throttle.record_failure(email, client_ip)
+            return False, invalid
+    except HashingBusy as e:
+        return False, str(e)
+
+    login_throttle.record_success(email)
+    if hasher.needs_rehash(hashed_pw):
+        try:
+            user_ref.update({'security.password_hash': hasher.hash(password)})
+        except Exception as e:
+            print(f"AVISO: Falha ao atualizar o hash da senha de {email}: {e}")
+    return True, ""
+
 
-    return check_password(password, hashed_pw)
+def reset_token_id(token: str) -> str:
+    """ID do documento do token: o SHA-256 do token (o token em si nunca é gravado)."""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def purge_expired_reset_tokens(limit: int = 50) -> int:
+    """
+    Remove tokens vencidos. Uma política de TTL do Firestore no campo "expires_at" faz o
+    mesmo automaticamente; esta limpeza cobre ambientes sem a política configurada.
+    """
+    db = get_db()
+    if db is None:
+        return 0
+    now = datetime.datetime.now(datetime.timezone.utc)
+    removed = 0
+    for doc in db.collection(RESET_TOKENS_COLLECTION).where('expires_at', '<', now).limit(limit).stream():
+        doc.reference.delete()
+        removed += 1
+    return removed
 
 
 def set_password_reset_token(email: str) -> bool:
-    """Gera um token, armazena no Firestore e envia por e-mail."""
+    """Gera um token, registra seu hash na coleção de tokens e envia o token por e-mail."""
     db = get_db()
     if db is None:
         return False
@@ -205,39 +345,90 @@ def set_password_reset_token(email: str) -> bool:
         return False
 
     token = secrets.token_urlsafe(20)
-    expiry_time = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
-    
-    user_ref.update({
-        'security.reset_token': token,
-        'security.reset_token_expiry': expiry_time.isoformat()
+    token_id = reset_token_id(token)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    tokens_ref = db.collection(RESET_TOKENS_COLLECTION)
+
+    batch = db.batch()
+    # Só o token mais recente de cada usuário vale: o anterior é removido.
+    previous_id = (doc.to_dict().get("security") or {}).get("reset_token_id")
+    if previous_id:
+        batch.delete(tokens_ref.document(previous_id))
+    batch.set(tokens_ref.document(token_id), {
+        'user_ref': user_ref,
+        'created_at': now,
+        'expires_at': now + datetime.timedelta(hours=RESET_TOKEN_TTL_HOURS),
     })
-    
+    batch.update(user_ref, {
+        'security.reset_token_id': token_id,
+        # Campos do formato antigo (token em texto puro no documento do usuário).
+        'security.reset_token': firestore.DELETE_FIELD,
+        'security.reset_token_expiry': firestore.DELETE_FIELD,
+    })
+    batch.commit()
+
+    try:
+        purge_expired_reset_tokens()
+    except Exception as e:
+        print(f"AVISO: Falha na limpeza dos tokens vencidos: {e}")
+
     return send_reset_email(email, token)
 
 
 def reset_password_with_token(token: str, new_password: str) -> tuple[bool, str]:
-    """Redefine a senha de um usuário no Firestore se o token for válido."""
+    """
+    Redefine a senha de um usuário se o token for válido: uma leitura pela chave do token,
+    o hash da nova senha e uma transação que confere o token de novo, troca a senha e
+    consome o token (que não pode ser usado duas vezes).
+    """
     db = get_db()
     if db is None:
         return False, "Conexão com o banco de dados falhou."
-    users_ref = db.collection('pdi_users').where('security.reset_token', '==', token).limit(1)
-    docs = users_ref.stream()
-    
-    user_doc = next(docs, None)
-    if not user_doc:
+    if not token:
         return False, "Token inválido."
 
-    data = user_doc.to_dict()
-    expiry_time = datetime.datetime.fromisoformat(data['security']['reset_token_expiry'])
-    if datetime.datetime.now(datetime.timezone.utc) > expiry_time:
-        return False, "Token expirado. Por favor, solicite um novo."
+    token_ref = db.collection(RESET_TOKENS_COLLECTION).document(reset_token_id(token.strip()))
 
-    user_doc.reference.update({
-        'security.password_hash': hash_password(new_password),
-        'security.reset_token': None,
-        'security.reset_token_expiry': None
-    })
-    return True, "Senha redefinida com sucesso! Você já pode fazer o login."
+    def token_error(snapshot):
+        """Mensagem de erro se o token não existe ou venceu; None se ele é válido."""
+        if not snapshot.exists:
+            return "Token inválido."
+        if datetime.datetime.now(datetime.timezone.utc) > snapshot.to_dict()['expires_at']:
+            return "Token expirado. Por favor, solicite um novo."
+        return None
+
+    # O token é conferido antes do bcrypt: tokens inválidos ou vencidos não custam CPU.
+    snapshot = token_ref.get()
+    error = token_error(snapshot)
+    if error:
+        if snapshot.exists:
+            token_ref.delete()
+        return False, error
+
+    # O bcrypt roda fora da transação, que pode ser repetida pelo Firestore.
+    try:
+        new_hash = hash_password(new_password)
+    except HashingBusy as e:
+        return False, str(e)
+
+    @firestore.transactional
+    def redeem(transaction):
+        # O token pode ter sido usado ou ter vencido enquanto o hash era calculado.
+        snapshot = token_ref.get(transaction=transaction)
+        error = token_error(snapshot)
+        if error:
+            if snapshot.exists:
+                transaction.delete(token_ref)
+            return False, error
+        data = snapshot.to_dict()
+        transaction.update(data['user_ref'], {
+            'security.password_hash': new_hash,
+            'security.reset_token_id': firestore.DELETE_FIELD,
+        })
+        transaction.delete(token_ref)
+        return True, "Senha redefinida com sucesso! Você já pode fazer o login."
+
+    return redeem(db.transaction())
 
 
 # --- FUNÇÕES DE DADOS DO PDI ---
@@ -247,16 +438,114 @@ def load_pdi_data_from_firestore(email: str):
     if db is None:
         return {"profile": {}, "pdi_plan": {"metas_temporais": {}}}
     user_ref = db.collection('pdi_users').document(email)
-    doc = user_ref.get()
+    with span("firestore_load"):
+        doc = user_ref.get()
     if doc.exists:
         return doc.to_dict()
     return {"profile": {}, "pdi_plan": {"metas_temporais": {}}}
 
 
-def save_pdi_data_to_firestore(email: str, data: dict):
-    """Salva/Atualiza os dados de um usuário no Firestore."""
+def diff_field_paths(old: dict, new: dict, prefix: tuple = ()) -> dict:
+    """
+    Compara dois documentos e retorna {caminho_do_campo: novo_valor} apenas para o que mudou.
+    Dicionários são comparados recursivamente; listas e valores simples são substituídos inteiros.
+    Campos removidos recebem firestore.DELETE_FIELD.
+    """
+    changes = {}
+    for key, new_value in new.items():
+        path = prefix + (key,)
+        old_value = old.get(key) if isinstance(old, dict) else None
+        if isinstance(new_value, dict) and isinstance(old_value, dict) and new_value and old_value:
+            changes.update(diff_field_paths(old_value, new_value, path))
+        elif key not in old or old_value != new_value:
+            changes[firestore.FieldPath(*path).to_api_repr()] = new_value
+    for key in old:
+        if key not in new:
+            changes[firestore.FieldPath(*(prefix + (key,))).to_api_repr()] = firestore.DELETE_FIELD
+    return changes
+
+
+def save_pdi_data_to_firestore(email: str, data: dict, snapshot: dict = None):
+    """
+    Salva/Atualiza os dados de um usuário no Firestore.
+    Se `snapshot` (a última versão lida do documento) for informado, envia apenas os campos
+    alterados via update(); se nada mudou, nenhuma escrita é feita.
+    """
+    db = get_db()
+    if db is None:
+        return
+    user_ref = db.collection('pdi_users').document(email)
+    if snapshot:
+        changes = diff_field_paths(snapshot, data)
+        if not changes:
+            return
+        try:
+            with span("firestore_save"):
+                user_ref.update(changes)
+            return
+        except NotFound:
+            pass  # Documento ainda não existe: cai no set() completo abaixo.
+    with span("firestore_save"):
+        user_ref.set(data, merge=True)
+
+
+def save_analysis_result(email: str, pdi_data: dict):
+    """
+    Grava apenas o resultado de uma análise (seções da IA, texto do LinkedIn e tempos).
+    O restante do documento que o processo de análise leu pode estar desatualizado e não é
+    reescrito, para não desfazer edições ou registros de uso feitos enquanto a análise rodava.
+    """
+    db = get_db()
+    if db is None:
+        return
+    fields = {
+        'ai_analysis': pdi_data.get('ai_analysis', {}),
+        'profile.full_linkedin_text': pdi_data.get('profile', {}).get('full_linkedin_text', ''),
+    }
+    if 'analysis_timings' in pdi_data:
+        fields['analysis_timings'] = pdi_data['analysis_timings']
+    user_ref = db.collection('pdi_users').document(email)
+    with span("firestore_save"):
+        user_ref.update(fields)
+
+
+# --- CONTROLE DE USO DAS ANÁLISES ---
+def reserve_analysis_slot(email: str, max_recent: int, window_days: int, bypass_limit: bool = False) -> tuple[bool, str]:
+    """
+    Registra o início de uma análise se o usuário ainda tiver cota na janela de `window_days` dias.
+    A leitura dos registros e a escrita do novo ficam na mesma transação, então uma aba com
+    dados antigos (ou duas abas ao mesmo tempo) não passa do limite nem apaga registros.
+    Retorna (True, timestamp registrado) ou (False, mensagem de erro).
+    """
     db = get_db()
     if db is None:
+        return False, "Conexão com o banco de dados falhou."
+    user_ref = db.collection('pdi_users').document(email)
+
+    @firestore.transactional
+    def reserve(transaction):
+        snapshot = user_ref.get(transaction=transaction)
+        data = snapshot.to_dict() if snapshot.exists else {}
+        timestamps = data.get('usage_tracking', {}).get('analysis_timestamps', [])
+        now = datetime.datetime.now()
+        window_start = now - datetime.timedelta(days=window_days)
+        recent = [ts for ts in timestamps if datetime.datetime.fromisoformat(ts) > window_start]
+        if len(recent) >= max_recent and not bypass_limit:
+            return False, f"Você atingiu o seu limite de {max_recent} análises por mês."
+        new_timestamp = now.isoformat()
+        transaction.set(user_ref, {'usage_tracking': {'analysis_timestamps': timestamps + [new_timestamp]}}, merge=True)
+        return True, new_timestamp
+
+    return reserve(db.transaction())
+
+
+def release_analysis_slot(email: str, timestamp: str):
+    """Devolve a cota reservada por reserve_analysis_slot quando a análise não chegou a um resultado."""
+    db = get_db()
+    if db is None or not timestamp:
         return
     user_ref = db.collection('pdi_users').document(email)
-    user_ref.set(data, merge=True)
+    try:
+        user_ref.update({'usage_tracking.analysis_timestamps': firestore.ArrayRemove([timestamp])})
+    except NotFound:
+        pass
@@ -0,0 +1,281 @@
+# batch_runner.py
+"""
+Geração de diagnósticos em lote, fora da interface.
+
+Roda o mesmo pipeline do botão "Gerar Diagnóstico" (pdi_analyzer.run_full_analysis_process)
+para uma lista de usuários da coleção pdi_users, usando o pool de processos de
+analysis_jobs.py. Cada execução grava o progresso em um arquivo de checkpoint novo
+(JSON Lines, em data_pdi/batch/); com --retomar, uma execução interrompida continua
+a partir do seu checkpoint e os usuários já concluídos são pulados.
+
+Uso:
+    python batch_runner.py --emails ana@empresa.com,joao@empresa.com
+    python batch_runner.py --arquivo emails.txt --workers 4 --por-minuto 20
+    python batch_runner.py --export pdi_users.json --retomar data_pdi/batch/lote_20240601-101500.jsonl
+    python batch_runner.py --todos --sem-salvar
+"""
+import os
+import json
+import time
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime
+from collections import Counter
+
+from analysis_jobs import AnalysisJobManager, TERMINAL_STATUSES
+from pdi_analyzer import SECTIONS, is_valid_section
+from timing import percentile
+
+BATCH_WORKERS = int(os.environ.get("PDI_BATCH_WORKERS", "4"))
+# Máximo de análises iniciadas por minuto, somando todos os processos (0 = sem limite).
+BATCH_ANALYSES_PER_MINUTE = float(os.environ.get("PDI_BATCH_ANALYSES_PER_MINUTE", "30"))
+BATCH_CHECKPOINT_DIR = Path(os.environ.get("PDI_BATCH_CHECKPOINT_DIR", "data_pdi/batch"))
+POLL_INTERVAL = 0.5
+
+
+class StartRateLimiter:
+    """Espaça o início das análises para respeitar um limite global por minuto."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute and per_minute > 0 else 0.0
+        self.next_start = 0.0
+
+    def wait(self):
+        now = time.monotonic()
+        if self.next_start > now:
+            time.sleep(self.next_start - now)
+            now = self.next_start
+        self.next_start = now + self.interval
+
+
+class Checkpoint:
+    """Resultado por usuário em um arquivo JSON Lines; a última linha de cada email prevalece."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def load(self) -> dict:
+        results = {}
+        if not self.path.exists():
+            return results
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Linha cortada por uma interrupção no meio da escrita.
+                results[entry["email"]] = entry
+        return results
+
+    @classmethod
+    def new(cls, directory=BATCH_CHECKPOINT_DIR):
+        """Checkpoint de uma execução nova: um arquivo próprio, nunca o de uma execução anterior."""
+        path = Path(directory) / f"lote_{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}.jsonl"
+        return cls(path)
+
+    def record(self, entry):
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def emails_from_export(path) -> list:
+    """Lê os emails de uma exportação JSON de pdi_users (dicionário email -> documento ou lista de documentos)."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        return list(data.keys())
+    emails = []
+    for item in data:
+        if isinstance(item, str):
+            emails.append(item)
+        elif isinstance(item, dict):
+            email = item.get("email") or item.get("id") or item.get("profile", {}).get("email")
+            if email:
+                emails.append(email)
+    return emails
+
+
+def emails_from_firestore() -> list:
+    """Lista os IDs (emails) de todos os documentos de pdi_users, sem baixar os dados."""
+    from auth import get_db
+    db = get_db()
+    if db is None:
+        raise RuntimeError("Firestore indisponível.")
+    return [doc.id for doc in db.collection('pdi_users').select([]).stream()]
+
+
+def invalid_sections(pdi_data) -> list:
+    """Seções ausentes ou inválidas no resultado; um diagnóstico com alguma delas não é salvo."""
+    ai_analysis = pdi_data.get("ai_analysis") or {}
+    return [key for key, _, _ in SECTIONS if not is_valid_section(key, ai_analysis.get(key))]
+
+
+def save_analysis(email, pdi_data):
+    """Grava apenas o resultado da análise, sem sobrescrever edições feitas pelo usuário durante o lote."""
+    from auth import save_analysis_result
+    save_analysis_result(email, pdi_data)
+
+
+def run_batch(emails, workers=BATCH_WORKERS, per_minute=BATCH_ANALYSES_PER_MINUTE,
+              checkpoint=None, save=True, retry_failed=True, manager=None, on_result=None):
+    """
+    Executa o diagnóstico de cada email e retorna o resumo da execução.
+    Sem `checkpoint`, a execução usa um checkpoint novo. Ao retomar um checkpoint, os emails
+    já concluídos nele são pulados; os que falharam são refeitos se `retry_failed`.
+    """
+    checkpoint = checkpoint or Checkpoint.new()
+    done = checkpoint.load()
+    pending = []
+    skipped = 0
+    for email in dict.fromkeys(e.strip() for e in emails if e and e.strip()):
+        previous = done.get(email)
+        if previous and (previous["status"] == "ok" or not retry_failed):
+            skipped += 1
+            continue
+        pending.append(email)
+
+    own_manager = manager is None
+    manager = manager or AnalysisJobManager(max_workers=workers)
+    limiter = StartRateLimiter(per_minute)
+    # Poucos jobs à frente dos processos livres: o limite de início vale de fato e,
+    # numa interrupção, nada além disso fica perdido na fila.
+    max_in_flight = manager.max_workers + 1
+    in_flight = {}  # job_id -> email
+    results = []
+    started = time.monotonic()
+
+    try:
+        queue_index = 0
+        while queue_index < len(pending) or in_flight:
+            while queue_index < len(pending) and len(in_flight) < max_in_flight:
+                limiter.wait()
+                email = pending[queue_index]
+                queue_index += 1
+                in_flight[manager.submit(email)] = email
+
+            time.sleep(POLL_INTERVAL)
+            for job_id, email in list(in_flight.items()):
+                job = manager.status(job_id)
+                if job is not None and job["status"] not in TERMINAL_STATUSES:
+                    continue
+                del in_flight[job_id]
+                manager.forget(job_id)
+                entry = {"email": email, "status": "error", "finished_at": time.time()}
+                last = (job or {}).get("last") or {}
+                if job is None:
+                    entry["message"] = "O job foi descartado antes de terminar."
+                elif job["status"] == "complete":
+                    data = last.get("data") or {}
+                    invalid = invalid_sections(data)
+                    if invalid:
+                        entry["message"] = f"Seções inválidas: {', '.join(invalid)}"
+                    else:
+                        try:
+                            if save:
+                                save_analysis(email, data)
+                            entry["status"] = "ok"
+                        except Exception as e:
+                            entry["message"] = f"Falha ao salvar: {e}"
+                else:
+                    entry["message"] = last.get("message", "Erro desconhecido.")
+                if job and job["started_at"] and job["finished_at"]:
+                    entry["elapsed_s"] = round(job["finished_at"] - job["started_at"], 3)
+                metrics = (job or {}).get("metrics") or {}
+                entry["gemini_calls"] = metrics.get("calls", 0)
+                entry["gemini_retries"] = metrics.get("retries", 0)
+                checkpoint.record(entry)
+                results.append(entry)
+                if on_result:
+                    on_result(entry)
+    finally:
+        if own_manager:
+            manager.shutdown()
+
+    return summarize(results, skipped, time.monotonic() - started)
+
+
+def summarize(results, skipped, wall_s) -> dict:
+    ok = [r for r in results if r["status"] == "ok"]
+    failed = [r for r in results if r["status"] != "ok"]
+    durations = [r["elapsed_s"] for r in ok if "elapsed_s" in r]
+    return {
+        "processed": len(results),
+        "ok": len(ok),
+        "failed": len(failed),
+        "skipped": skipped,
+        "wall_s": round(wall_s, 3),
+        "per_minute": round(len(ok) / wall_s * 60, 2) if wall_s > 0 else 0.0,
+        "analysis_p50_s": percentile(durations, 50),
+        "analysis_p95_s": percentile(durations, 95),
+        "gemini_calls": sum(r.get("gemini_calls", 0) for r in results),
+        "gemini_retries": sum(r.get("gemini_retries", 0) for r in results),
+        "top_errors": Counter(r.get("message") for r in failed).most_common(5),
+        "failed_emails": [r["email"] for r in failed],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera diagnósticos de PDI em lote.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--emails", help="Lista de emails separados por vírgula.")
+    source.add_argument("--arquivo", help="Arquivo texto com um email por linha.")
+    source.add_argument("--export", help="Exportação JSON da coleção pdi_users.")
+    source.add_argument("--todos", action="store_true", help="Todos os documentos de pdi_users no Firestore.")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="Análises simultâneas.")
+    parser.add_argument("--por-minuto", type=float, default=BATCH_ANALYSES_PER_MINUTE,
+                        help="Máximo de análises iniciadas por minuto (0 = sem limite).")
+    parser.add_argument("--retomar", metavar="CHECKPOINT",
+                        help="Checkpoint de uma execução anterior a continuar (sem ele, a execução começa do zero).")
+    parser.add_argument("--sem-salvar", action="store_true", help="Não grava os resultados no Firestore.")
+    parser.add_argument("--nao-refazer-falhas", action="store_true", help="Pula também os emails que falharam antes.")
+    parser.add_argument("--json", action="store_true", help="Imprime o resumo em JSON.")
+    args = parser.parse_args()
+
+    if args.emails:
+        emails = args.emails.split(",")
+    elif args.arquivo:
+        emails = Path(args.arquivo).read_text(encoding="utf-8").splitlines()
+    elif args.export:
+        emails = emails_from_export(args.export)
+    else:
+        emails = emails_from_firestore()
+
+    def report(entry):
+        if not args.json:
+            detail = f"{entry.get('elapsed_s', '-')}s" if entry["status"] == "ok" else entry.get("message")
+            print(f"[{entry['status']}] {entry['email']}: {detail}")
+
+    if args.retomar and not Path(args.retomar).exists():
+        parser.error(f"checkpoint não encontrado: {args.retomar}")
+    checkpoint = Checkpoint(args.retomar) if args.retomar else Checkpoint.new()
+    if not args.json:
+        print(f"Checkpoint: {checkpoint.path} (use --retomar {checkpoint.path} para continuar esta execução)")
+
+    summary = run_batch(
+        emails,
+        workers=args.workers,
+        per_minute=args.por_minuto,
+        checkpoint=checkpoint,
+        save=not args.sem_salvar,
+        retry_failed=not args.nao_refazer_falhas,
+        on_result=report,
+    )
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+        return
+    print(f"\nConcluídos: {summary['ok']}  Falhas: {summary['failed']}  Pulados (checkpoint): {summary['skipped']}")
+    print(f"Tempo total: {summary['wall_s']:.1f}s  Vazão: {summary['per_minute']:.1f} diagnósticos/min")
+    if summary["analysis_p50_s"] is not None:
+        print(f"Duração por diagnóstico: p50 {summary['analysis_p50_s']:.1f}s  p95 {summary['analysis_p95_s']:.1f}s")
+    print(f"Chamadas ao Gemini: {summary['gemini_calls']} ({summary['gemini_retries']} novas tentativas)")
+    for message, count in summary["top_errors"]:
+        print(f"  {count}x {message}")
+
+
+if __name__ == "__main__":
+    main()
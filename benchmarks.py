@@ -0,0 +1,715 @@
+# benchmarks.py
+"""
+Benchmarks locais do PDI Agente. Nenhuma chamada real é feita à API do Gemini:
+o modelo é substituído por um falso com latência configurável.
+
+Uso:
+    python benchmarks.py modos --latencia 2.0 --rodadas 3
+    python benchmarks.py pool --analises 10 --workers 2 --latencia 1.0
+    python benchmarks.py pdf --rodadas 20
+    python benchmarks.py falhas --taxa-falha 0.3 --latencia 0.5
+    python benchmarks.py scraper --raspagens 10 --pool 2
+    python benchmarks.py login --sessoes 16 --logins 64 --custo 12 --workers 2
+    python benchmarks.py e2e --rodadas 10 --latencia 0.5 --saida bench_historico.jsonl
+"""
+import os
+import re
+import json
+import sys
+import copy
+import random
+import resource
+import tempfile
+import time
+import platform
+import subprocess
+import queue
+import argparse
+import multiprocessing
+import threading
+import statistics
+import tracemalloc
+import contextlib
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+from google.api_core import exceptions as api_exceptions
+
+import pdi_analyzer
+from analysis_jobs import AnalysisJobManager
+from gemini_scheduler import gemini_run
+from timing import percentile
+
+# Respostas de exemplo para cada seção do diagnóstico.
+SAMPLE_SECTIONS = {
+    "analise_geral": "Plano coerente e ambicioso, com metas intermediárias realistas.",
+    "tipo_empresa_ideal": {"cultura": "Colaborativa", "setor": "Tecnologia", "tamanho": "Médio porte"},
+    "sugestao_cargos_similares": ["Analista de Dados", "Engenheiro de Analytics"],
+    "plano_smart_1_ano": {
+        "S": "Tornar-se Pleno.",
+        "M": [{"metrica": "Certificações", "detalhe": "Concluir 2 certificações"}],
+        "A": {"Acoes_Especificas": ["Estudar SQL"], "Recursos_Necessarios": ["Curso online"]},
+        "R": "Alinhado ao objetivo final.",
+        "T": {"cronograma": [{"trimestre": "T1", "foco": "SQL", "acoes": ["Curso"]}], "data_limite": "01/01/2030"},
+    },
+    "proximos_passos": ["Atualizar o currículo", "Conversar com o gestor", "Iniciar um curso"],
+    "recomendacoes_focadas": [{"foco": "Comunicação", "recomendacao": "Apresentar em reuniões."}],
+    "plano_de_acao_ia": {p: ["Marco 1", "Marco 2", "Marco 3"] for p in ["1_ano", "3_anos", "5_anos", "10_anos", "15_anos"]},
+}
+
+SAMPLE_PROFILE = {
+    "nome": "Pessoa Teste",
+    "email": "pessoa@example.com",
+    "linkedin_url": "https://www.linkedin.com/in/pessoa-teste",
+    "cargo_atual": "Analista Junior",
+    "nivel_hierarquico": "Junior (I)",
+    "habilidades_atuais": ["Python", "SQL", "Excel"],
+    "pontos_a_melhorar": ["Comunicação", "Gestão do tempo"],
+    "resumo_profissional": "Profissional de dados com 2 anos de experiência. " * 5,
+    "full_linkedin_text": "",
+}
+
+SAMPLE_PLAN = {
+    "objetivo_final": "Diretor de Dados",
+    "metas_temporais": {
+        p: {"cargo_alvo": f"Cargo em {p}", "foco_principal": "Desenvolver competências técnicas e de liderança."}
+        for p in ["1_ano", "3_anos", "5_anos", "10_anos", "15_anos"]
+    },
+}
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """
+    Substituto do genai.GenerativeModel que responde com dados de exemplo após `latency`
+    segundos (± `jitter`). Uma fração `failure_rate` das chamadas falha com 429/503, e
+    chamadas mais lentas que o timeout recebido em request_options estouram o prazo.
+    """
+
+    FAILURES = (api_exceptions.ResourceExhausted, api_exceptions.ServiceUnavailable)
+
+    def __init__(self, latency=1.0, jitter=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.failures = 0
+        self.prompt_chars = 0
+        self._lock = threading.Lock()
+
+    def _latency(self):
+        return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def generate_content(self, prompt, stream=False, request_options=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            self.prompt_chars += len(prompt)
+            fail = self.random.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        latency = self._latency()
+        timeout = (request_options or {}).get("timeout")
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise api_exceptions.DeadlineExceeded("Tempo limite da chamada simulada.")
+        if fail:
+            time.sleep(latency / 10)
+            raise self.random.choice(self.FAILURES)("Falha injetada pelo modelo falso.")
+        requested = re.findall(r'"(\w+)"', prompt)
+        payload = {k: v for k, v in SAMPLE_SECTIONS.items() if k in requested}
+        text = "```json\n" + json.dumps(payload, ensure_ascii=False) + "\n```"
+        if not stream:
+            time.sleep(latency)
+            return FakeResponse(text)
+        return self._stream(text, latency)
+
+    def _stream(self, text, latency, chunks=10):
+        """Entrega a resposta em pedaços, distribuindo a latência entre eles."""
+        size = max(1, len(text) // chunks)
+        for i in range(0, len(text), size):
+            time.sleep(latency / chunks)
+            yield FakeResponse(text[i:i + size])
+
+
+def bench_modes(latency, rounds):
+    """Compara os modos "parallel" e "consolidated": chamadas, caracteres de prompt e tempo."""
+    original_model = pdi_analyzer.model
+    results = {}
+    try:
+        for mode in ("parallel", "consolidated"):
+            fake = FakeModel(latency)
+            pdi_analyzer.model = fake
+            timings = []
+            for _ in range(rounds):
+                start = time.perf_counter()
+                if mode == "consolidated":
+                    pdi_analyzer.run_consolidated(queue.Queue(), SAMPLE_PROFILE, SAMPLE_PLAN)
+                else:
+                    pdi_analyzer.run_sections(queue.Queue(), SAMPLE_PROFILE, SAMPLE_PLAN)
+                timings.append(time.perf_counter() - start)
+            results[mode] = {
+                "chamadas_por_diagnostico": fake.calls / rounds,
+                "caracteres_de_prompt": fake.prompt_chars // rounds,
+                "tokens_estimados": fake.prompt_chars // rounds // 4,
+                "tempo_medio_s": round(sum(timings) / rounds, 3),
+            }
+    finally:
+        pdi_analyzer.model = original_model
+    return results
+
+
+def bench_failures(failure_rate, latency, rounds):
+    """Diagnósticos com falhas injetadas: seções perdidas, novas tentativas e tempo total."""
+    original_model = pdi_analyzer.model
+    results = []
+    try:
+        for i in range(rounds):
+            fake = FakeModel(latency, jitter=latency / 2, failure_rate=failure_rate, seed=i)
+            pdi_analyzer.model = fake
+            start = time.perf_counter()
+            with gemini_run() as run:
+                analysis = pdi_analyzer.run_sections(queue.Queue(), SAMPLE_PROFILE, SAMPLE_PLAN)
+            summary = run.summary()
+            results.append({
+                "tempo_s": round(time.perf_counter() - start, 3),
+                "falhas_injetadas": fake.failures,
+                "novas_tentativas": summary["retries"],
+                "secoes_perdidas": sum(
+                    1 for key, value in analysis.items() if not pdi_analyzer.is_valid_section(key, value)
+                ),
+            })
+    finally:
+        pdi_analyzer.model = original_model
+    return {"taxa_falha": failure_rate, "rodadas": results}
+
+
+# Página estática que imita um perfil público (o seletor é o mesmo usado pelo scraper).
+FIXTURE_PAGES = {
+    "/perfil": """<!doctype html><html><head><title>Pessoa Teste | LinkedIn</title></head>
+<body><main class="scaffold-layout__main">
+<h1>Pessoa Teste</h1><p>Analista de Dados Junior</p>
+<section><h2>Experiência</h2><p>Analista de Dados na Empresa X (2022 - atual)</p></section>
+<section><h2>Formação</h2><p>Bacharelado em Estatística</p></section>
+</main></body></html>""",
+    # Perfil longo: novas seções só aparecem após a rolagem, com atraso, e a página
+    # pede imagens e fontes que o scraper deve bloquear.
+    "/perfil-lazy": """<!doctype html><html><head><title>Pessoa Teste | LinkedIn</title>
+<style>@font-face { font-family: F; src: url(/fonte.woff2); } section { height: 900px; }</style></head>
+<body><main class="scaffold-layout__main">
+<h1>Pessoa Teste</h1><img src="/foto.jpg"><section>Seção inicial</section>
+</main>
+<script>
+let loaded = 0;
+window.addEventListener("scroll", () => {
+  if (loaded >= LAZY_SECTIONS || window.innerHeight + window.scrollY < document.body.scrollHeight - 10) return;
+  const n = ++loaded;
+  setTimeout(() => {
+    const s = document.createElement("section");
+    s.textContent = "Seção lazy " + n;
+    document.querySelector("main").appendChild(s);
+  }, 300);
+});
+</script></body></html>""",
+}
+LAZY_SECTIONS = 6
+FIXTURE_PAGES["/perfil-lazy"] = FIXTURE_PAGES["/perfil-lazy"].replace("LAZY_SECTIONS", str(LAZY_SECTIONS))
+
+
+class _FixtureHandler(SimpleHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        body = FIXTURE_PAGES.get(path)
+        if body is None:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextlib.contextmanager
+def fixture_server():
+    """Servidor HTTP local com as páginas de FIXTURE_PAGES; retorna a URL base."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FixtureHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+
+
+class RssSampler:
+    """Amostra em segundo plano o RSS dos processos filhos (navegadores) e guarda o pico."""
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        from browser_pool import descendant_rss_mb
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, descendant_rss_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def bench_scraper(scrapes, pool_size):
+    """
+    Latência por raspagem e RSS de pico: navegador novo a cada raspagem vs. pool aquecido.
+    Usa a página com seções carregadas sob demanda e confere se todas foram extraídas.
+    """
+    from playwright.sync_api import sync_playwright
+    from browser_pool import BrowserPool
+    from linkedin_scraper import _extract_profile_text
+
+    def summarize(timings, sampler, text):
+        return {
+            "raspagens": len(timings),
+            "secoes_lazy_extraidas": f"{text.count('Seção lazy')}/{LAZY_SECTIONS}",
+            "latencia_p50_s": round(statistics.median(timings), 3),
+            "latencia_p95_s": round(percentile(timings, 95), 3),
+            "rss_pico_navegadores_mb": round(sampler.peak_mb, 1),
+        }
+
+    results = {}
+    with fixture_server() as base_url:
+        url = f"{base_url}/perfil-lazy"
+
+        timings = []
+        with RssSampler() as sampler:
+            for _ in range(scrapes):
+                start = time.perf_counter()
+                with sync_playwright() as p:
+                    browser = p.chromium.launch(headless=True)
+                    context = browser.new_context()
+                    text = _extract_profile_text(context, url)
+                    browser.close()
+                timings.append(time.perf_counter() - start)
+        results["navegador_novo_por_raspagem"] = summarize(timings, sampler, text)
+
+        pool = BrowserPool(size=pool_size)
+        try:
+            pool.run(lambda context: None)  # aquecimento: sobe os navegadores
+            timings = []
+            with RssSampler() as sampler:
+                for _ in range(scrapes):
+                    start = time.perf_counter()
+                    text = pool.run(lambda context: _extract_profile_text(context, url))
+                    timings.append(time.perf_counter() - start)
+            results["pool"] = summarize(timings, sampler, text) | {"pool": pool_size, **pool.stats}
+        finally:
+            pool.shutdown()
+    return results
+
+
+def read_rss_mb(pid):
+    """RSS atual de um processo em MB (Linux, via /proc)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+    return 0.0
+
+
+def fake_analysis_process(q_to_ui, user_email, latency=1.0):
+    """Alvo do pool para o benchmark: gera as seções com o modelo falso, sem Firestore nem cache."""
+    pdi_analyzer.model = FakeModel(latency)
+    ai_analysis = pdi_analyzer.run_sections(q_to_ui, SAMPLE_PROFILE, SAMPLE_PLAN)
+    q_to_ui.put({"status": "complete", "data": {"ai_analysis": ai_analysis}})
+
+
+def bench_pool(analyses, workers, latency):
+    """Dispara N análises simultâneas no pool e mede latência por job e RSS total de pico."""
+    manager = AnalysisJobManager(max_workers=workers, target=fake_analysis_process)
+    try:
+        start = time.perf_counter()
+        job_ids = [manager.submit(f"user{i}@example.com", latency=latency) for i in range(analyses)]
+        latencies = {}
+        peak_rss = 0.0
+        while len(latencies) < analyses:
+            for job_id in job_ids:
+                if job_id in latencies:
+                    continue
+                job = manager.status(job_id)
+                if job and job["status"] in ("complete", "error"):
+                    latencies[job_id] = job["finished_at"] - job["submitted_at"]
+                    manager.forget(job_id)
+            pids = [os.getpid()] + manager.stats()["worker_pids"]
+            peak_rss = max(peak_rss, sum(read_rss_mb(pid) for pid in pids))
+            time.sleep(0.05)
+        values = list(latencies.values())
+        return {
+            "analises": analyses,
+            "workers": workers,
+            "tempo_total_s": round(time.perf_counter() - start, 3),
+            "latencia_p50_s": round(statistics.median(values), 3),
+            "latencia_p95_s": round(percentile(values, 95), 3),
+            "rss_pico_total_mb": round(peak_rss, 1),
+        }
+    finally:
+        manager.shutdown()
+
+
+def bench_pdf(rounds):
+    """Tempo e pico de alocação por PDF, com add_font() a cada PDF e com o registro de fontes."""
+    from fpdf import FPDF
+    from pdf_fonts import add_cached_font
+    from app import generate_pdi_pdf
+
+    font_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts", "DejaVuSans.ttf")
+    text = "Diagnóstico de carreira: ação, gestão, comunicação. " * 40
+
+    def small_pdf(cached):
+        pdf = FPDF()
+        pdf.add_page()
+        if cached:
+            add_cached_font(pdf, "DejaVu", "", font_path)
+        else:
+            pdf.add_font("DejaVu", "", font_path)
+        pdf.set_font("DejaVu", "", 10)
+        pdf.multi_cell(0, 5, text)
+        return bytes(pdf.output())
+
+    def measure(build):
+        build()  # aquecimento (o registro processa a fonte aqui)
+        timings, peaks = [], []
+        for _ in range(rounds):
+            tracemalloc.start()
+            start = time.perf_counter()
+            output = build()
+            timings.append(time.perf_counter() - start)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        return {
+            "ms_por_pdf_p50": round(statistics.median(timings) * 1000, 1),
+            "pico_alocacao_kb_p50": round(statistics.median(peaks) / 1024, 1),
+            "tamanho_pdf_kb": round(len(output) / 1024, 1),
+        }
+
+    sample = {"profile": SAMPLE_PROFILE, "ai_analysis": SAMPLE_SECTIONS}
+    return {
+        "add_font_a_cada_pdf": measure(lambda: small_pdf(cached=False)),
+        "registro_de_fontes": measure(lambda: small_pdf(cached=True)),
+        "generate_pdi_pdf": measure(lambda: generate_pdi_pdf(sample)),
+    }
+
+
+def bench_login(sessions, logins, rounds, workers):
+    """
+    Vazão de logins com N sessões simultâneas: bcrypt direto na thread de cada sessão vs.
+    o pool limitado de password_hashing.py. Uma sessão "vizinha" renderiza páginas leves
+    em paralelo, e a latência dela mostra o quanto uma rajada de logins trava o servidor.
+    """
+    import bcrypt
+    from concurrent.futures import ThreadPoolExecutor
+    from password_hashing import PasswordHasher
+
+    password = "senha-de-teste-123"
+    hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+
+    def direct(pw):
+        return bcrypt.checkpw(pw.encode("utf-8"), hashed.encode("utf-8"))
+
+    def neighbour_render():
+        start = time.perf_counter()
+        sum(i * i for i in range(20000))  # ~ uma renderização leve de página
+        return time.perf_counter() - start
+
+    def measure(verify):
+        latencies, neighbour = [], []
+        stop = threading.Event()
+
+        def neighbour_loop():
+            while not stop.is_set():
+                neighbour.append(neighbour_render())
+                time.sleep(0.01)
+
+        def one_login(_):
+            start = time.perf_counter()
+            assert verify(password)
+            latencies.append(time.perf_counter() - start)
+
+        probe = threading.Thread(target=neighbour_loop, daemon=True)
+        probe.start()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=sessions) as session_threads:
+            list(session_threads.map(one_login, range(logins)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        probe.join()
+        return {
+            "logins_por_s": round(logins / elapsed, 2),
+            "latencia_login_p50_s": round(statistics.median(latencies), 3),
+            "latencia_login_p95_s": round(percentile(latencies, 95), 3),
+            "render_vizinho_p50_ms": round(statistics.median(neighbour) * 1000, 2),
+            "render_vizinho_p95_ms": round(percentile(neighbour, 95) * 1000, 2),
+        }
+
+    baseline = [neighbour_render() for _ in range(20)]
+    hasher = PasswordHasher(rounds=rounds, workers=workers, max_pending=logins)
+    return {
+        "sessoes": sessions,
+        "logins": logins,
+        "custo_bcrypt": rounds,
+        "cpus": os.cpu_count(),
+        "render_vizinho_ocioso_ms": round(statistics.median(baseline) * 1000, 2),
+        "bcrypt_direto": measure(direct),
+        f"pool_{workers}_workers": measure(lambda pw: hasher.verify(pw, hashed)),
+    }
+
+
+class FakeUserStore:
+    """
+    Substituto em memória das funções de dados do auth.py (Firestore). Os documentos
+    são copiados na leitura e na escrita, como aconteceria com a serialização real.
+    """
+
+    def __init__(self, docs=None):
+        self.docs = copy.deepcopy(docs or {})
+        self.reads = 0
+        self.writes = 0
+
+    def load_pdi_data_from_firestore(self, email):
+        self.reads += 1
+        return copy.deepcopy(self.docs.get(email, {"profile": {}, "pdi_plan": {"metas_temporais": {}}}))
+
+    def save_pdi_data_to_firestore(self, email, data, snapshot=None):
+        self.writes += 1
+        doc = self.docs.setdefault(email, {})
+        for key, value in copy.deepcopy(data).items():
+            if isinstance(value, dict) and isinstance(doc.get(key), dict):
+                doc[key].update(value)
+            else:
+                doc[key] = value
+
+    def save_analysis_result(self, email, pdi_data):
+        self.writes += 1
+        doc = self.docs.setdefault(email, {})
+        doc["ai_analysis"] = copy.deepcopy(pdi_data.get("ai_analysis", {}))
+        doc.setdefault("profile", {})["full_linkedin_text"] = pdi_data.get("profile", {}).get("full_linkedin_text", "")
+        if "analysis_timings" in pdi_data:
+            doc["analysis_timings"] = copy.deepcopy(pdi_data["analysis_timings"])
+
+    def login_user(self, email, password, client_ip=None):
+        return (True, "") if email in self.docs else (False, "E-mail ou senha inválidos.")
+
+    def install(self):
+        """Troca as funções do auth.py (e as cópias já importadas por outros módulos) por este store."""
+        import auth
+        for name in ("load_pdi_data_from_firestore", "save_pdi_data_to_firestore", "save_analysis_result", "login_user"):
+            setattr(auth, name, getattr(self, name))
+            for module_name in ("pdi_analyzer", "app", "batch_runner"):
+                module = sys.modules.get(module_name)
+                if module is not None and hasattr(module, name):
+                    setattr(module, name, getattr(self, name))
+
+
+E2E_EMAIL = "pessoa@example.com"
+E2E_DOC = {
+    "profile": SAMPLE_PROFILE,
+    "pdi_plan": SAMPLE_PLAN,
+    "ai_analysis": SAMPLE_SECTIONS,
+    "usage_tracking": {"analysis_timestamps": []},
+}
+
+
+def _setup_diagnosis(options):
+    """Análise completa (run_full_analysis_process) com Gemini falso, Firestore em memória, sem cache nem scraping."""
+    import gemini_limiter
+    FakeUserStore({E2E_EMAIL: E2E_DOC}).install()
+    pdi_analyzer.model = FakeModel(options["latency"], options["jitter"], options["failure_rate"], seed=0)
+    pdi_analyzer.get_section_cache = lambda: None
+    pdi_analyzer.SCRAPING_ENABLED = False
+    limiter_db = os.path.join(tempfile.mkdtemp(), "limiter.sqlite3")
+    gemini_limiter._limiter = gemini_limiter.GeminiRateLimiter(limiter_db, 0, 0)
+
+    def run_once():
+        q = queue.Queue()
+        pdi_analyzer.run_full_analysis_process(q, E2E_EMAIL, mode=options["mode"])
+        messages = []
+        while not q.empty():
+            messages.append(q.get())
+        if not messages or messages[-1].get("status") != "complete":
+            raise RuntimeError(f"Análise não concluída: {messages[-1] if messages else 'sem mensagens'}")
+    return run_once
+
+
+def _setup_pdf(options):
+    """Montagem do PDF do diagnóstico (generate_pdi_pdf), sem o cache de bytes da página."""
+    from app import generate_pdi_pdf
+    return lambda: generate_pdi_pdf(E2E_DOC)
+
+
+def _setup_page(options):
+    """Renderização da página "Meu Diagnóstico" de um usuário logado, via streamlit.testing (sem navegador)."""
+    import streamlit_option_menu
+    from streamlit.testing.v1 import AppTest
+    FakeUserStore({E2E_EMAIL: E2E_DOC}).install()
+    # O menu é um componente JavaScript; no teste ele só devolve a página escolhida.
+    streamlit_option_menu.option_menu = lambda *args, **kwargs: "Meu Diagnóstico"
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+    def run_once():
+        at = AppTest.from_file(app_path, default_timeout=60)
+        at.session_state["logged_in_user"] = E2E_EMAIL
+        at.run()
+        if at.exception:
+            raise RuntimeError(f"Erro ao renderizar a página: {at.exception[0].value}")
+    return run_once
+
+
+E2E_SCENARIOS = {
+    "diagnostico": _setup_diagnosis,
+    "pdf": _setup_pdf,
+    "pagina_diagnostico": _setup_page,
+}
+
+
+def _run_scenario(name, rounds, options, results_q):
+    """Executa um cenário em um processo próprio, para que o RSS de pico seja só dele."""
+    try:
+        run_once = E2E_SCENARIOS[name](options)
+        run_once()  # aquecimento: imports, fontes, caches de módulo
+        rss_start = read_rss_mb(os.getpid())
+        walls, cpus = [], []
+        for _ in range(rounds):
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            run_once()
+            walls.append(time.perf_counter() - wall_start)
+            cpus.append(time.process_time() - cpu_start)
+        results_q.put({
+            "rodadas": rounds,
+            "wall_p50_s": round(statistics.median(walls), 4),
+            "wall_p95_s": round(percentile(walls, 95), 4),
+            "cpu_p50_s": round(statistics.median(cpus), 4),
+            "cpu_p95_s": round(percentile(cpus, 95), 4),
+            "rss_inicial_mb": round(rss_start, 1),
+            # ru_maxrss vem em KB no Linux.
+            "rss_pico_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        })
+    except Exception as e:
+        results_q.put({"erro": f"{type(e).__name__}: {e}"})
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def bench_e2e(rounds, latency, jitter, failure_rate, mode, scenarios, output=None):
+    """
+    Mede p50/p95 de tempo de parede e de CPU e o RSS de pico de cada cenário de ponta a
+    ponta. O resultado é um JSON estável; com `output`, também é acrescentado (uma linha
+    por execução) ao arquivo, para acompanhar regressões entre commits.
+    """
+    options = {"latency": latency, "jitter": jitter, "failure_rate": failure_rate, "mode": mode}
+    ctx = multiprocessing.get_context()
+    results = {}
+    for name in scenarios:
+        results_q = ctx.Queue()
+        worker = ctx.Process(target=_run_scenario, args=(name, rounds, options, results_q))
+        worker.start()
+        results[name] = results_q.get()
+        worker.join()
+
+    report = {
+        "suite": "e2e",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "config": {"rodadas": rounds, "latencia": latency, "jitter": jitter, "taxa_falha": failure_rate, "modo": mode},
+        "resultados": results,
+    }
+    if output:
+        with open(output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(report, ensure_ascii=False) + "\n")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks locais do PDI Agente.")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    modes = sub.add_parser("modos", help="Compara o modo paralelo com o consolidado.")
+    modes.add_argument("--latencia", type=float, default=1.0, help="Latência simulada por chamada (s).")
+    modes.add_argument("--rodadas", type=int, default=3)
+
+    pool = sub.add_parser("pool", help="Latência e RSS de N análises simultâneas no pool de processos.")
+    pool.add_argument("--analises", type=int, default=10)
+    pool.add_argument("--workers", type=int, default=2)
+    pool.add_argument("--latencia", type=float, default=1.0, help="Latência simulada por chamada (s).")
+
+    pdf = sub.add_parser("pdf", help="Custo por PDF com e sem o registro de fontes.")
+    pdf.add_argument("--rodadas", type=int, default=20)
+
+    failures = sub.add_parser("falhas", help="Diagnósticos com falhas 429/503 injetadas.")
+    failures.add_argument("--taxa-falha", type=float, default=0.3)
+    failures.add_argument("--latencia", type=float, default=0.5, help="Latência simulada por chamada (s).")
+    failures.add_argument("--rodadas", type=int, default=3)
+
+    scraper = sub.add_parser("scraper", help="Raspagem de uma página local: navegador novo vs. pool.")
+    scraper.add_argument("--raspagens", type=int, default=10)
+    scraper.add_argument("--pool", type=int, default=1, help="Navegadores no pool.")
+
+    login = sub.add_parser("login", help="Vazão de logins simultâneos: bcrypt direto vs. pool limitado.")
+    login.add_argument("--sessoes", type=int, default=16, help="Sessões fazendo login ao mesmo tempo.")
+    login.add_argument("--logins", type=int, default=64)
+    login.add_argument("--custo", type=int, default=12, help="Custo do bcrypt (log2 das rodadas).")
+    login.add_argument("--workers", type=int, default=2, help="Threads do pool de hash.")
+
+    e2e = sub.add_parser("e2e", help="Diagnóstico completo, PDF e página com Gemini falso e Firestore em memória.")
+    e2e.add_argument("--rodadas", type=int, default=10)
+    e2e.add_argument("--latencia", type=float, default=0.5, help="Latência simulada por chamada (s).")
+    e2e.add_argument("--jitter", type=float, default=0.1, help="Variação da latência (± s).")
+    e2e.add_argument("--taxa-falha", type=float, default=0.0)
+    e2e.add_argument("--modo", choices=("parallel", "consolidated"), default=pdi_analyzer.ANALYSIS_MODE)
+    e2e.add_argument("--cenarios", default=",".join(E2E_SCENARIOS), help="Cenários separados por vírgula.")
+    e2e.add_argument("--saida", help="Arquivo JSON Lines onde o resultado é acrescentado.")
+
+    args = parser.parse_args()
+    if args.bench == "modos":
+        result = bench_modes(args.latencia, args.rodadas)
+    elif args.bench == "pool":
+        result = bench_pool(args.analises, args.workers, args.latencia)
+    elif args.bench == "pdf":
+        result = bench_pdf(args.rodadas)
+    elif args.bench == "falhas":
+        result = bench_failures(args.taxa_falha, args.latencia, args.rodadas)
+    elif args.bench == "scraper":
+        result = bench_scraper(args.raspagens, args.pool)
+    elif args.bench == "login":
+        result = bench_login(args.sessoes, args.logins, args.custo, args.workers)
+    elif args.bench == "e2e":
+        result = bench_e2e(args.rodadas, args.latencia, args.jitter, args.taxa_falha, args.modo,
+                           args.cenarios.split(","), args.saida)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
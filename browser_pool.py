@@ -0,0 +1,211 @@
+# browser_pool.py
+"""
+Pool de navegadores Chromium reaproveitáveis para o scraper.
+
+A API síncrona do Playwright só pode ser usada na thread que a criou, então cada
+navegador do pool vive em uma thread própria ("slot") que recebe as raspagens por
+uma fila. Cada raspagem ganha um contexto novo e isolado (cookies, cache e
+armazenamento próprios), fechado ao final. O navegador é reciclado depois de
+PDI_BROWSER_MAX_PAGES páginas ou quando o uso de memória passa do limite.
+"""
+import os
+import queue
+import atexit
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from playwright.sync_api import sync_playwright
+
+POOL_SIZE = int(os.environ.get("PDI_BROWSER_POOL_SIZE", "1"))
+MAX_PAGES_PER_BROWSER = int(os.environ.get("PDI_BROWSER_MAX_PAGES", "50"))
+MAX_RSS_MB_PER_BROWSER = int(os.environ.get("PDI_BROWSER_MAX_RSS_MB", "600"))
+# Tempo máximo (s) que quem chama run() espera por uma raspagem, incluindo a fila.
+JOB_TIMEOUT = float(os.environ.get("PDI_BROWSER_JOB_TIMEOUT", "300"))
+
+
+def descendant_rss_mb(root_pid=None) -> float:
+    """
+    Soma o RSS (MB) de todos os processos descendentes de `root_pid` (Linux, via /proc).
+    Sem /proc (outros sistemas), retorna 0 e o limite de memória não é aplicado.
+    """
+    root_pid = root_pid or os.getpid()
+    parents, rss = {}, {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return 0.0
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # O nome do processo pode conter espaços; os campos seguintes vêm após o ")".
+                fields = f.read().rsplit(")", 1)[1].split()
+            parents[int(entry)] = int(fields[1])
+            rss[int(entry)] = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+        except (FileNotFoundError, ProcessLookupError, IndexError, ValueError):
+            continue
+
+    total, stack = 0, [root_pid]
+    while stack:
+        pid = stack.pop()
+        for child, parent in parents.items():
+            if parent == pid:
+                total += rss.get(child, 0)
+                stack.append(child)
+    return total / (1024 * 1024)
+
+
+class _BrowserSlot(threading.Thread):
+    """Thread dona de uma instância do Playwright e de um Chromium."""
+
+    def __init__(self, pool, index):
+        super().__init__(name=f"browser-slot-{index}", daemon=True)
+        self.pool = pool
+        self.browser = None
+        self.pages = 0
+
+    def _launch(self, playwright):
+        self.browser = playwright.chromium.launch(headless=True, **self.pool.launch_options)
+        self.pages = 0
+        with self.pool._lock:
+            self.pool.stats["launches"] += 1
+
+    def _recycle(self):
+        if self.browser is not None:
+            try:
+                self.browser.close()
+            except Exception as e:
+                print(f"AVISO: Falha ao fechar o navegador: {e}")
+            self.browser = None
+            with self.pool._lock:
+                self.pool.stats["recycles"] += 1
+
+    def _over_memory_limit(self):
+        live = max(1, self.pool.live_browsers())
+        return descendant_rss_mb() / live > self.pool.max_rss_mb
+
+    def run(self):
+        try:
+            playwright = sync_playwright().start()
+        except Exception as e:
+            # Sem o Playwright (ex.: driver ausente) esta thread não tem como atender nada:
+            # falha as raspagens na fila para que ninguém fique esperando para sempre.
+            print(f"ERRO: Falha ao iniciar o Playwright: {e}")
+            self.pool._fail_queued(e)
+            return
+        try:
+            self._serve(playwright)
+        finally:
+            self._recycle()
+            playwright.stop()
+
+    def _serve(self, playwright):
+        while True:
+            job = self.pool._jobs.get()
+            if job is None:
+                break
+            fn, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if self.browser is None or not self.browser.is_connected():
+                    self._launch(playwright)
+                context = self.browser.new_context(**self.pool.context_options)
+                try:
+                    result = fn(context)
+                finally:
+                    context.close()
+                    self.pages += 1
+                future.set_result(result)
+            except Exception as e:
+                future.set_exception(e)
+
+            if self.browser is not None and (
+                self.pages >= self.pool.max_pages or self._over_memory_limit()
+            ):
+                self._recycle()
+
+
+class BrowserPool:
+    """Mantém até `size` navegadores aquecidos e distribui as raspagens entre eles."""
+
+    def __init__(self, size=POOL_SIZE, max_pages=MAX_PAGES_PER_BROWSER,
+                 max_rss_mb=MAX_RSS_MB_PER_BROWSER, launch_options=None, context_options=None):
+        self.size = max(1, size)
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.launch_options = launch_options or {}
+        self.context_options = context_options or {}
+        self.stats = {"launches": 0, "recycles": 0}
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._slots = []
+        self._closed = False
+
+    def live_browsers(self):
+        return sum(1 for slot in self._slots if slot.browser is not None)
+
+    def _ensure_slots(self):
+        with self._lock:
+            self._slots = [slot for slot in self._slots if slot.is_alive()]
+            while len(self._slots) < self.size:
+                slot = _BrowserSlot(self, len(self._slots))
+                slot.start()
+                self._slots.append(slot)
+
+    def _fail_queued(self, error):
+        """Falha com `error` todas as raspagens que ainda aguardam na fila."""
+        sentinels = 0
+        while True:
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                sentinels += 1  # pedido de encerramento de outra thread: devolvido à fila
+                continue
+            _, future = job
+            if future.set_running_or_notify_cancel():
+                future.set_exception(error)
+        for _ in range(sentinels):
+            self._jobs.put(None)
+
+    def run(self, fn, timeout=JOB_TIMEOUT):
+        """
+        Executa `fn(context)` em um contexto isolado de um navegador do pool e retorna o resultado.
+        Levanta TimeoutError se a raspagem não terminar em `timeout` segundos (incluindo a fila).
+        """
+        if self._closed:
+            raise RuntimeError("O pool de navegadores já foi encerrado.")
+        future = Future()
+        # Enfileira antes de (re)criar as threads: se o Playwright não iniciar, a thread
+        # nova encontra este pedido na fila e o falha.
+        self._jobs.put((fn, future))
+        self._ensure_slots()
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()  # se ainda estiver na fila, não será executada
+            raise TimeoutError(f"A raspagem não terminou em {timeout:.0f}s.") from None
+
+    def shutdown(self):
+        self._closed = True
+        for _ in self._slots:
+            self._jobs.put(None)
+        for slot in self._slots:
+            slot.join(timeout=10)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool() -> BrowserPool:
+    """Pool único por processo, criado na primeira raspagem."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+            atexit.register(_pool.shutdown)
+        return _pool
@@ -0,0 +1,88 @@
+# browser_setup.py
+"""
+Provisionamento do navegador do Playwright.
+
+O download do Chromium é feito uma única vez por início do servidor (ver app.py) e
+registrado em um arquivo marcador, junto com o caminho do executável. O processo de
+análise apenas consulta o marcador e confere se o executável ainda existe (o cache
+do Playwright pode ter sido apagado depois da instalação).
+"""
+import os
+import json
+import datetime
+import threading
+import subprocess
+from pathlib import Path
+from importlib import metadata
+
+BROWSER_MARKER = Path(os.environ.get("PDI_BROWSER_MARKER", "data_pdi/.playwright_ready"))
+INSTALL_TIMEOUT = int(os.environ.get("PDI_BROWSER_INSTALL_TIMEOUT", "180"))
+
+_install_lock = threading.Lock()
+
+
+def _playwright_version():
+    try:
+        return metadata.version("playwright")
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def _chromium_executable():
+    """Caminho do Chromium que a versão instalada do Playwright usa, ou None se não for possível obtê-lo."""
+    try:
+        from playwright.sync_api import sync_playwright
+        with sync_playwright() as p:
+            return p.chromium.executable_path
+    except Exception as e:
+        print(f"AVISO: Não foi possível obter o caminho do Chromium: {e}")
+        return None
+
+
+def is_browser_ready() -> bool:
+    """Retorna True se o navegador foi instalado para a versão atual do Playwright e ainda está no disco."""
+    try:
+        marker = json.loads(BROWSER_MARKER.read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
+    if marker.get("playwright_version") != _playwright_version():
+        return False
+    executable = marker.get("executable_path")
+    return bool(executable) and Path(executable).is_file()
+
+
+def provision_browser() -> bool:
+    """
+    Instala o binário do Chromium se ainda não houver marcador válido.
+    Seguro para chamadas concorrentes dentro do mesmo processo.
+    """
+    with _install_lock:
+        if is_browser_ready():
+            return True
+        try:
+            # Sem "--with-deps": o packages.txt já cuida das dependências do sistema.
+            subprocess.run(["playwright", "install", "chromium"], check=True, timeout=INSTALL_TIMEOUT)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError) as e:
+            print(f"Falha ao instalar navegador com Playwright: {e}.")
+            return False
+
+        executable = _chromium_executable()
+        if not executable or not Path(executable).is_file():
+            print(f"Falha ao instalar navegador com Playwright: executável não encontrado ({executable}).")
+            return False
+
+        BROWSER_MARKER.parent.mkdir(parents=True, exist_ok=True)
+        BROWSER_MARKER.write_text(json.dumps({
+            "playwright_version": _playwright_version(),
+            "executable_path": executable,
+            "installed_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }), encoding="utf-8")
+        print("Navegador do Playwright pronto.")
+        return True
+
+
+def start_browser_provisioning() -> threading.Thread:
+    """Dispara o provisionamento em segundo plano para não bloquear a primeira página."""
+    thread = threading.Thread(target=provision_browser, name="playwright-install", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,316 @@
+# email_outbox.py
+"""
+Caixa de saída de e-mails, enviada em segundo plano.
+
+Quem envia um e-mail só grava a mensagem na caixa de saída (um arquivo SQLite local,
+que sobrevive a reinícios) e segue em frente. Uma thread do servidor lê as mensagens
+pendentes em lotes e as envia reaproveitando conexões SMTP já autenticadas (STARTTLS e
+login uma vez por conexão, não por mensagem). Falhas temporárias são repetidas com
+backoff exponencial; o status de cada mensagem pode ser consultado pelo ID.
+
+Para testar sem enviar e-mails de verdade, suba um servidor SMTP local de depuração
+e aponte o outbox para ele:
+    python -m aiosmtpd -n -l localhost:1025          # ou, até o Python 3.11:
+    python -m smtpd -n -c DebuggingServer localhost:1025
+    PDI_SMTP_HOST=localhost PDI_SMTP_PORT=1025 PDI_SMTP_STARTTLS=0 streamlit run app.py
+O mesmo cenário roda de forma automática em tests/test_email_outbox.py.
+"""
+import os
+import time
+import random
+import sqlite3
+import smtplib
+import threading
+from pathlib import Path
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+from sqlite_store import SQLiteFile
+
+OUTBOX_DB = Path(os.environ.get("PDI_OUTBOX_DB", "data_pdi/email_outbox.sqlite3"))
+OUTBOX_BATCH_SIZE = int(os.environ.get("PDI_OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("PDI_OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_BACKOFF_BASE = float(os.environ.get("PDI_OUTBOX_BACKOFF_BASE", "5"))
+OUTBOX_BACKOFF_MAX = float(os.environ.get("PDI_OUTBOX_BACKOFF_MAX", "600"))
+OUTBOX_POLL_INTERVAL = float(os.environ.get("PDI_OUTBOX_POLL_INTERVAL", "5"))
+# Mensagens "sending" há mais que isso (s) ficaram presas por uma queda do servidor.
+OUTBOX_STUCK_SECONDS = 300
+
+SMTP_POOL_SIZE = int(os.environ.get("PDI_SMTP_POOL_SIZE", "2"))
+# Conexões paradas há mais que isso (s) são fechadas; o servidor derrubaria de qualquer forma.
+SMTP_IDLE_SECONDS = float(os.environ.get("PDI_SMTP_IDLE_SECONDS", "60"))
+SMTP_TIMEOUT = float(os.environ.get("PDI_SMTP_TIMEOUT", "30"))
+
+STATUSES = ("pending", "sending", "sent", "failed")
+
+# Erros que não melhoram com uma nova tentativa.
+PERMANENT_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPNotSupportedError)
+
+
+class SMTPSettings:
+    def __init__(self, host, port, sender, username=None, password=None, starttls=True):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+
+
+class SMTPConnectionPool:
+    """Conexões SMTP autenticadas e reaproveitadas entre envios."""
+
+    def __init__(self, settings, size=SMTP_POOL_SIZE, idle_seconds=SMTP_IDLE_SECONDS):
+        self.settings = settings
+        self.idle_seconds = idle_seconds
+        self._idle = []  # (conexão, instante em que foi devolvida)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, size))
+        self.stats = {"connections_opened": 0, "connections_reused": 0}
+
+    def _open(self):
+        s = self.settings
+        server = smtplib.SMTP(s.host, s.port, timeout=SMTP_TIMEOUT)
+        if s.starttls:
+            server.starttls()
+        if s.username and s.password:
+            server.login(s.username, s.password)
+        with self._lock:
+            self.stats["connections_opened"] += 1
+        return server
+
+    @staticmethod
+    def _close(server):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def acquire(self):
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    entry = self._idle.pop() if self._idle else None
+                if entry is None:
+                    return self._open()
+                server, returned_at = entry
+                if time.monotonic() - returned_at > self.idle_seconds:
+                    self._close(server)
+                    continue
+                try:
+                    if server.noop()[0] == 250:
+                        with self._lock:
+                            self.stats["connections_reused"] += 1
+                        return server
+                except smtplib.SMTPException:
+                    pass
+                self._close(server)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, server, broken=False):
+        try:
+            if broken:
+                self._close(server)
+            else:
+                with self._lock:
+                    self._idle.append((server, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def close_idle(self, max_idle=None):
+        limit = time.monotonic() - (self.idle_seconds if max_idle is None else max_idle)
+        with self._lock:
+            expired = [entry for entry in self._idle if entry[1] <= limit]
+            self._idle = [entry for entry in self._idle if entry[1] > limit]
+        for server, _ in expired:
+            self._close(server)
+
+
+class EmailOutbox:
+    """Fila persistente de e-mails (SQLite) com uma thread de envio em lotes."""
+
+    def __init__(self, settings, path=OUTBOX_DB, batch_size=OUTBOX_BATCH_SIZE,
+                 max_attempts=OUTBOX_MAX_ATTEMPTS, poll_interval=OUTBOX_POLL_INTERVAL):
+        self.settings = settings
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.pool = SMTPConnectionPool(settings)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._db = SQLiteFile(self.path, row_factory=sqlite3.Row)
+        with self._db.transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    recipient TEXT NOT NULL,
+                    subject TEXT NOT NULL,
+                    text_body TEXT,
+                    html_body TEXT,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    sent_at REAL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS messages_due ON messages (status, next_attempt_at)")
+
+    # --- Armazenamento ---
+
+    def enqueue(self, recipient, subject, text_body, html_body=None) -> int:
+        """Grava a mensagem na caixa de saída, acorda o envio e retorna o ID."""
+        now = time.time()
+        with self._db.transaction() as conn:
+            message_id = conn.execute(
+                "INSERT INTO messages (recipient, subject, text_body, html_body, next_attempt_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (recipient, subject, text_body, html_body, now, now, now),
+            ).lastrowid
+        self._wake.set()
+        return message_id
+
+    def status(self, message_id):
+        """Status de entrega de uma mensagem, ou None se o ID não existir."""
+        row = self._db.connect().execute(
+            "SELECT id, recipient, status, attempts, last_error, created_at, sent_at FROM messages WHERE id = ?",
+            (message_id,),
+        ).fetchone()
+        return dict(row) if row else None
+
+    def stats(self) -> dict:
+        counts = dict(self._db.connect().execute("SELECT status, COUNT(*) FROM messages GROUP BY status").fetchall())
+        return {**{status: counts.get(status, 0) for status in STATUSES}, **self.pool.stats}
+
+    def _claim_batch(self):
+        """Marca como "sending" um lote de mensagens vencidas (seguro com mais de um processo enviando)."""
+        now = time.time()
+        with self._db.transaction() as conn:
+            conn.execute(
+                "UPDATE messages SET status = 'pending', updated_at = ? WHERE status = 'sending' AND updated_at < ?",
+                (now, now - OUTBOX_STUCK_SECONDS),
+            )
+            rows = conn.execute(
+                "SELECT * FROM messages WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (now, self.batch_size),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE messages SET status = 'sending', updated_at = ? WHERE id = ?",
+                [(now, row["id"]) for row in rows],
+            )
+        return [dict(row) for row in rows]
+
+    def _mark_sent(self, message_id):
+        now = time.time()
+        with self._db.transaction() as conn:
+            conn.execute(
+                # O corpo (que pode conter tokens) não precisa ficar guardado depois do envio.
+                "UPDATE messages SET status = 'sent', attempts = attempts + 1, sent_at = ?, updated_at = ?, "
+                "last_error = NULL, text_body = NULL, html_body = NULL WHERE id = ?",
+                (now, now, message_id),
+            )
+
+    def _mark_failed(self, message, error, permanent=False):
+        attempts = message["attempts"] + 1
+        now = time.time()
+        if permanent or attempts >= self.max_attempts:
+            status, next_attempt = "failed", now
+        else:
+            # Backoff exponencial com jitter ("full jitter").
+            status = "pending"
+            next_attempt = now + random.uniform(0, min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1)))
+        with self._db.transaction() as conn:
+            conn.execute(
+                "UPDATE messages SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                (status, attempts, next_attempt, f"{type(error).__name__}: {error}"[:500], now, message["id"]),
+            )
+            if status == "failed":
+                # Sem novas tentativas, o corpo (que pode conter tokens) também não fica guardado.
+                conn.execute("UPDATE messages SET text_body = NULL, html_body = NULL WHERE id = ?", (message["id"],))
+        print(f"AVISO: Falha ao enviar e-mail {message['id']} para {message['recipient']} "
+              f"(tentativa {attempts}, {status}): {error}")
+
+    # --- Envio ---
+
+    def _build(self, message):
+        mime = MIMEMultipart("alternative")
+        mime["Subject"] = message["subject"]
+        mime["From"] = self.settings.sender
+        mime["To"] = message["recipient"]
+        mime.attach(MIMEText(message["text_body"] or "", "plain"))
+        if message["html_body"]:
+            mime.attach(MIMEText(message["html_body"], "html"))
+        return mime.as_string()
+
+    def send_pending(self) -> int:
+        """Envia um lote de mensagens vencidas por uma conexão do pool; retorna quantas foram enviadas."""
+        batch = self._claim_batch()
+        if not batch:
+            return 0
+        sent = 0
+        try:
+            server = self.pool.acquire()
+        except Exception as e:
+            for message in batch:
+                self._mark_failed(message, e)
+            return 0
+        broken = False
+        try:
+            for message in batch:
+                if broken:
+                    # A conexão caiu no meio do lote: o resto volta para a fila sem contar tentativa.
+                    self._requeue(message)
+                    continue
+                try:
+                    server.sendmail(self.settings.sender, [message["recipient"]], self._build(message))
+                except PERMANENT_ERRORS as e:
+                    self._mark_failed(message, e, permanent=True)
+                    continue
+                except (smtplib.SMTPServerDisconnected, OSError) as e:
+                    broken = True
+                    self._mark_failed(message, e)
+                    continue
+                except smtplib.SMTPException as e:
+                    self._mark_failed(message, e)
+                    continue
+                self._mark_sent(message["id"])
+                sent += 1
+        finally:
+            self.pool.release(server, broken=broken)
+        return sent
+
+    def _requeue(self, message):
+        with self._db.transaction() as conn:
+            conn.execute("UPDATE messages SET status = 'pending', updated_at = ? WHERE id = ?", (time.time(), message["id"]))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                while self.send_pending():
+                    pass
+            except Exception as e:
+                print(f"AVISO: Erro no envio da caixa de saída: {e}")
+            self.pool.close_idle()
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="email-outbox", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.pool.close_idle(max_idle=0)
+
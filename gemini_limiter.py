@@ -0,0 +1,174 @@
+# gemini_limiter.py
+"""
+Limite de requisições e de tokens por minuto do Gemini, compartilhado entre processos.
+
+Cada análise roda em um processo próprio, então um limite em memória não bastaria: o
+estado dos dois baldes de fichas (requisições e tokens de entrada) fica em um arquivo
+SQLite local, atualizado em transações exclusivas. Quem espera entra em uma fila FIFO
+(tabela de senhas), e só a senha mais antiga pode consumir fichas, então nenhuma
+chamada fica para trás indefinidamente. Senhas de processos que morreram expiram.
+
+Uso:
+    waited = get_gemini_limiter().acquire(tokens=1200)  # bloqueia até haver cota
+"""
+import os
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+from sqlite_store import SQLiteFile
+
+# Cota do projeto na API (0 = sem limite naquela dimensão).
+REQUESTS_PER_MINUTE = float(os.environ.get("PDI_GEMINI_RPM", "150"))
+TOKENS_PER_MINUTE = float(os.environ.get("PDI_GEMINI_TPM", "2000000"))
+LIMITER_DB = Path(os.environ.get("PDI_GEMINI_LIMITER_DB", "data_pdi/gemini_limiter.sqlite3"))
+POLL_INTERVAL = 0.1
+# Senhas sem sinal de vida há mais que isso (s) são de processos que morreram.
+STALE_TICKET_SECONDS = 5.0
+
+
+class RateLimitWaitExceeded(Exception):
+    """A cota não ficou disponível dentro do tempo máximo de espera."""
+
+
+class GeminiRateLimiter:
+    """Dois baldes de fichas (requisições e tokens) em SQLite, com fila justa entre processos."""
+
+    def __init__(self, path=LIMITER_DB, requests_per_minute=REQUESTS_PER_MINUTE,
+                 tokens_per_minute=TOKENS_PER_MINUTE):
+        self.path = Path(path)
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._db = SQLiteFile(self.path)
+        with self._db.transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, level REAL, updated_at REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS tickets (id INTEGER PRIMARY KEY AUTOINCREMENT, pid INTEGER, heartbeat REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value REAL)")
+
+    @property
+    def enabled(self):
+        return self.requests_per_minute > 0 or self.tokens_per_minute > 0
+
+    def _buckets(self):
+        # (nome, capacidade, fichas por segundo); a capacidade é a cota de um minuto.
+        buckets = []
+        if self.requests_per_minute > 0:
+            buckets.append(("requests", self.requests_per_minute, self.requests_per_minute / 60))
+        if self.tokens_per_minute > 0:
+            buckets.append(("tokens", self.tokens_per_minute, self.tokens_per_minute / 60))
+        return buckets
+
+    def _levels(self, conn, now):
+        levels = {}
+        for name, capacity, rate in self._buckets():
+            row = conn.execute("SELECT level, updated_at FROM buckets WHERE name = ?", (name,)).fetchone()
+            level = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+            levels[name] = level
+        return levels
+
+    def _save_levels(self, conn, levels, now):
+        for name, level in levels.items():
+            conn.execute("INSERT OR REPLACE INTO buckets (name, level, updated_at) VALUES (?, ?, ?)", (name, level, now))
+
+    def _add_stat(self, conn, name, value, mode="sum"):
+        if mode == "max":
+            conn.execute("INSERT INTO stats (name, value) VALUES (?, ?) "
+                         "ON CONFLICT(name) DO UPDATE SET value = max(value, excluded.value)", (name, value))
+        else:
+            conn.execute("INSERT INTO stats (name, value) VALUES (?, ?) "
+                         "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value", (name, value))
+
+    def acquire(self, tokens=0, max_wait=None) -> float:
+        """
+        Bloqueia até haver cota para uma requisição com `tokens` tokens de entrada e retorna
+        o tempo de espera (s). Levanta RateLimitWaitExceeded se passar de `max_wait`.
+        """
+        if not self.enabled:
+            return 0.0
+        start = time.monotonic()
+        demand = {"requests": 1.0, "tokens": float(tokens or 0)}
+        with self._db.transaction() as conn:
+            ticket = conn.execute("INSERT INTO tickets (pid, heartbeat) VALUES (?, ?)", (os.getpid(), time.time())).lastrowid
+        try:
+            while True:
+                with self._db.transaction() as conn:
+                    now = time.time()
+                    conn.execute("DELETE FROM tickets WHERE heartbeat < ?", (now - STALE_TICKET_SECONDS,))
+                    updated = conn.execute("UPDATE tickets SET heartbeat = ? WHERE id = ?", (now, ticket)).rowcount
+                    if not updated:
+                        # A senha foi tida como abandonada (ex.: o processo ficou suspenso por
+                        # mais que STALE_TICKET_SECONDS): volta para o fim da fila com uma nova.
+                        ticket = conn.execute("INSERT INTO tickets (pid, heartbeat) VALUES (?, ?)",
+                                              (os.getpid(), now)).lastrowid
+                    head = conn.execute("SELECT MIN(id) FROM tickets").fetchone()[0]
+                    delay = POLL_INTERVAL
+                    if head == ticket:
+                        levels = self._levels(conn, now)
+                        delay = 0.0
+                        for name, capacity, rate in self._buckets():
+                            # Um pedido maior que a cota inteira espera o balde encher, não para sempre.
+                            missing = min(demand[name], capacity) - levels[name]
+                            delay = max(delay, missing / rate)
+                        if delay <= 0:
+                            for name in levels:
+                                levels[name] -= demand[name]
+                            self._save_levels(conn, levels, now)
+                            conn.execute("DELETE FROM tickets WHERE id = ?", (ticket,))
+                            ticket = None
+                            waited = time.monotonic() - start
+                            self._add_stat(conn, "acquired", 1)
+                            self._add_stat(conn, "waited", 1 if waited > 0.001 else 0)
+                            self._add_stat(conn, "wait_total_s", waited)
+                            self._add_stat(conn, "wait_max_s", waited, mode="max")
+                            return waited
+                if max_wait is not None and time.monotonic() - start + delay > max_wait:
+                    raise RateLimitWaitExceeded(f"Cota do Gemini indisponível por mais de {max_wait:.0f}s.")
+                time.sleep(min(max(delay, 0.005), POLL_INTERVAL))
+        finally:
+            if ticket is not None:
+                with self._db.transaction() as conn:
+                    conn.execute("DELETE FROM tickets WHERE id = ?", (ticket,))
+
+    def adjust_tokens(self, delta):
+        """Corrige o balde de tokens com a contagem real da API (positivo = consumiu mais que o estimado)."""
+        if self.tokens_per_minute <= 0 or not delta:
+            return
+        try:
+            with self._db.transaction() as conn:
+                now = time.time()
+                levels = self._levels(conn, now)
+                levels["tokens"] -= delta
+                self._save_levels(conn, levels, now)
+        except sqlite3.Error as e:
+            print(f"AVISO: Falha ao corrigir a cota de tokens do Gemini: {e}")
+
+    def stats(self) -> dict:
+        """Totais desde a criação do arquivo, somando todos os processos."""
+        with self._db.transaction() as conn:
+            stats = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+            waiting = conn.execute("SELECT COUNT(*) FROM tickets").fetchone()[0]
+            levels = self._levels(conn, time.time())
+        acquired = stats.get("acquired", 0)
+        return {
+            "acquired": int(acquired),
+            "waited": int(stats.get("waited", 0)),
+            "wait_total_s": round(stats.get("wait_total_s", 0.0), 3),
+            "wait_avg_s": round(stats.get("wait_total_s", 0.0) / acquired, 3) if acquired else 0.0,
+            "wait_max_s": round(stats.get("wait_max_s", 0.0), 3),
+            "waiting_now": waiting,
+            "available": {name: round(level, 1) for name, level in levels.items()},
+        }
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_gemini_limiter() -> GeminiRateLimiter:
+    """Limitador do processo (o estado em si é compartilhado pelo arquivo SQLite)."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = GeminiRateLimiter()
+        return _limiter
@@ -0,0 +1,192 @@
+# gemini_scheduler.py
+"""
+Agendador das chamadas ao Gemini: timeout por chamada, novas tentativas com backoff
+exponencial (com jitter) apenas para erros transitórios, um prazo global por análise e
+espera pela cota compartilhada entre processos (gemini_limiter.py) antes de cada tentativa.
+
+Uso:
+    with gemini_run() as run:          # abre o orçamento de tempo da análise
+        call_with_retry(fn, "secao")   # fn(timeout) faz uma tentativa
+    run.summary()                      # chamadas, novas tentativas, falhas, latências, esperas
+"""
+import os
+import json
+import time
+import random
+import sqlite3
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from google.api_core import exceptions as api_exceptions
+
+from gemini_limiter import get_gemini_limiter, RateLimitWaitExceeded
+
+CALL_TIMEOUT = float(os.environ.get("PDI_GEMINI_CALL_TIMEOUT", "90"))
+MAX_ATTEMPTS = int(os.environ.get("PDI_GEMINI_MAX_ATTEMPTS", "4"))
+BACKOFF_BASE = float(os.environ.get("PDI_GEMINI_BACKOFF_BASE", "1.0"))
+BACKOFF_MAX = float(os.environ.get("PDI_GEMINI_BACKOFF_MAX", "20"))
+RUN_DEADLINE = float(os.environ.get("PDI_ANALYSIS_DEADLINE", "300"))
+
+# Erros que valem uma nova tentativa: limite de cota, indisponibilidade, timeouts e
+# respostas malformadas (o modelo pode acertar o JSON na próxima).
+RETRYABLE_ERRORS = (
+    api_exceptions.TooManyRequests,
+    api_exceptions.ResourceExhausted,
+    api_exceptions.InternalServerError,
+    api_exceptions.BadGateway,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.GatewayTimeout,
+    api_exceptions.DeadlineExceeded,
+    ConnectionError,
+    TimeoutError,
+    json.JSONDecodeError,
+)
+
+
+class DeadlineExhausted(Exception):
+    """O prazo global da análise acabou antes de a chamada ser concluída."""
+
+
+def is_retryable(error: Exception) -> bool:
+    return isinstance(error, RETRYABLE_ERRORS)
+
+
+class GeminiRun:
+    """Prazo e métricas das chamadas de uma análise."""
+
+    def __init__(self, deadline=RUN_DEADLINE):
+        self.started = time.monotonic()
+        self.deadline_at = self.started + deadline
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.latencies = {}  # rótulo -> lista de latências (s) das tentativas
+        self.tokens = {}  # rótulo -> {"input": ..., "output": ..., "estimated": ...}
+        self.quota_waits = {}  # rótulo -> lista de esperas (s) pela cota do Gemini
+
+    def remaining(self) -> float:
+        return self.deadline_at - time.monotonic()
+
+    def record_attempt(self, label, latency, retried):
+        with self._lock:
+            self.calls += 1
+            self.retries += 1 if retried else 0
+            self.latencies.setdefault(label, []).append(round(latency, 3))
+
+    def record_tokens(self, label, input_tokens, output_tokens, estimated=False):
+        with self._lock:
+            entry = self.tokens.setdefault(label, {"input": 0, "output": 0, "estimated": False})
+            entry["input"] += input_tokens or 0
+            entry["output"] += output_tokens or 0
+            entry["estimated"] = entry["estimated"] or estimated
+
+    def record_quota_wait(self, label, waited):
+        with self._lock:
+            self.quota_waits.setdefault(label, []).append(round(waited, 3))
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "failures": self.failures,
+                "elapsed_s": round(time.monotonic() - self.started, 3),
+                "latencies_s": {label: list(values) for label, values in self.latencies.items()},
+                "tokens": {label: dict(values) for label, values in self.tokens.items()},
+                "input_tokens_total": sum(values["input"] for values in self.tokens.values()),
+                "quota_waits_s": {label: list(values) for label, values in self.quota_waits.items()},
+                "quota_wait_total_s": round(sum(sum(values) for values in self.quota_waits.values()), 3),
+            }
+
+
+_current_run = contextvars.ContextVar("gemini_run", default=None)
+
+
+@contextmanager
+def gemini_run(deadline=RUN_DEADLINE):
+    """Abre um orçamento de tempo para todas as chamadas feitas dentro do bloco."""
+    run = GeminiRun(deadline)
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+
+
+def record_tokens(label, input_tokens, output_tokens, estimated=False):
+    """Registra tokens de uma chamada na análise corrente (sem efeito fora de gemini_run)."""
+    run = _current_run.get()
+    if run is not None:
+        run.record_tokens(label, input_tokens, output_tokens, estimated)
+
+
+def submit_in_context(executor, fn, *args):
+    """executor.submit que preserva a análise corrente (contextvars não passam para threads sozinhos)."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def wait_for_quota(label, tokens, run):
+    """Espera pela cota compartilhada do Gemini, sem passar do prazo da análise."""
+    max_wait = run.remaining() if run is not None else None
+    try:
+        waited = get_gemini_limiter().acquire(tokens, max_wait=max_wait)
+    except RateLimitWaitExceeded:
+        if run is not None:
+            run.record_failure()
+        raise DeadlineExhausted(f"Prazo da análise esgotado esperando cota para '{label}'.")
+    except sqlite3.Error as e:
+        # Sem o arquivo do limitador a chamada segue; o backoff ainda cobre os 429.
+        print(f"AVISO: Limitador de cota do Gemini indisponível: {e}")
+        return
+    if run is not None:
+        run.record_quota_wait(label, waited)
+
+
+def call_with_retry(fn, label, tokens=0, max_attempts=MAX_ATTEMPTS, call_timeout=CALL_TIMEOUT):
+    """
+    Executa `fn(timeout)` até ter sucesso, repetindo erros transitórios com backoff
+    exponencial "full jitter" e respeitando o prazo da análise corrente (se houver).
+    Cada tentativa antes espera pela cota de 1 requisição e `tokens` tokens de entrada.
+    Erros não transitórios, a última falha ou o fim do prazo são propagados.
+    """
+    run = _current_run.get()
+    attempt = 0
+    while True:
+        if run is not None and run.remaining() <= 0:
+            run.record_failure()
+            raise DeadlineExhausted(f"Prazo da análise esgotado antes de '{label}'.")
+        wait_for_quota(label, tokens, run)
+        timeout = call_timeout
+        if run is not None:
+            remaining = run.remaining()
+            if remaining <= 0:
+                run.record_failure()
+                raise DeadlineExhausted(f"Prazo da análise esgotado antes de '{label}'.")
+            timeout = min(timeout, remaining)
+
+        start = time.monotonic()
+        try:
+            result = fn(timeout)
+            if run is not None:
+                run.record_attempt(label, time.monotonic() - start, retried=attempt > 0)
+            return result
+        except Exception as e:
+            if run is not None:
+                run.record_attempt(label, time.monotonic() - start, retried=attempt > 0)
+            attempt += 1
+            if not is_retryable(e) or attempt >= max_attempts:
+                if run is not None:
+                    run.record_failure()
+                raise
+            delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)))
+            if run is not None and delay >= run.remaining():
+                run.record_failure()
+                raise
+            print(f"AVISO: Falha transitória em '{label}' ({type(e).__name__}); nova tentativa em {delay:.1f}s.")
+            time.sleep(delay)
@@ -1,6 +1,51 @@
 # linkedin_scraper.py
+import os
 import time
-from playwright.sync_api import sync_playwright, TimeoutError
+import asyncio
+from urllib.parse import urlparse
+from playwright.sync_api import TimeoutError
+from playwright.async_api import async_playwright
+
+from browser_pool import get_browser_pool
+
+# O scraping está desativado por padrão; a análise usa apenas os dados manuais.
+SCRAPING_ENABLED = os.environ.get("PDI_SCRAPING_ENABLED", "0") == "1"
+
+# Rolagem: espera por conteúdo novo no máximo SCROLL_SETTLE_MS após cada rolagem,
+# limitada a MAX_SCROLLS rolagens e SCROLL_BUDGET_S segundos no total.
+SCROLL_SETTLE_MS = int(os.environ.get("PDI_SCROLL_SETTLE_MS", "1500"))
+MAX_SCROLLS = int(os.environ.get("PDI_MAX_SCROLLS", "20"))
+SCROLL_BUDGET_S = float(os.environ.get("PDI_SCROLL_BUDGET_S", "15"))
+
+# Versão assíncrona: raspagens simultâneas e ritmo máximo por host (requisições/segundo).
+ASYNC_CONCURRENCY = int(os.environ.get("PDI_SCRAPE_CONCURRENCY", "4"))
+PER_HOST_RATE = float(os.environ.get("PDI_SCRAPE_PER_HOST_RATE", "1.0"))
+
+# Recursos que não influenciam o texto do perfil e são bloqueados durante o scraping.
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font"}
+BLOCKED_URL_PATTERNS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net",
+    "facebook.net", "connect.facebook", "hotjar.com", "scorecardresearch.com",
+    "ads.linkedin.com", "px.ads.linkedin.com", "snap.licdn.com", "/li/track", "/collect?",
+)
+
+MAIN_CONTENT_SELECTOR = "main.scaffold-layout__main"
+MISSING_CONTENT_MESSAGE = "Erro: Não foi possível encontrar o contêiner principal do perfil."
+HEIGHT_GREW_JS = "height => document.body.scrollHeight > height"
+
+
+def _is_blocked(request) -> bool:
+    return request.resource_type in BLOCKED_RESOURCE_TYPES or any(
+        pattern in request.url for pattern in BLOCKED_URL_PATTERNS
+    )
+
+
+def _block_unneeded_resources(route):
+    """Aborta imagens, fontes, vídeos e scripts de rastreamento; o resto segue normalmente."""
+    if _is_blocked(route.request):
+        return route.abort()
+    return route.continue_()
+
 
 ### VERSÃO 2
 # def scrape_linkedin_profile(url: str) -> str:
@@ -49,9 +94,65 @@ from playwright.sync_api import sync_playwright, TimeoutError
 #             raise e
 
 ### VERSÃO 1
+def _scroll_to_end(page):
+    """
+    Rola até o fim da página esperando sinais reais de conteúdo novo (a altura do
+    documento crescer e a rede se acalmar), em vez de pausas fixas.
+    """
+    deadline = time.monotonic() + SCROLL_BUDGET_S
+    last_height = page.evaluate("document.body.scrollHeight")
+    for _ in range(MAX_SCROLLS):
+        remaining_ms = int((deadline - time.monotonic()) * 1000)
+        if remaining_ms <= 0:
+            print("AVISO: Orçamento de rolagem esgotado; extraindo o que já foi carregado.")
+            break
+        page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+        try:
+            # Resolve assim que o DOM cresce; estoura se nada novo aparecer no prazo.
+            page.wait_for_function(
+                HEIGHT_GREW_JS,
+                arg=last_height,
+                timeout=min(SCROLL_SETTLE_MS, remaining_ms),
+            )
+        except TimeoutError:
+            break
+        try:
+            # Dá uma chance curta para as requisições da seção recém-carregada terminarem.
+            page.wait_for_load_state("networkidle", timeout=min(SCROLL_SETTLE_MS, remaining_ms))
+        except TimeoutError:
+            pass
+        last_height = page.evaluate("document.body.scrollHeight")
+
+
+def _extract_profile_text(context, profile_url: str) -> str:
+    """Abre o perfil em uma página do contexto informado, rola até o fim e extrai o texto."""
+    context.route("**/*", _block_unneeded_resources)
+    page = context.new_page()
+    page.goto(profile_url, wait_until="domcontentloaded", timeout=60000)
+
+    print("Página carregada. Iniciando rolagem para carregar todo o conteúdo...")
+
+    # Rola a página para baixo para garantir que todo o conteúdo dinâmico seja carregado
+    _scroll_to_end(page)
+    
+    print("Rolagem completa. Extraindo texto...")
+
+    # Extrai o texto do contêiner principal do perfil
+    # Este seletor é mais genérico e tende a funcionar mesmo com mudanças no layout
+    main_content = page.locator(MAIN_CONTENT_SELECTOR).first
+    if main_content.is_visible():
+        full_text = main_content.inner_text()
+        print("Texto extraído com sucesso.")
+    else:
+        full_text = MISSING_CONTENT_MESSAGE
+        print(full_text)
+    return full_text
+
+
 def scrape_linkedin_profile(profile_url: str) -> str:
     """
     Navega até um perfil público do LinkedIn e extrai todo o texto visível.
+    Usa um navegador já aquecido do pool (browser_pool.py), em um contexto isolado.
 
     Args:
         profile_url: A URL completa do perfil público do LinkedIn.
@@ -60,51 +161,116 @@ def scrape_linkedin_profile(profile_url: str) -> str:
         Uma string contendo todo o texto extraído do perfil, ou uma mensagem de erro.
     """
     print(f"Iniciando scraping para a URL: {profile_url}")
-    
-    full_text = ""
 
-    with sync_playwright() as p:
-        try:
-            browser = p.chromium.launch(headless=True) # headless=True para rodar em segundo plano
-            page = browser.new_page()
-            page.goto(profile_url, wait_until="domcontentloaded", timeout=60000)
-
-            print("Página carregada. Iniciando rolagem para carregar todo o conteúdo...")
-
-            # Rola a página para baixo para garantir que todo o conteúdo dinâmico seja carregado
-            last_height = page.evaluate("document.body.scrollHeight")
-            while True:
-                page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                time.sleep(2) # Espera o conteúdo carregar
-                new_height = page.evaluate("document.body.scrollHeight")
-                if new_height == last_height:
-                    break
-                last_height = new_height
-            
-            print("Rolagem completa. Extraindo texto...")
+    try:
+        return get_browser_pool().run(lambda context: _extract_profile_text(context, profile_url))
+    except TimeoutError:
+        error_message = f"Erro: A página '{profile_url}' demorou muito para carregar ou é inválida."
+        print(error_message)
+        return error_message
+    except Exception as e:
+        error_message = f"Ocorreu um erro inesperado durante o scraping: {e}"
+        print(error_message)
+        return error_message
+
+
+# --- VERSÃO ASSÍNCRONA (VÁRIOS PERFIS) ---
+class HostRateLimiter:
+    """Garante um intervalo mínimo entre o início de duas requisições ao mesmo host."""
 
-            # Extrai o texto do contêiner principal do perfil
-            # Este seletor é mais genérico e tende a funcionar mesmo com mudanças no layout
-            main_content = page.locator("main.scaffold-layout__main").first
-            if main_content.is_visible():
-                full_text = main_content.inner_text()
-                print("Texto extraído com sucesso.")
-            else:
-                full_text = "Erro: Não foi possível encontrar o contêiner principal do perfil."
-                print(full_text)
+    def __init__(self, rate_per_second: float = PER_HOST_RATE):
+        self.interval = 1 / rate_per_second if rate_per_second > 0 else 0
+        self._next_slot = {}
+        self._lock = asyncio.Lock()
+
+    async def wait(self, url: str):
+        host = urlparse(url).netloc
+        async with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+async def _block_unneeded_resources_async(route):
+    if _is_blocked(route.request):
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+async def _scroll_to_end_async(page):
+    """Mesma estratégia de _scroll_to_end, para a API assíncrona do Playwright."""
+    deadline = time.monotonic() + SCROLL_BUDGET_S
+    last_height = await page.evaluate("document.body.scrollHeight")
+    for _ in range(MAX_SCROLLS):
+        remaining_ms = int((deadline - time.monotonic()) * 1000)
+        if remaining_ms <= 0:
+            break
+        await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+        try:
+            await page.wait_for_function(HEIGHT_GREW_JS, arg=last_height, timeout=min(SCROLL_SETTLE_MS, remaining_ms))
+        except TimeoutError:
+            break
+        try:
+            await page.wait_for_load_state("networkidle", timeout=min(SCROLL_SETTLE_MS, remaining_ms))
+        except TimeoutError:
+            pass
+        last_height = await page.evaluate("document.body.scrollHeight")
 
-            browser.close()
 
+async def _scrape_one_async(browser, profile_url, semaphore, rate_limiter):
+    async with semaphore:
+        await rate_limiter.wait(profile_url)
+        context = await browser.new_context()
+        try:
+            await context.route("**/*", _block_unneeded_resources_async)
+            page = await context.new_page()
+            await page.goto(profile_url, wait_until="domcontentloaded", timeout=60000)
+            await _scroll_to_end_async(page)
+            main_content = page.locator(MAIN_CONTENT_SELECTOR).first
+            if await main_content.is_visible():
+                return profile_url, await main_content.inner_text()
+            return profile_url, MISSING_CONTENT_MESSAGE
         except TimeoutError:
-            error_message = f"Erro: A página '{profile_url}' demorou muito para carregar ou é inválida."
-            print(error_message)
-            return error_message
+            return profile_url, f"Erro: A página '{profile_url}' demorou muito para carregar ou é inválida."
         except Exception as e:
-            error_message = f"Ocorreu um erro inesperado durante o scraping: {e}"
-            print(error_message)
-            return error_message
-            
-    return full_text
+            return profile_url, f"Ocorreu um erro inesperado durante o scraping: {e}"
+        finally:
+            await context.close()
+
+
+async def scrape_linkedin_profiles(profile_urls, concurrency: int = ASYNC_CONCURRENCY,
+                                   per_host_rate: float = PER_HOST_RATE):
+    """
+    Raspa vários perfis ao mesmo tempo, com no máximo `concurrency` páginas abertas e
+    no máximo `per_host_rate` requisições por segundo a cada host.
+    Gerador assíncrono: entrega (url, texto) à medida que cada perfil termina.
+
+    Exemplo:
+        async for url, text in scrape_linkedin_profiles(urls):
+            ...
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    rate_limiter = HostRateLimiter(per_host_rate)
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        try:
+            tasks = [
+                asyncio.create_task(_scrape_one_async(browser, url, semaphore, rate_limiter))
+                for url in profile_urls
+            ]
+            try:
+                for finished in asyncio.as_completed(tasks):
+                    yield await finished
+            finally:
+                # Se o consumidor parar antes do fim, as raspagens pendentes são canceladas.
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            await browser.close()
 
 
 ### VERSÃO 3
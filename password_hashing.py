@@ -0,0 +1,151 @@
+# password_hashing.py
+"""
+Hash e verificação de senhas (bcrypt) fora da thread do script do Streamlit.
+
+O bcrypt é caro de propósito. Executado direto em cada sessão, uma rajada de logins
+ocupa todos os núcleos e trava as demais sessões do servidor. Aqui o trabalho vai para
+um pool pequeno e limitado de threads (o bcrypt libera o GIL), com uma fila máxima:
+acima dela o pedido é recusado na hora, em vez de se acumular.
+
+Também ficam aqui:
+    - a troca transparente do custo: hashes com custo diferente de PDI_BCRYPT_ROUNDS
+      são refeitos no próximo login bem-sucedido (needs_rehash);
+    - o limite de tentativas de login por conta e por IP (LoginThrottle), verificado
+      antes de qualquer bcrypt para que força bruta não consuma CPU.
+"""
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.environ.get("PDI_BCRYPT_ROUNDS", "12"))
+BCRYPT_WORKERS = int(os.environ.get("PDI_BCRYPT_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Pedidos aguardando ou em execução no pool; acima disso o servidor responde "ocupado".
+BCRYPT_MAX_PENDING = int(os.environ.get("PDI_BCRYPT_MAX_PENDING", "32"))
+BCRYPT_TIMEOUT = float(os.environ.get("PDI_BCRYPT_TIMEOUT", "30"))
+
+LOGIN_WINDOW_SECONDS = int(os.environ.get("PDI_LOGIN_WINDOW_MINUTES", "15")) * 60
+LOGIN_MAX_FAILURES_PER_ACCOUNT = int(os.environ.get("PDI_LOGIN_MAX_FAILURES_PER_ACCOUNT", "5"))
+LOGIN_MAX_FAILURES_PER_IP = int(os.environ.get("PDI_LOGIN_MAX_FAILURES_PER_IP", "20"))
+
+
+class HashingBusy(Exception):
+    """O pool de hash está cheio: o pedido foi recusado ou não terminou dentro do prazo."""
+
+
+def hash_rounds(hashed_password: str):
+    """Custo (log2 das rodadas) de um hash bcrypt "$2b$12$...", ou None se o formato for desconhecido."""
+    try:
+        return int(hashed_password.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """Pool limitado de threads para o bcrypt, com custo configurável."""
+
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=BCRYPT_WORKERS, max_pending=BCRYPT_MAX_PENDING,
+                 timeout=BCRYPT_TIMEOUT):
+        self.rounds = rounds
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._lock = threading.Lock()
+        self.stats = {"hashes": 0, "verifications": 0, "rejected_busy": 0, "timeouts": 0}
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.stats["rejected_busy"] += 1
+            raise HashingBusy("Muitas autenticações ao mesmo tempo. Tente novamente em instantes.")
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Quem chama só trata HashingBusy; o hash continua no pool e libera a vaga ao terminar.
+            with self._lock:
+                self.stats["timeouts"] += 1
+            raise HashingBusy("A autenticação demorou demais. Tente novamente em instantes.") from None
+
+    def hash(self, password: str) -> str:
+        with self._lock:
+            self.stats["hashes"] += 1
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        return self._run(bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        with self._lock:
+            self.stats["verifications"] += 1
+        try:
+            return self._run(bcrypt.checkpw, password.encode('utf-8'), hashed_password.encode('utf-8'))
+        except ValueError:
+            return False  # hash corrompido ou em formato desconhecido
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        return hash_rounds(hashed_password) != self.rounds
+
+
+class LoginThrottle:
+    """Janela deslizante de falhas de login por conta e por IP (em memória, por processo)."""
+
+    def __init__(self, window=LOGIN_WINDOW_SECONDS, max_per_account=LOGIN_MAX_FAILURES_PER_ACCOUNT,
+                 max_per_ip=LOGIN_MAX_FAILURES_PER_IP):
+        self.window = window
+        self.limits = {"account": max_per_account, "ip": max_per_ip}
+        self._lock = threading.Lock()
+        self._failures = {}  # (tipo, chave) -> deque de instantes das falhas
+
+    def _keys(self, email, ip):
+        keys = [("account", (email or "").strip().lower())]
+        if ip:
+            keys.append(("ip", ip))
+        return keys
+
+    def retry_after(self, email, ip=None) -> float:
+        """Segundos até a próxima tentativa ser aceita (0 = pode tentar agora)."""
+        now = time.monotonic()
+        wait = 0.0
+        with self._lock:
+            for key in self._keys(email, ip):
+                failures = self._failures.get(key)
+                if not failures:
+                    continue
+                while failures and failures[0] <= now - self.window:
+                    failures.popleft()
+                if len(failures) >= self.limits[key[0]]:
+                    wait = max(wait, failures[0] + self.window - now)
+                if not failures:
+                    del self._failures[key]
+        return wait
+
+    def record_failure(self, email, ip=None):
+        now = time.monotonic()
+        with self._lock:
+            for key in self._keys(email, ip):
+                self._failures.setdefault(key, deque(maxlen=self.limits[key[0]])).append(now)
+
+    def record_success(self, email):
+        with self._lock:
+            self._failures.pop(self._keys(email, None)[0], None)
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+login_throttle = LoginThrottle()
+
+
+def get_password_hasher() -> PasswordHasher:
+    """Pool único por processo, criado no primeiro uso."""
+    global _hasher
+    with _hasher_lock:
+        if _hasher is None:
+            _hasher = PasswordHasher()
+        return _hasher
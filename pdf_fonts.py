@@ -0,0 +1,58 @@
+# pdf_fonts.py
+"""
+Registro de fontes para o FPDF, compartilhado por todo o processo.
+
+pdf.add_font() relê e reprocessa o arquivo TrueType (cmap, métricas, tabela de glifos)
+a cada PDF. Aqui a fonte é processada uma única vez; cada novo PDF recebe uma cópia
+leve que compartilha as métricas e tabelas já calculadas e só ganha o estado próprio
+do documento (subconjunto de glifos e uma instância nova do TTFont, que o FPDF
+recorta no momento de salvar — por isso ela não pode ser compartilhada).
+
+A cópia depende de atributos internos do TTFFont; por isso o fpdf2 está fixado no
+requirements.txt e tests/test_pdf_fonts.py compara o resultado com o de pdf.add_font().
+Ao atualizar o fpdf2, rode esse teste antes.
+"""
+import copy
+import threading
+from io import BytesIO
+
+from fpdf import FPDF
+from fpdf.fonts import SubsetMap, TTFFont
+from fontTools import ttLib
+
+_lock = threading.Lock()
+_templates = {}  # (family, style, caminho) -> (TTFFont processada, bytes do arquivo)
+
+
+def _get_template(family, style, font_path):
+    key = (family.lower(), style, str(font_path))
+    with _lock:
+        if key not in _templates:
+            parser = FPDF()
+            parser.add_font(family, style, font_path)
+            template = parser.fonts[f"{family.lower()}{style}"]
+            with open(font_path, "rb") as f:
+                font_bytes = f.read()
+            _templates[key] = (template, font_bytes)
+        return _templates[key]
+
+
+def add_cached_font(pdf, family, style, font_path):
+    """Equivalente a pdf.add_font(family, style, font_path), reaproveitando a fonte já processada."""
+    fontkey = f"{family.lower()}{style}"
+    if fontkey in pdf.fonts:
+        return
+    template, font_bytes = _get_template(family, style, font_path)
+    if not isinstance(template, TTFFont) or template.color_font is not None:
+        # Fontes coloridas guardam estado ligado ao documento: usa o caminho padrão.
+        pdf.add_font(family, style, font_path)
+        return
+
+    font = copy.copy(template)
+    font.i = len(pdf.fonts) + 1
+    font.ttfont = ttLib.TTFont(BytesIO(font_bytes), recalcTimestamp=False, lazy=True)
+    font._hbfont = None
+    font.missing_glyphs = []
+    font.biggest_size_pt = 0
+    font.subset = SubsetMap(font)
+    pdf.fonts[fontkey] = font
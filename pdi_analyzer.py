@@ -3,14 +3,27 @@ import google.generativeai as genai
 import json
 from pathlib import Path
 import traceback
-from datetime import date, timedelta
-import subprocess
+from datetime import date, datetime, timedelta
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Importa a função de scraping
-from linkedin_scraper import scrape_linkedin_profile
+from linkedin_scraper import scrape_linkedin_profile, SCRAPING_ENABLED
+from browser_setup import is_browser_ready
+# Cache do texto raspado dos perfis
+from profile_cache import get_profile_cache, get_cached_profile_text, store_profile_text
 # Importa as funções de dados do auth.py
 from auth import load_pdi_data_from_firestore
+# Cache persistente dos resultados das seções
+from ai_cache import get_section_cache, make_cache_key
+# Novas tentativas, timeouts e prazo global das chamadas ao Gemini
+from gemini_scheduler import call_with_retry, gemini_run, record_tokens, submit_in_context
+# Cota de requisições/tokens do Gemini compartilhada entre os processos de análise
+from gemini_limiter import get_gemini_limiter
+# Seleção e compactação dos dados enviados em cada prompt
+from prompt_builder import prompt_data, section_inputs, estimate_tokens
+# Medição do tempo de cada etapa
+from timing import recording, span
 
 # Tenta importar a chave de API do config.py para desenvolvimento local
 try:
@@ -32,42 +45,139 @@ except (AttributeError, KeyError, FileNotFoundError, ImportError):
         print("AVISO: Chave da API do Gemini não configurada em st.secrets ou config.py.")
         pass
 
-model = genai.GenerativeModel('gemini-2.5-pro')
+MODEL_NAME = 'gemini-2.5-pro'
+model = genai.GenerativeModel(MODEL_NAME)
+
+# Versão dos prompts. Incremente ao alterar qualquer prompt para invalidar o cache da IA.
+PROMPT_VERSION = 2
+
+# Número máximo de seções geradas em paralelo (1 = execução sequencial).
+MAX_CONCURRENT_SECTIONS = int(os.environ.get("PDI_MAX_CONCURRENT_SECTIONS", "7"))
+
+# Modo de geração do diagnóstico:
+#   "parallel"     -> uma chamada por seção (executadas em paralelo)
+#   "consolidated" -> uma única chamada com todas as seções; só as que falharem são refeitas
+ANALYSIS_MODE = os.environ.get("PDI_ANALYSIS_MODE", "parallel")
+
+# Lê a resposta consolidada em streaming, entregando cada seção assim que ela fica completa.
+STREAM_RESPONSES = os.environ.get("PDI_STREAM_RESPONSES", "1") == "1"
 
 # --- FUNÇÕES DE ANÁLISE DA IA (SEPARADAS) ---
 
+def record_usage(label, prompt, response):
+    """Registra os tokens de entrada/saída da chamada (contagem da API, ou estimativa se ausente)."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None and getattr(usage, "prompt_token_count", None):
+        record_tokens(label, usage.prompt_token_count, getattr(usage, "candidates_token_count", 0) or 0)
+        # A cota foi reservada com a estimativa; acerta o balde com a contagem real.
+        get_gemini_limiter().adjust_tokens(usage.prompt_token_count - estimate_tokens(prompt))
+    else:
+        record_tokens(label, estimate_tokens(prompt), None, estimated=True)
+
+def generate_json(prompt, label):
+    """Chama a API (com novas tentativas em erros transitórios) e devolve a resposta convertida de JSON."""
+    def attempt(timeout):
+        with span(f"gemini:{label}"):
+            response = model.generate_content(prompt, request_options={"timeout": timeout})
+        record_usage(label, prompt, response)
+        with span("json_parse"):
+            cleaned_response = response.text.strip().replace("```json", "").replace("```", "")
+            return json.loads(cleaned_response)
+    return call_with_retry(attempt, label, tokens=estimate_tokens(prompt))
+
+class SectionStreamParser:
+    """
+    Lê um objeto JSON recebido em pedaços e devolve cada par chave/valor de primeiro
+    nível assim que ele se completa. Texto fora do objeto (ex.: ```json) é ignorado.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.item_start = None
+        self.result = {}
+
+    def feed(self, chunk):
+        """Acrescenta um pedaço da resposta e retorna a lista de (chave, valor) recém-completados."""
+        self.buffer += chunk
+        completed = []
+        while self.pos < len(self.buffer):
+            ch = self.buffer[self.pos]
+            if self.depth == 0:
+                if ch == "{":
+                    self.depth = 1
+            elif self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+                if self.depth == 1 and self.item_start is None:
+                    self.item_start = self.pos
+            elif ch in "{[":
+                self.depth += 1
+            elif ch in "}]" or (ch == "," and self.depth == 1):
+                if self.depth == 1:
+                    completed.extend(self._flush())
+                if ch != ",":
+                    self.depth -= 1
+            self.pos += 1
+        return completed
+
+    def _flush(self):
+        if self.item_start is None:
+            return []
+        item = self.buffer[self.item_start:self.pos]
+        self.item_start = None
+        try:
+            parsed = json.loads("{" + item + "}")
+        except json.JSONDecodeError:
+            return []
+        self.result.update(parsed)
+        return list(parsed.items())
+
+# Prefixo do texto exibido no lugar de uma seção que falhou; nunca é uma seção válida.
+SECTION_ERROR_PREFIX = "Erro ao gerar esta seção"
+
 def call_gemini_api(prompt, response_key):
     """Função genérica para chamar a API e extrair a resposta."""
     try:
-        response = model.generate_content(prompt)
-        cleaned_response = response.text.strip().replace("```json", "").replace("```", "")
-        result = json.loads(cleaned_response)
+        result = generate_json(prompt, response_key)
         return result.get(response_key)
     except Exception as e:
         print(f"Erro na chamada da API para '{response_key}': {e}")
-        return f"Erro ao gerar esta seção: {e}"
+        return f"{SECTION_ERROR_PREFIX}: {e}"
 
 def get_analise_geral(profile, plan):
+    profile_json, plan_json = prompt_data("analise_geral", profile, plan)
     prompt = f"""
     Baseado no perfil e plano de carreira abaixo, escreva uma análise geral concisa (3-4 frases) sobre a coerência, ambição e realismo do plano.
-    PERFIL: {json.dumps(profile)}
-    PLANO: {json.dumps(plan)}
+    PERFIL: {profile_json}
+    PLANO: {plan_json}
     Responda APENAS com um objeto JSON com a chave "analise_geral".
     """
     return call_gemini_api(prompt, "analise_geral")
 
 def get_tipo_empresa_ideal(profile, plan):
+    profile_json, _ = prompt_data("tipo_empresa_ideal", profile, plan)
     prompt = f"""
     Com base no objetivo final de '{plan.get('objetivo_final')}' e no perfil abaixo, descreva o tipo de empresa (cultura, setor, tamanho) onde este profissional teria mais chances de prosperar.
-    PERFIL: {json.dumps(profile)}
+    PERFIL: {profile_json}
     Responda APENAS com um objeto JSON com a chave "tipo_empresa_ideal" contendo as chaves "cultura", "setor" e "tamanho".
     """
     return call_gemini_api(prompt, "tipo_empresa_ideal")
 
 def get_sugestao_cargos_similares(profile, plan):
+    profile_json, _ = prompt_data("sugestao_cargos_similares", profile, plan)
     prompt = f"""
     Analisando o perfil e o objetivo de '{plan.get('objetivo_final')}', sugira uma lista de 2 a 3 títulos de cargos alternativos ou complementares.
-    PERFIL: {json.dumps(profile)}
+    PERFIL: {profile_json}
     Responda APENAS com um objeto JSON com a chave "sugestao_cargos_similares" contendo uma lista de strings.
     """
     return call_gemini_api(prompt, "sugestao_cargos_similares")
@@ -77,98 +187,332 @@ def get_plano_smart(profile, plan):
     target_date = today + timedelta(days=365)
     today_str = today.strftime("%d/%m/%Y")
     target_date_str = target_date.strftime("%d/%m/%Y")
+    profile_json, plan_json = prompt_data("plano_smart_1_ano", profile, plan)
 
     prompt = f"""
-    A data de hoje é {today_str}. Crie um plano de ação SMART detalhado para a meta de 1 ano: '{plan.get('metas_temporais', {}).get('1_ano', {})}'.
+    A data de hoje é {today_str}. Crie um plano de ação SMART detalhado para a meta de 1 ano do plano abaixo: {plan_json}.
     Responda APENAS com um objeto JSON com a chave "plano_smart_1_ano" contendo as chaves "S", "M", "A", "R", "T".
     Para "S" e "R", gere um texto simples.
     Para "M", gere uma lista de dicionários, cada um com as chaves "metrica" e "detalhe".
     Para "A", gere um dicionário com as chaves "Acoes_Especificas" e "Recursos_Necessarios", ambas contendo listas de strings.
     Para "T", gere um dicionário com as chaves "cronograma" (uma lista de dicionários, cada um com "trimestre", "foco" e "acoes" [lista de strings]) e "data_limite" (com o valor **{target_date_str}**).
-    PERFIL: {json.dumps(profile)}
+    PERFIL: {profile_json}
     """
     return call_gemini_api(prompt, "plano_smart_1_ano")
 
 def get_proximos_passos(profile, plan):
+    _, plan_json = prompt_data("proximos_passos", profile, plan)
     prompt = f"""
     Com base no plano de carreira, liste de 3 a 5 ações práticas e imediatas que este profissional deve tomar nos próximos 3 meses.
-    PLANO: {json.dumps(plan)}
+    PLANO: {plan_json}
     Responda APENAS com um objeto JSON com a chave "proximos_passos" contendo uma lista de strings.
     """
     return call_gemini_api(prompt, "proximos_passos")
 
 def get_recomendacoes_focadas(profile, plan):
+    profile_json, plan_json = prompt_data("recomendacoes_focadas", profile, plan)
     prompt = f"""
-    Com base nos 'Pontos a Melhorar' ({profile.get('pontos_a_melhorar', [])}) e no objetivo de carreira, forneça 2 ou 3 recomendações diretas sobre como o profissional pode trabalhar nesses pontos para acelerar seus objetivos.
+    Com base nos 'Pontos a Melhorar' ({profile_json}) e no objetivo de carreira ({plan_json}), forneça 2 ou 3 recomendações diretas sobre como o profissional pode trabalhar nesses pontos para acelerar seus objetivos.
     Responda APENAS com um objeto JSON com a chave "recomendacoes_focadas" contendo uma lista de dicionários (com chaves "foco" e "recomendacao").
     """
     return call_gemini_api(prompt, "recomendacoes_focadas")
 
 def get_plano_de_acao_ia(profile, plan):
+    _, plan_json = prompt_data("plano_de_acao_ia", profile, plan)
     prompt = f"""
     Para cada período do plano de carreira abaixo, crie uma lista de 3 a 5 ações/marcos concretos que o profissional deve alcançar para se manter na trilha certa.
-    PLANO: {json.dumps(plan)}
+    PLANO: {plan_json}
     Responda APENAS com um objeto JSON com a chave "plano_de_acao_ia" contendo as chaves "1_ano", "3_anos", "5_anos", "10_anos", "15_anos", cada uma com uma lista de strings.
     """
     return call_gemini_api(prompt, "plano_de_acao_ia")
 
+def get_diagnostico_consolidado(profile, plan, on_section=None):
+    """
+    Pede todas as seções do diagnóstico em uma única chamada. Retorna um dict (possivelmente incompleto).
+    Com STREAM_RESPONSES, `on_section(chave, valor)` é chamado para cada seção assim que ela chega.
+    """
+    today = date.today()
+    target_date_str = (today + timedelta(days=365)).strftime("%d/%m/%Y")
+    profile_json, plan_json = prompt_data("diagnostico_consolidado", profile, plan)
+
+    prompt = f"""
+    A data de hoje é {today.strftime("%d/%m/%Y")}. Você é um consultor de carreira. Com base no perfil e no plano de carreira abaixo, gere um diagnóstico completo.
+    PERFIL: {profile_json}
+    PLANO: {plan_json}
+    Responda APENAS com um objeto JSON contendo exatamente as chaves abaixo:
+    - "analise_geral": uma análise geral concisa (3-4 frases) sobre a coerência, ambição e realismo do plano.
+    - "tipo_empresa_ideal": o tipo de empresa onde o profissional teria mais chances de prosperar, com as chaves "cultura", "setor" e "tamanho".
+    - "sugestao_cargos_similares": uma lista de 2 a 3 títulos de cargos alternativos ou complementares ao objetivo final (lista de strings).
+    - "plano_smart_1_ano": plano de ação SMART para a meta de 1 ano, com as chaves "S", "M", "A", "R", "T".
+      Para "S" e "R", gere um texto simples.
+      Para "M", gere uma lista de dicionários, cada um com as chaves "metrica" e "detalhe".
+      Para "A", gere um dicionário com as chaves "Acoes_Especificas" e "Recursos_Necessarios", ambas contendo listas de strings.
+      Para "T", gere um dicionário com as chaves "cronograma" (uma lista de dicionários, cada um com "trimestre", "foco" e "acoes" [lista de strings]) e "data_limite" (com o valor **{target_date_str}**).
+    - "proximos_passos": de 3 a 5 ações práticas e imediatas para os próximos 3 meses (lista de strings).
+    - "recomendacoes_focadas": 2 ou 3 recomendações sobre como trabalhar os 'Pontos a Melhorar', como uma lista de dicionários (com chaves "foco" e "recomendacao").
+    - "plano_de_acao_ia": para cada período do plano, de 3 a 5 ações/marcos concretos, com as chaves "1_ano", "3_anos", "5_anos", "10_anos", "15_anos", cada uma com uma lista de strings.
+    """
+    if not STREAM_RESPONSES:
+        try:
+            result = generate_json(prompt, "diagnostico_consolidado")
+            return result if isinstance(result, dict) else {}
+        except Exception as e:
+            print(f"Erro na chamada consolidada da API: {e}")
+            return {}
+
+    def attempt(timeout):
+        parser = SectionStreamParser()
+        chunk = None
+        try:
+            # O JSON é lido durante o streaming, então a etapa inclui a conversão.
+            with span("gemini:diagnostico_consolidado"):
+                for chunk in model.generate_content(prompt, stream=True, request_options={"timeout": timeout}):
+                    for key, value in parser.feed(chunk.text):
+                        if on_section is not None:
+                            on_section(key, value)
+        except Exception as e:
+            if not parser.result:
+                raise  # nada aproveitável: deixa o agendador tentar de novo
+            # As seções que já chegaram completas são mantidas; o resto será refeito.
+            print(f"Erro no meio da resposta consolidada: {e}")
+        # No streaming, a contagem de tokens vem no último pedaço recebido.
+        record_usage("diagnostico_consolidado", prompt, chunk)
+        return parser.result
+
+    try:
+        return call_with_retry(attempt, "diagnostico_consolidado", tokens=estimate_tokens(prompt))
+    except Exception as e:
+        print(f"Erro na chamada consolidada da API: {e}")
+        return {}
+
+# Tipo esperado de cada seção; usado para decidir o que precisa ser refeito no modo consolidado.
+SECTION_TYPES = {
+    "analise_geral": str,
+    "tipo_empresa_ideal": dict,
+    "sugestao_cargos_similares": list,
+    "plano_smart_1_ano": dict,
+    "proximos_passos": list,
+    "recomendacoes_focadas": list,
+    "plano_de_acao_ia": dict,
+}
+
+def is_valid_section(key, value):
+    """
+    Retorna True se o valor da seção existe, não está vazio e tem o tipo esperado.
+    O texto de erro de call_gemini_api é recusado mesmo nas seções de texto.
+    """
+    if key not in SECTION_TYPES or not value or not isinstance(value, SECTION_TYPES[key]):
+        return False
+    if isinstance(value, str) and value.startswith(SECTION_ERROR_PREFIX):
+        return False
+    if key == "recomendacoes_focadas":
+        return all(isinstance(rec, dict) for rec in value)
+    return True
+
+# Seções do diagnóstico: (chave em ai_analysis, função geradora, mensagem de progresso).
+# As chamadas são independentes entre si e podem rodar em paralelo.
+SECTIONS = [
+    ("analise_geral", get_analise_geral, "Análise Geral"),
+    ("tipo_empresa_ideal", get_tipo_empresa_ideal, "Perfil de Empresa Ideal"),
+    ("sugestao_cargos_similares", get_sugestao_cargos_similares, "Cargos Similares"),
+    ("plano_smart_1_ano", get_plano_smart, "Plano SMART"),
+    ("proximos_passos", get_proximos_passos, "Próximos Passos"),
+    ("recomendacoes_focadas", get_recomendacoes_focadas, "Recomendações Focadas"),
+    ("plano_de_acao_ia", get_plano_de_acao_ia, "Plano de Ação Detalhado"),
+]
+
+def report_section(q_to_ui, key, value):
+    """Envia uma seção pronta para a UI, que pode exibi-la antes do fim da análise."""
+    if is_valid_section(key, value):
+        q_to_ui.put({"status": "section", "key": key, "value": value})
+
+def run_sections(q_to_ui, profile, plan, max_workers=None, sections=None):
+    """
+    Gera as seções do diagnóstico (todas, ou apenas `sections`), com no máximo
+    `max_workers` chamadas simultâneas.
+    Envia uma mensagem de progresso para a UI à medida que cada seção termina.
+    """
+    selected = [s for s in SECTIONS if sections is None or s[0] in sections]
+    if max_workers is None:
+        max_workers = MAX_CONCURRENT_SECTIONS
+    max_workers = max(1, min(max_workers, len(selected)))
+    total = len(selected)
+    ai_analysis = {}
+
+    q_to_ui.put({"status": "info", "message": f"Gerando {total} seções do diagnóstico..."})
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            submit_in_context(executor, func, profile, plan): (key, label)
+            for key, func, label in selected
+        }
+        for future in as_completed(futures):
+            key, label = futures[future]
+            ai_analysis[key] = future.result()
+            report_section(q_to_ui, key, ai_analysis[key])
+            q_to_ui.put({
+                "status": "info",
+                "message": f"Seção concluída ({len(ai_analysis)}/{total}): {label}",
+            })
+
+    # Mantém a ordem original das chaves no documento salvo.
+    return {key: ai_analysis[key] for key, _, _ in selected}
+
+def run_consolidated(q_to_ui, profile, plan, max_workers=None):
+    """
+    Gera o diagnóstico em uma única chamada. As seções ausentes ou malformadas
+    são refeitas individualmente pelas funções get_* correspondentes.
+    """
+    q_to_ui.put({"status": "info", "message": "Gerando o diagnóstico completo..."})
+    result = get_diagnostico_consolidado(
+        profile, plan, on_section=lambda key, value: report_section(q_to_ui, key, value)
+    )
+
+    ai_analysis = {}
+    missing = []
+    for key, _, _ in SECTIONS:
+        if is_valid_section(key, result.get(key)):
+            ai_analysis[key] = result[key]
+        else:
+            missing.append(key)
+
+    if missing:
+        print(f"AVISO: Seções refeitas individualmente: {', '.join(missing)}")
+        ai_analysis.update(run_sections(q_to_ui, profile, plan, max_workers, sections=missing))
+
+    return {key: ai_analysis[key] for key, _, _ in SECTIONS}
+
+# Seções cujo prompt usa a data de hoje (o plano SMART tem cronograma e data-limite a
+# partir dela, também no prompt consolidado): a data entra na chave do cache.
+DATE_DEPENDENT_SECTIONS = {"plano_smart_1_ano"}
+
+def section_cache_key(key, profile, plan, today=None):
+    """Chave do cache de uma seção: tudo o que o prompt dela usa, inclusive a data quando for o caso."""
+    inputs = section_inputs(key, profile, plan)
+    if key in DATE_DEPENDENT_SECTIONS:
+        inputs = {**inputs, "today": (today or date.today()).isoformat()}
+    return make_cache_key(key, PROMPT_VERSION, MODEL_NAME, inputs)
+
+def load_cached_sections(q_to_ui, cache, profile, plan):
+    """
+    Busca no cache as seções cujo conteúdo de entrada não mudou.
+    Retorna (seções encontradas, chave de cache de cada seção).
+    """
+    keys = {key: section_cache_key(key, profile, plan) for key, _, _ in SECTIONS}
+    hits = {}
+    if cache is not None:
+        for key, cache_key in keys.items():
+            try:
+                value = cache.get(cache_key)
+            except Exception as e:
+                print(f"AVISO: Falha ao ler o cache para '{key}': {e}")
+                value = None
+            if is_valid_section(key, value):
+                hits[key] = value
+                report_section(q_to_ui, key, value)
+
+    misses = [key for key in keys if key not in hits]
+    q_to_ui.put({
+        "status": "info",
+        "message": f"Cache: {len(hits)} seção(ões) reaproveitada(s), {len(misses)} a gerar.",
+        "cache": {"hits": list(hits), "misses": misses},
+    })
+    return hits, keys
+
+def store_cached_sections(cache, keys, ai_analysis):
+    """Grava no cache as seções válidas (respostas de erro nunca são guardadas)."""
+    if cache is None:
+        return
+    for key, value in ai_analysis.items():
+        if not is_valid_section(key, value):
+            continue
+        try:
+            cache.set(keys[key], value)
+        except Exception as e:
+            print(f"AVISO: Falha ao gravar o cache para '{key}': {e}")
+
+def generate_analysis(q_to_ui, profile, plan, max_workers=None, mode=None):
+    """
+    Monta o diagnóstico completo: reaproveita as seções em cache e gera apenas as que faltam,
+    no modo configurado ("consolidated" só é usado quando nenhuma seção está em cache).
+    """
+    cache = get_section_cache()
+    ai_analysis, keys = load_cached_sections(q_to_ui, cache, profile, plan)
+    missing = [key for key, _, _ in SECTIONS if key not in ai_analysis]
+
+    if missing:
+        if (mode or ANALYSIS_MODE) == "consolidated" and len(missing) == len(SECTIONS):
+            generated = run_consolidated(q_to_ui, profile, plan, max_workers)
+        else:
+            generated = run_sections(q_to_ui, profile, plan, max_workers, sections=missing)
+        store_cached_sections(cache, keys, generated)
+        ai_analysis.update(generated)
+
+    return {key: ai_analysis[key] for key, _, _ in SECTIONS}
+
 # --- FUNÇÃO PRINCIPAL DO PROCESSO ---
-def run_full_analysis_process(q_to_ui, user_email):
+def run_full_analysis_process(q_to_ui, user_email, max_workers=None, mode=None):
     """
     Função alvo para o multiprocessing. Executa o scraping e a análise em um processo separado.
+    `mode` escolhe entre "consolidated" e "parallel" (padrão: ANALYSIS_MODE). No modo
+    paralelo as seções são limitadas por `max_workers` (padrão: MAX_CONCURRENT_SECTIONS).
+    O tempo de cada etapa é enviado como {"status": "spans"} e salvo em "analysis_timings".
+    Se alguma seção falhar, o resultado é {"status": "error", "failed_sections": [...]}.
     """
     try:
-        # --- INÍCIO DA MODIFICAÇÃO ---
-        # REMOVEMOS a flag "--with-deps" para que o comando não peça permissão de administrador.
-        # O arquivo packages.txt já cuidou das dependências do sistema.
-        q_to_ui.put({"status": "info", "message": "Inicializando análise... Verificando navegador..."})
-        try:
-            # O comando agora apenas baixa o binário do navegador.
-            subprocess.run(["playwright", "install"], check=True, timeout=180)
-            q_to_ui.put({"status": "info", "message": "Navegador pronto."})
-        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError) as e:
-            error_message = f"Falha crítica ao instalar navegador com Playwright: {e}."
-            print(error_message)
-            q_to_ui.put({"status": "error", "message": error_message})
+        with recording() as spans:
+            q_to_ui.put({"status": "info", "message": "Lendo seu perfil..."})
+            pdi_data = load_pdi_data_from_firestore(user_email)
+
+            linkedin_url = pdi_data.get("profile", {}).get("linkedin_url")
+            if not linkedin_url: raise ValueError("URL do LinkedIn não encontrada no perfil.")
+
+            if SCRAPING_ENABLED:
+                profile_cache = get_profile_cache()
+                with span("profile_cache"):
+                    full_text = get_cached_profile_text(profile_cache, linkedin_url)
+                if full_text is not None:
+                    print("Texto do LinkedIn reaproveitado do cache de perfis.")
+                else:
+                    # O navegador é instalado uma única vez no início do servidor (browser_setup.py).
+                    with span("browser_check"):
+                        browser_ready = is_browser_ready()
+                    if not browser_ready:
+                        q_to_ui.put({"status": "error", "message": "O navegador ainda está sendo preparado. Tente novamente em alguns minutos."})
+                        return
+                    q_to_ui.put({"status": "info", "message": "Lendo seu perfil no LinkedIn..."})
+                    with span("scrape"):
+                        scraped = scrape_linkedin_profile(linkedin_url)
+                    full_text = store_profile_text(profile_cache, linkedin_url, scraped)
+            else:
+                full_text = ""
+                print("AVISO: Scraping do LinkedIn está desativado. A análise usará apenas os dados manuais.")
+            pdi_data["profile"]["full_linkedin_text"] = full_text
+
+            profile = pdi_data["profile"]
+            plan = pdi_data["pdi_plan"]
+            with gemini_run() as run, span("ai_generation"):
+                ai_analysis = generate_analysis(q_to_ui, profile, plan, max_workers, mode)
+        metrics = run.summary()
+        print(f"Métricas das chamadas ao Gemini: {json.dumps(metrics)}")
+        q_to_ui.put({"status": "metrics", "data": metrics})
+
+        timings = spans.as_list()
+        if timings:
+            q_to_ui.put({"status": "spans", "data": timings})
+            pdi_data["analysis_timings"] = {"recorded_at": datetime.now().isoformat(), "spans": timings}
+
+        # Seções que falharam (tentativas ou prazo esgotados) não são salvas: a análise
+        # termina em erro e as seções válidas já ficaram no cache para a próxima vez.
+        failed = [key for key, _, _ in SECTIONS if not is_valid_section(key, ai_analysis.get(key))]
+        if failed:
+            labels = ", ".join(label for key, _, label in SECTIONS if key in failed)
+            q_to_ui.put({
+                "status": "error",
+                "message": f"Não foi possível gerar: {labels}. Tente novamente em alguns minutos; "
+                           "as seções já geradas serão reaproveitadas.",
+                "failed_sections": failed,
+            })
             return
-        # --- FIM DA MODIFICAÇÃO ---
-
-        # O resto da sua função continua exatamente igual...
-        q_to_ui.put({"status": "info", "message": "Passo 1/8: Lendo seu perfil no LinkedIn..."})
-        pdi_data = load_pdi_data_from_firestore(user_email)
-        
-        linkedin_url = pdi_data.get("profile", {}).get("linkedin_url")
-        if not linkedin_url: raise ValueError("URL do LinkedIn não encontrada no perfil.")
-            
-        #full_text = scrape_linkedin_profile(linkedin_url)
-        full_text = ""
-        pdi_data["profile"]["full_linkedin_text"] = full_text
-        print("AVISO: Scraping do LinkedIn está desativado. A análise usará apenas os dados manuais.")
-
-        profile = pdi_data["profile"]
-        plan = pdi_data["pdi_plan"]
-        ai_analysis = {}
-
-        q_to_ui.put({"status": "info", "message": "Passo 2/8: Gerando Análise Geral..."})
-        ai_analysis["analise_geral"] = get_analise_geral(profile, plan)
-        
-        q_to_ui.put({"status": "info", "message": "Passo 3/8: Definindo Perfil de Empresa Ideal..."})
-        ai_analysis["tipo_empresa_ideal"] = get_tipo_empresa_ideal(profile, plan)
-
-        q_to_ui.put({"status": "info", "message": "Passo 4/8: Sugerindo Cargos Similares..."})
-        ai_analysis["sugestao_cargos_similares"] = get_sugestao_cargos_similares(profile, plan)
-
-        q_to_ui.put({"status": "info", "message": "Passo 5/8: Criando seu Plano SMART..."})
-        ai_analysis["plano_smart_1_ano"] = get_plano_smart(profile, plan)
-
-        q_to_ui.put({"status": "info", "message": "Passo 6/8: Listando Próximos Passos..."})
-        ai_analysis["proximos_passos"] = get_proximos_passos(profile, plan)
-
-        q_to_ui.put({"status": "info", "message": "Passo 7/8: Gerando Recomendações Focadas..."})
-        ai_analysis["recomendacoes_focadas"] = get_recomendacoes_focadas(profile, plan)
-
-        q_to_ui.put({"status": "info", "message": "Passo 8/8: Construindo Plano de Ação Detalhado..."})
-        ai_analysis["plano_de_acao_ia"] = get_plano_de_acao_ia(profile, plan)
 
         pdi_data["ai_analysis"] = ai_analysis
         q_to_ui.put({"status": "complete", "data": pdi_data})
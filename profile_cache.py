@@ -0,0 +1,109 @@
+# profile_cache.py
+"""
+Cache do texto extraído dos perfis do LinkedIn.
+
+Os perfis mudam pouco entre dois diagnósticos, então o texto raspado é guardado
+por um tempo (TTL) e reaproveitado sem abrir o navegador. A chave é a URL do perfil
+normalizada (https://www.linkedin.com/in/<slug>), e o texto é normalizado (espaços,
+linhas repetidas e rótulos de interface como "Ver mais") antes de ser gravado.
+
+O armazenamento usa os mesmos backends do cache das seções (ai_cache.DiskCache e
+ai_cache.FirestoreCache), em um diretório/coleção próprios e com o valor comprimido.
+"""
+import os
+import hashlib
+from pathlib import Path
+from urllib.parse import urlparse, unquote
+
+from ai_cache import DiskCache, FirestoreCache
+from prompt_builder import normalize_text
+
+# Configuração via variáveis de ambiente.
+PROFILE_CACHE_BACKEND = os.environ.get("PDI_PROFILE_CACHE_BACKEND", "disk")  # "disk", "firestore" ou "none"
+PROFILE_CACHE_DIR = Path(os.environ.get("PDI_PROFILE_CACHE_DIR", "data_pdi/profile_cache"))
+PROFILE_CACHE_COLLECTION = os.environ.get("PDI_PROFILE_CACHE_COLLECTION", "pdi_profile_cache")
+PROFILE_CACHE_TTL_SECONDS = int(os.environ.get("PDI_PROFILE_CACHE_TTL_DAYS", "30")) * 24 * 3600
+PROFILE_CACHE_MAX_ENTRIES = int(os.environ.get("PDI_PROFILE_CACHE_MAX_ENTRIES", "5000"))
+PROFILE_CACHE_MAX_BYTES = int(os.environ.get("PDI_PROFILE_CACHE_MAX_MB", "100")) * 1024 * 1024
+
+# Rótulos de botões e avisos da página que não dizem nada sobre o perfil.
+BOILERPLATE_LINES = frozenset({
+    "ver mais", "ver menos", "…ver mais", "... ver mais", "mostrar mais", "mostrar menos",
+    "exibir tudo", "mostrar todos", "see more", "see less", "show all", "show more", "…see more",
+    "entrar", "cadastre-se", "cadastre-se agora", "sign in", "join now", "join", "seguir", "follow",
+    "conectar", "connect", "enviar mensagem", "message", "mais", "more",
+    "denunciar este perfil", "report this profile",
+})
+
+# Mensagens de erro devolvidas por scrape_linkedin_profile: nunca entram no cache.
+SCRAPE_ERROR_PREFIXES = ("Erro:", "Ocorreu um erro")
+
+
+def normalize_profile_url(url: str) -> str:
+    """
+    Forma canônica da URL de um perfil: https, host www.linkedin.com (sem subdomínio de
+    país), slug em minúsculas, sem parâmetros, fragmento ou barra final.
+    """
+    url = (url or "").strip()
+    if "://" not in url:
+        url = "https://" + url
+    parsed = urlparse(url)
+    host = parsed.netloc.lower().split("@")[-1].split(":")[0]
+    if host == "linkedin.com" or host.endswith(".linkedin.com"):
+        host = "www.linkedin.com"
+    path = unquote(parsed.path).rstrip("/")
+    if host == "www.linkedin.com":
+        path = path.lower()
+    return f"https://{host}{path}"
+
+
+def normalize_profile_text(text: str) -> str:
+    """Compacta espaços e remove linhas vazias, repetidas e rótulos de interface."""
+    return normalize_text(text, skip_lines=BOILERPLATE_LINES)
+
+
+def is_scrape_error(text: str) -> bool:
+    return not text or text.startswith(SCRAPE_ERROR_PREFIXES)
+
+
+def profile_cache_key(url: str) -> str:
+    return hashlib.sha256(normalize_profile_url(url).encode("utf-8")).hexdigest()
+
+
+def get_profile_cache():
+    """Retorna o backend configurado, ou None se o cache estiver desativado/indisponível."""
+    try:
+        if PROFILE_CACHE_BACKEND == "disk":
+            return DiskCache(PROFILE_CACHE_DIR, ttl=PROFILE_CACHE_TTL_SECONDS, max_entries=PROFILE_CACHE_MAX_ENTRIES,
+                             max_bytes=PROFILE_CACHE_MAX_BYTES, compress=True)
+        if PROFILE_CACHE_BACKEND == "firestore":
+            return FirestoreCache(PROFILE_CACHE_COLLECTION, ttl=PROFILE_CACHE_TTL_SECONDS,
+                                  max_entries=PROFILE_CACHE_MAX_ENTRIES, compress=True)
+    except Exception as e:
+        print(f"AVISO: Cache de perfis indisponível ({PROFILE_CACHE_BACKEND}): {e}")
+    return None
+
+
+def get_cached_profile_text(cache, url):
+    """Lê o texto do cache sem deixar uma falha do backend interromper a análise."""
+    if cache is None:
+        return None
+    try:
+        entry = cache.get(profile_cache_key(url))
+    except Exception as e:
+        print(f"AVISO: Falha ao ler o cache de perfis: {e}")
+        return None
+    return entry.get("text") if isinstance(entry, dict) else None
+
+
+def store_profile_text(cache, url, text):
+    """Normaliza e grava o texto raspado; mensagens de erro não são guardadas. Retorna o texto normalizado."""
+    if is_scrape_error(text):
+        return text
+    text = normalize_profile_text(text)
+    if cache is not None:
+        try:
+            cache.set(profile_cache_key(url), {"url": normalize_profile_url(url), "text": text})
+        except Exception as e:
+            print(f"AVISO: Falha ao gravar o cache de perfis: {e}")
+    return text
@@ -0,0 +1,107 @@
+# prompt_builder.py
+"""
+Monta os dados de perfil/plano enviados em cada prompt.
+
+Cada seção recebe apenas os campos de que precisa (nada de email, nome ou URL),
+serializados em JSON compacto. Textos livres longos (ex.: full_linkedin_text) são
+condensados e cortados para caber em um orçamento de tokens configurável.
+"""
+import os
+import re
+import json
+
+# Orçamento, em tokens estimados, para cada campo de texto livre do perfil.
+TEXT_TOKEN_BUDGET = int(os.environ.get("PDI_PROMPT_TEXT_TOKEN_BUDGET", "1500"))
+# Aproximação usada quando não há contagem real da API (~4 caracteres por token).
+CHARS_PER_TOKEN = 4
+
+FREE_TEXT_FIELDS = ("resumo_profissional", "full_linkedin_text")
+
+_CAREER_PROFILE = ("cargo_atual", "nivel_hierarquico", "habilidades_atuais", "resumo_profissional", "full_linkedin_text")
+
+# Campos do perfil e do plano usados por cada seção.
+SECTION_FIELDS = {
+    "analise_geral": {
+        "profile": _CAREER_PROFILE + ("pontos_a_melhorar",),
+        "plan": ("objetivo_final", "metas_temporais"),
+    },
+    "tipo_empresa_ideal": {"profile": _CAREER_PROFILE, "plan": ("objetivo_final",)},
+    "sugestao_cargos_similares": {"profile": _CAREER_PROFILE, "plan": ("objetivo_final",)},
+    "plano_smart_1_ano": {
+        "profile": _CAREER_PROFILE + ("pontos_a_melhorar",),
+        "plan": ("objetivo_final", "metas_temporais.1_ano"),
+    },
+    "proximos_passos": {"profile": (), "plan": ("objetivo_final", "metas_temporais")},
+    "recomendacoes_focadas": {"profile": ("pontos_a_melhorar",), "plan": ("objetivo_final",)},
+    "plano_de_acao_ia": {"profile": (), "plan": ("objetivo_final", "metas_temporais")},
+}
+SECTION_FIELDS["diagnostico_consolidado"] = SECTION_FIELDS["analise_geral"]
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def normalize_text(text: str, skip_lines=frozenset()) -> str:
+    """
+    Compacta espaços e remove linhas vazias, repetidas e as que estão em `skip_lines`
+    (comparadas em minúsculas). Usado também pelo cache de perfis (profile_cache.py).
+    """
+    lines = []
+    seen = set()
+    for line in (text or "").splitlines():
+        line = re.sub(r"\s+", " ", line).strip()
+        if not line or line in seen or line.lower() in skip_lines:
+            continue
+        seen.add(line)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def condense_text(text: str, token_budget: int = TEXT_TOKEN_BUDGET) -> str:
+    """Remove espaços e linhas repetidas e corta o texto no orçamento de tokens."""
+    condensed = normalize_text(text)
+    max_chars = token_budget * CHARS_PER_TOKEN
+    if len(condensed) > max_chars:
+        condensed = condensed[:max_chars].rsplit(" ", 1)[0] + " [...]"
+    return condensed
+
+
+def _pick(data: dict, path: str):
+    value = data
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _is_empty(value) -> bool:
+    if isinstance(value, dict):
+        return all(_is_empty(v) for v in value.values())
+    return value in (None, "", [])
+
+
+def section_inputs(section: str, profile: dict, plan: dict) -> dict:
+    """Dados (já condensados) de perfil e plano que a seção recebe. Também compõem a chave do cache."""
+    fields = SECTION_FIELDS[section]
+    selected = {"profile": {}, "plan": {}}
+    for source_name, source in (("profile", profile), ("plan", plan)):
+        for path in fields[source_name]:
+            value = _pick(source or {}, path)
+            if _is_empty(value):
+                continue
+            if path in FREE_TEXT_FIELDS and isinstance(value, str):
+                value = condense_text(value)
+            selected[source_name][path.split(".")[-1]] = value
+    return selected
+
+
+def compact_json(data) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def prompt_data(section: str, profile: dict, plan: dict):
+    """Retorna (perfil, plano) da seção como JSON compacto, prontos para entrar no prompt."""
+    inputs = section_inputs(section, profile, plan)
+    return compact_json(inputs["profile"]), compact_json(inputs["plan"])
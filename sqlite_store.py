@@ -0,0 +1,52 @@
+# sqlite_store.py
+"""
+Arquivos SQLite locais compartilhados entre threads e processos do servidor
+(usados por gemini_limiter.py e email_outbox.py).
+
+    db = SQLiteFile("data_pdi/exemplo.sqlite3")
+    with db.transaction() as conn:        # BEGIN IMMEDIATE ... COMMIT/ROLLBACK
+        conn.execute("UPDATE ...")
+    db.connect().execute("SELECT ...")    # leitura fora de transação
+"""
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+
+class SQLiteFile:
+    """Uma conexão por thread e por processo (conexões SQLite não sobrevivem a um fork), em modo WAL."""
+
+    def __init__(self, path, row_factory=None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.row_factory = row_factory
+        self._local = threading.local()
+
+    def connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            if self.row_factory is not None:
+                conn.row_factory = self.row_factory
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def transaction(self):
+        return Transaction(self.connect())
+
+
+class Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK: uma transação exclusiva de escrita por bloco."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
@@ -0,0 +1,58 @@
+# tests/test_analysis_process.py
+import queue
+
+import pytest
+
+pdi_analyzer = pytest.importorskip("pdi_analyzer")
+benchmarks = pytest.importorskip("benchmarks")
+import gemini_scheduler
+
+USER_DOC = {
+    "profile": {"nome": "Ana", "linkedin_url": "https://www.linkedin.com/in/ana", "cargo_atual": "Analista"},
+    "pdi_plan": {"objetivo_final": "Gerente", "metas_temporais": {}},
+}
+
+
+class FreeLimiter:
+    def acquire(self, tokens=0, max_wait=None):
+        return 0.0
+
+    def adjust_tokens(self, delta):
+        pass
+
+
+def run_analysis(monkeypatch, failure_rate):
+    """Roda o processo de análise contra o modelo falso e retorna as mensagens enviadas à UI."""
+    monkeypatch.setattr(pdi_analyzer, "model", benchmarks.FakeModel(latency=0, failure_rate=failure_rate, seed=1))
+    monkeypatch.setattr(pdi_analyzer, "load_pdi_data_from_firestore", lambda email: {
+        "profile": dict(USER_DOC["profile"]), "pdi_plan": dict(USER_DOC["pdi_plan"]),
+    })
+    monkeypatch.setattr(pdi_analyzer, "SCRAPING_ENABLED", False)
+    monkeypatch.setattr(pdi_analyzer, "get_section_cache", lambda: None)
+    monkeypatch.setattr(pdi_analyzer, "get_gemini_limiter", lambda: FreeLimiter())
+    monkeypatch.setattr(gemini_scheduler, "get_gemini_limiter", lambda: FreeLimiter())
+    monkeypatch.setattr(gemini_scheduler.time, "sleep", lambda seconds: None)
+
+    q = queue.Queue()
+    pdi_analyzer.run_full_analysis_process(q, "ana@empresa.com", max_workers=2, mode="parallel")
+    messages = []
+    while not q.empty():
+        messages.append(q.get())
+    return messages
+
+
+def test_analysis_completes_when_every_section_succeeds(monkeypatch):
+    messages = run_analysis(monkeypatch, failure_rate=0.0)
+
+    assert messages[-1]["status"] == "complete"
+    ai_analysis = messages[-1]["data"]["ai_analysis"]
+    assert all(pdi_analyzer.is_valid_section(key, ai_analysis[key]) for key, _, _ in pdi_analyzer.SECTIONS)
+
+
+def test_sections_that_exhaust_retries_end_the_analysis_in_error(monkeypatch):
+    messages = run_analysis(monkeypatch, failure_rate=1.0)
+
+    statuses = [m["status"] for m in messages]
+    assert "complete" not in statuses
+    assert messages[-1]["status"] == "error"
+    assert set(messages[-1]["failed_sections"]) == {key for key, _, _ in pdi_analyzer.SECTIONS}
@@ -0,0 +1,41 @@
+# tests/test_browser_pool.py
+import time
+
+import pytest
+
+pytest.importorskip("playwright")
+import browser_pool
+from browser_pool import BrowserPool, descendant_rss_mb
+
+
+def test_failed_playwright_start_fails_the_job(monkeypatch):
+    def broken_playwright():
+        raise RuntimeError("driver ausente")
+
+    monkeypatch.setattr(browser_pool, "sync_playwright", broken_playwright)
+    pool = BrowserPool(size=2)
+
+    started = time.monotonic()
+    with pytest.raises(RuntimeError, match="driver ausente"):
+        pool.run(lambda context: "texto", timeout=5)
+    # Um segundo pedido também falha logo, em vez de ficar na fila sem ninguém para atendê-lo.
+    with pytest.raises(RuntimeError, match="driver ausente"):
+        pool.run(lambda context: "texto", timeout=5)
+    assert time.monotonic() - started < 4
+
+
+def test_run_times_out_instead_of_blocking(monkeypatch):
+    monkeypatch.setattr(BrowserPool, "_ensure_slots", lambda self: None)  # nenhuma thread atende
+    pool = BrowserPool()
+
+    with pytest.raises(TimeoutError):
+        pool.run(lambda context: "texto", timeout=0.2)
+    assert pool._jobs.get_nowait()[1].cancelled()
+
+
+def test_rss_is_zero_without_proc(monkeypatch):
+    def no_proc(path):
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(browser_pool.os, "listdir", no_proc)
+    assert descendant_rss_mb() == 0.0
@@ -0,0 +1,81 @@
+# tests/test_diff_field_paths.py
+import pytest
+
+auth = pytest.importorskip("auth")
+firestore = auth.firestore
+diff_field_paths = auth.diff_field_paths
+
+
+def test_nested_change_uses_dotted_path():
+    old = {"profile": {"nome": "Ana", "cargo_atual": "Dev"}, "pdi_plan": {"objetivo_final": "Tech Lead"}}
+    new = {"profile": {"nome": "Ana", "cargo_atual": "Dev Sênior"}, "pdi_plan": {"objetivo_final": "Tech Lead"}}
+    assert diff_field_paths(old, new) == {"profile.cargo_atual": "Dev Sênior"}
+
+
+def test_new_nested_key_is_added_by_path():
+    old = {"profile": {"nome": "Ana"}}
+    new = {"profile": {"nome": "Ana", "resumo_profissional": "Backend"}}
+    assert diff_field_paths(old, new) == {"profile.resumo_profissional": "Backend"}
+
+
+def test_lists_are_replaced_whole():
+    old = {"profile": {"habilidades_atuais": ["Python", "SQL"]}}
+    new = {"profile": {"habilidades_atuais": ["Python", "SQL", "Go"]}}
+    assert diff_field_paths(old, new) == {"profile.habilidades_atuais": ["Python", "SQL", "Go"]}
+
+
+def test_empty_dict_to_non_empty_dict_is_replaced_whole():
+    old = {"pdi_plan": {"metas_temporais": {}}}
+    new = {"pdi_plan": {"metas_temporais": {"1_ano": "Liderar um projeto"}}}
+    assert diff_field_paths(old, new) == {"pdi_plan.metas_temporais": {"1_ano": "Liderar um projeto"}}
+
+
+def test_non_empty_dict_to_empty_dict_is_replaced_whole():
+    old = {"pdi_plan": {"metas_temporais": {"1_ano": "Liderar um projeto"}}}
+    new = {"pdi_plan": {"metas_temporais": {}}}
+    assert diff_field_paths(old, new) == {"pdi_plan.metas_temporais": {}}
+
+
+def test_keys_that_are_not_identifiers_are_quoted():
+    old = {"pdi_plan": {"metas_temporais": {"1_ano": "A", "3_anos": "B"}}}
+    new = {"pdi_plan": {"metas_temporais": {"1_ano": "A2", "3_anos": "B"}}}
+    assert diff_field_paths(old, new) == {"pdi_plan.metas_temporais.`1_ano`": "A2"}
+
+
+def test_removed_keys_become_delete_field():
+    old = {"pdi_plan": {"metas_temporais": {"1_ano": "A", "3_anos": "B"}}, "linkedin_text": "..."}
+    new = {"pdi_plan": {"metas_temporais": {"1_ano": "A"}}}
+    assert diff_field_paths(old, new) == {
+        "pdi_plan.metas_temporais.`3_anos`": firestore.DELETE_FIELD,
+        "linkedin_text": firestore.DELETE_FIELD,
+    }
+
+
+def test_no_changes_means_no_write(monkeypatch):
+    calls = []
+
+    class FakeDocument:
+        def update(self, changes):
+            calls.append(("update", changes))
+
+        def set(self, data, merge=False):
+            calls.append(("set", data))
+
+    class FakeDB:
+        def collection(self, name):
+            return self
+
+        def document(self, email):
+            return FakeDocument()
+
+    monkeypatch.setattr(auth, "get_db", lambda: FakeDB())
+    data = {"profile": {"nome": "Ana", "habilidades_atuais": ["Python"]}, "pdi_plan": {"metas_temporais": {}}}
+    snapshot = {"profile": {"nome": "Ana", "habilidades_atuais": ["Python"]}, "pdi_plan": {"metas_temporais": {}}}
+
+    assert diff_field_paths(snapshot, data) == {}
+    auth.save_pdi_data_to_firestore("ana@exemplo.com", data, snapshot=snapshot)
+    assert calls == []
+
+    data["profile"]["nome"] = "Ana Souza"
+    auth.save_pdi_data_to_firestore("ana@exemplo.com", data, snapshot=snapshot)
+    assert calls == [("update", {"profile.nome": "Ana Souza"})]
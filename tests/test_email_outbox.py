@@ -0,0 +1,153 @@
+# tests/test_email_outbox.py
+"""
+Caixa de saída contra um servidor SMTP local de depuração (smtpd da biblioteca padrão,
+em uma porta livre), com um banco SQLite temporário.
+"""
+import socket
+import threading
+import warnings
+
+import pytest
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    asyncore = pytest.importorskip("asyncore")
+    smtpd = pytest.importorskip("smtpd")
+
+import email_outbox
+from email_outbox import EmailOutbox, SMTPSettings
+
+REFUSED = "recusado@example.com"
+
+
+class RefusingChannel(smtpd.SMTPChannel):
+    def smtp_RCPT(self, arg):
+        if arg and REFUSED in arg:
+            self.push("550 5.1.1 Unknown recipient")
+            return
+        super().smtp_RCPT(arg)
+
+
+class DebuggingServer(smtpd.SMTPServer):
+    channel_class = RefusingChannel
+
+    def __init__(self, socket_map):
+        self.messages = []
+        self.connections = 0
+        super().__init__(("127.0.0.1", 0), None, decode_data=True, map=socket_map)
+
+    def handle_accepted(self, conn, addr):
+        self.connections += 1
+        super().handle_accepted(conn, addr)
+
+    def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
+        self.messages.append({"from": mailfrom, "to": rcpttos, "data": data})
+
+
+@pytest.fixture
+def smtp_server():
+    socket_map = {}
+    server = DebuggingServer(socket_map)
+    stop = threading.Event()
+
+    def serve():
+        while not stop.is_set():
+            asyncore.loop(timeout=0.05, count=1, map=socket_map)
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    server.port = server.socket.getsockname()[1]
+    yield server
+    stop.set()
+    thread.join(timeout=5)
+    asyncore.close_all(map=socket_map)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def make_outbox(tmp_path):
+    outboxes = []
+
+    def make(port, **kwargs):
+        settings = SMTPSettings("127.0.0.1", port, "pdi@example.com", starttls=False)
+        outbox = EmailOutbox(settings, path=tmp_path / "outbox.sqlite3", **kwargs)
+        outboxes.append(outbox)
+        return outbox
+
+    yield make
+    for outbox in outboxes:
+        outbox.pool.close_idle(max_idle=0)
+
+
+def stored_bodies(outbox, message_id):
+    row = outbox._db.connect().execute(
+        "SELECT text_body, html_body FROM messages WHERE id = ?", (message_id,)).fetchone()
+    return tuple(row)
+
+
+def test_messages_are_sent_over_one_reused_connection(smtp_server, make_outbox):
+    outbox = make_outbox(smtp_server.port, batch_size=2)
+    ids = [outbox.enqueue(f"pessoa{i}@example.com", f"Assunto {i}", f"Corpo {i}", f"<p>Corpo {i}</p>")
+           for i in range(5)]
+
+    sent = 0
+    while True:
+        batch_sent = outbox.send_pending()
+        if not batch_sent:
+            break
+        sent += batch_sent
+
+    assert sent == 5
+    assert [m["to"] for m in smtp_server.messages] == [[f"pessoa{i}@example.com"] for i in range(5)]
+    assert "Assunto 0" in smtp_server.messages[0]["data"]
+    # Três lotes (2 + 2 + 1) pela mesma conexão.
+    assert smtp_server.connections == 1
+    assert outbox.pool.stats == {"connections_opened": 1, "connections_reused": 2}
+    for message_id in ids:
+        status = outbox.status(message_id)
+        assert (status["status"], status["attempts"]) == ("sent", 1)
+        assert stored_bodies(outbox, message_id) == (None, None)
+
+
+def test_refused_connection_is_retried_with_backoff(smtp_server, make_outbox, monkeypatch):
+    monkeypatch.setattr(email_outbox.random, "uniform", lambda low, high: high)
+    outbox = make_outbox(free_port())
+    message_id = outbox.enqueue("pessoa@example.com", "Redefinição", "token", None)
+
+    assert outbox.send_pending() == 0
+    status = outbox.status(message_id)
+    assert (status["status"], status["attempts"]) == ("pending", 1)
+    assert "ConnectionRefusedError" in status["last_error"]
+    next_attempt_at, updated_at = outbox._db.connect().execute(
+        "SELECT next_attempt_at, updated_at FROM messages WHERE id = ?", (message_id,)).fetchone()
+    assert next_attempt_at - updated_at == pytest.approx(email_outbox.OUTBOX_BACKOFF_BASE, abs=0.01)
+    # Ainda no backoff: nada é tentado de novo.
+    assert outbox.send_pending() == 0
+    assert outbox.status(message_id)["attempts"] == 1
+
+    # O servidor volta e o prazo do backoff passa.
+    outbox.settings.port = smtp_server.port
+    outbox._db.connect().execute("UPDATE messages SET next_attempt_at = 0 WHERE id = ?", (message_id,))
+    assert outbox.send_pending() == 1
+    status = outbox.status(message_id)
+    assert (status["status"], status["attempts"]) == ("sent", 2)
+
+
+def test_refused_recipient_fails_permanently(smtp_server, make_outbox):
+    outbox = make_outbox(smtp_server.port)
+    refused_id = outbox.enqueue(REFUSED, "Redefinição", "token secreto", "<p>token secreto</p>")
+    ok_id = outbox.enqueue("pessoa@example.com", "Redefinição", "outro token", None)
+
+    assert outbox.send_pending() == 1
+    status = outbox.status(refused_id)
+    assert (status["status"], status["attempts"]) == ("failed", 1)
+    assert "SMTPRecipientsRefused" in status["last_error"]
+    assert stored_bodies(outbox, refused_id) == (None, None)
+    # A recusa de um destinatário não derruba a conexão para o restante do lote.
+    assert outbox.status(ok_id)["status"] == "sent"
+    assert smtp_server.connections == 1
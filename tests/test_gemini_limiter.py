@@ -0,0 +1,50 @@
+# tests/test_gemini_limiter.py
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from gemini_limiter import GeminiRateLimiter, RateLimitWaitExceeded
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    # 60 requisições por minuto = 1 ficha por segundo; sem limite de tokens.
+    return GeminiRateLimiter(tmp_path / "limiter.sqlite3", requests_per_minute=60, tokens_per_minute=0)
+
+
+def drain(limiter):
+    for _ in range(int(limiter.requests_per_minute)):
+        limiter.acquire(max_wait=0.5)
+
+
+def test_waits_for_refill_when_bucket_is_empty(limiter):
+    drain(limiter)
+    with pytest.raises(RateLimitWaitExceeded):
+        limiter.acquire(max_wait=0.2)
+    waited = limiter.acquire(max_wait=5)
+    assert 0.5 < waited < 2.0
+
+
+def test_purged_ticket_still_acquires(limiter):
+    drain(limiter)
+    result = {}
+
+    def waiter():
+        try:
+            result["waited"] = limiter.acquire(max_wait=5)
+        except RateLimitWaitExceeded as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    time.sleep(0.2)
+    # Simula outro processo considerando a senha abandonada (ex.: este ficou suspenso).
+    with sqlite3.connect(limiter.path) as conn:
+        conn.execute("DELETE FROM tickets")
+    thread.join(timeout=10)
+
+    assert "error" not in result
+    assert result["waited"] < 2.0
+    assert limiter.stats()["waiting_now"] == 0
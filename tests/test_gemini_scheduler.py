@@ -0,0 +1,153 @@
+# tests/test_gemini_scheduler.py
+import json
+
+import pytest
+
+api_exceptions = pytest.importorskip("google.api_core.exceptions")
+import gemini_scheduler
+from gemini_limiter import RateLimitWaitExceeded
+from gemini_scheduler import DeadlineExhausted, call_with_retry, gemini_run, is_retryable
+
+
+class FreeLimiter:
+    def acquire(self, tokens=0, max_wait=None):
+        return 0.0
+
+
+@pytest.fixture(autouse=True)
+def no_quota(monkeypatch):
+    monkeypatch.setattr(gemini_scheduler, "get_gemini_limiter", lambda: FreeLimiter())
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Registra os atrasos do backoff sem esperar, sempre no teto do jitter."""
+    delays = []
+    monkeypatch.setattr(gemini_scheduler.time, "sleep", delays.append)
+    monkeypatch.setattr(gemini_scheduler.random, "uniform", lambda low, high: high)
+    return delays
+
+
+def failing(errors, result="ok"):
+    """fn(timeout) que levanta cada erro de `errors` em sequência e depois retorna `result`."""
+    calls = []
+
+    def fn(timeout):
+        calls.append(timeout)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    fn.calls = calls
+    return fn
+
+
+@pytest.mark.parametrize("error", [
+    api_exceptions.TooManyRequests("429"),
+    api_exceptions.ResourceExhausted("429"),
+    api_exceptions.ServiceUnavailable("503"),
+    api_exceptions.InternalServerError("500"),
+    api_exceptions.DeadlineExceeded("504"),
+    TimeoutError(),
+    ConnectionError(),
+    json.JSONDecodeError("Expecting value", "", 0),
+])
+def test_transient_errors_are_retryable(error):
+    assert is_retryable(error)
+
+
+@pytest.mark.parametrize("error", [
+    api_exceptions.InvalidArgument("400"),
+    api_exceptions.PermissionDenied("403"),
+    api_exceptions.NotFound("404"),
+    ValueError("bad"),
+    KeyError("x"),
+])
+def test_permanent_errors_are_not_retryable(error):
+    assert not is_retryable(error)
+
+
+def test_retries_with_exponential_backoff_until_success(monkeypatch, sleeps):
+    monkeypatch.setattr(gemini_scheduler, "BACKOFF_BASE", 1.0)
+    monkeypatch.setattr(gemini_scheduler, "BACKOFF_MAX", 20.0)
+    fn = failing([api_exceptions.ServiceUnavailable("503")] * 3)
+
+    with gemini_run(deadline=300) as run:
+        assert call_with_retry(fn, "secao", max_attempts=4) == "ok"
+
+    assert sleeps == [1.0, 2.0, 4.0]
+    summary = run.summary()
+    assert (summary["calls"], summary["retries"], summary["failures"]) == (4, 3, 0)
+
+
+def test_backoff_is_capped(monkeypatch, sleeps):
+    monkeypatch.setattr(gemini_scheduler, "BACKOFF_BASE", 10.0)
+    monkeypatch.setattr(gemini_scheduler, "BACKOFF_MAX", 15.0)
+    fn = failing([api_exceptions.ResourceExhausted("429")] * 3)
+
+    with gemini_run(deadline=300):
+        call_with_retry(fn, "secao", max_attempts=4)
+
+    assert sleeps == [10.0, 15.0, 15.0]
+
+
+def test_permanent_error_is_raised_without_retry(sleeps):
+    fn = failing([api_exceptions.InvalidArgument("400")])
+
+    with gemini_run(deadline=300) as run, pytest.raises(api_exceptions.InvalidArgument):
+        call_with_retry(fn, "secao", max_attempts=4)
+
+    assert len(fn.calls) == 1 and sleeps == []
+    assert run.summary()["failures"] == 1
+
+
+def test_last_error_is_raised_when_attempts_run_out(sleeps):
+    fn = failing([api_exceptions.ServiceUnavailable("503")] * 5)
+
+    with gemini_run(deadline=300) as run, pytest.raises(api_exceptions.ServiceUnavailable):
+        call_with_retry(fn, "secao", max_attempts=3)
+
+    assert len(fn.calls) == 3 and len(sleeps) == 2
+    assert run.summary()["failures"] == 1
+
+
+def test_exhausted_deadline_stops_before_calling():
+    fn = failing([])
+
+    with gemini_run(deadline=0), pytest.raises(DeadlineExhausted):
+        call_with_retry(fn, "secao")
+
+    assert fn.calls == []
+
+
+def test_no_backoff_past_the_deadline(monkeypatch, sleeps):
+    monkeypatch.setattr(gemini_scheduler, "BACKOFF_BASE", 10.0)
+    fn = failing([api_exceptions.ServiceUnavailable("503")] * 2)
+
+    with gemini_run(deadline=5), pytest.raises(api_exceptions.ServiceUnavailable):
+        call_with_retry(fn, "secao", max_attempts=4)
+
+    assert len(fn.calls) == 1 and sleeps == []
+
+
+def test_call_timeout_is_bounded_by_remaining_deadline():
+    fn = failing([])
+
+    with gemini_run(deadline=5):
+        call_with_retry(fn, "secao", call_timeout=90)
+
+    assert 0 < fn.calls[0] <= 5
+
+
+def test_quota_wait_past_deadline_is_reported_as_deadline(monkeypatch):
+    class ExhaustedLimiter:
+        def acquire(self, tokens=0, max_wait=None):
+            raise RateLimitWaitExceeded("sem cota")
+
+    monkeypatch.setattr(gemini_scheduler, "get_gemini_limiter", lambda: ExhaustedLimiter())
+    fn = failing([])
+
+    with gemini_run(deadline=300), pytest.raises(DeadlineExhausted):
+        call_with_retry(fn, "secao")
+
+    assert fn.calls == []
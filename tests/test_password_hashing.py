@@ -0,0 +1,105 @@
+# tests/test_password_hashing.py
+import threading
+
+import pytest
+
+import password_hashing
+from password_hashing import HashingBusy, LoginThrottle, PasswordHasher
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(password_hashing.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def throttle(clock):
+    return LoginThrottle(window=60, max_per_account=3, max_per_ip=5)
+
+
+def test_account_limit_blocks_until_window_expires(throttle, clock):
+    for _ in range(2):
+        throttle.record_failure("Ana@Exemplo.com")
+        clock.now += 1
+    assert throttle.retry_after("ana@exemplo.com") == 0
+    throttle.record_failure(" ana@exemplo.com ")
+    # A primeira falha (t=1000) só sai da janela em t=1060.
+    assert throttle.retry_after("ana@exemplo.com") == pytest.approx(58)
+    clock.now = 1059.9
+    assert throttle.retry_after("ana@exemplo.com") > 0
+    clock.now = 1060
+    assert throttle.retry_after("ana@exemplo.com") == 0
+
+
+def test_account_limit_does_not_affect_other_accounts(throttle):
+    for _ in range(3):
+        throttle.record_failure("ana@exemplo.com")
+    assert throttle.retry_after("ana@exemplo.com") > 0
+    assert throttle.retry_after("bruno@exemplo.com") == 0
+
+
+def test_ip_limit_spans_accounts(throttle):
+    for i in range(5):
+        throttle.record_failure(f"conta{i}@exemplo.com", ip="10.0.0.1")
+    assert throttle.retry_after("nova@exemplo.com", ip="10.0.0.1") > 0
+    assert throttle.retry_after("nova@exemplo.com", ip="10.0.0.2") == 0
+    assert throttle.retry_after("nova@exemplo.com") == 0
+
+
+def test_success_resets_account_but_not_ip(throttle):
+    for _ in range(3):
+        throttle.record_failure("ana@exemplo.com", ip="10.0.0.1")
+    throttle.record_failure("bruno@exemplo.com", ip="10.0.0.1")
+    throttle.record_failure("carla@exemplo.com", ip="10.0.0.1")
+    throttle.record_success("ana@exemplo.com")
+    assert throttle.retry_after("ana@exemplo.com") == 0
+    assert throttle.retry_after("ana@exemplo.com", ip="10.0.0.1") > 0
+
+
+def test_expired_entries_are_dropped(throttle, clock):
+    throttle.record_failure("ana@exemplo.com", ip="10.0.0.1")
+    clock.now += 61
+    assert throttle.retry_after("ana@exemplo.com", ip="10.0.0.1") == 0
+    assert throttle._failures == {}
+
+
+def test_timeout_becomes_hashing_busy():
+    hasher = PasswordHasher(rounds=4, workers=1, max_pending=2, timeout=0.05)
+    release = threading.Event()
+    try:
+        with pytest.raises(HashingBusy):
+            hasher._run(release.wait)
+        assert hasher.stats["timeouts"] == 1
+    finally:
+        release.set()
+        hasher._executor.shutdown(wait=True)
+    # A vaga volta ao pool quando o trabalho abandonado termina.
+    assert hasher._slots.acquire(blocking=False)
+    assert hasher._slots.acquire(blocking=False)
+
+
+def test_full_pool_rejects_immediately():
+    hasher = PasswordHasher(rounds=4, workers=1, max_pending=1, timeout=5)
+    release = threading.Event()
+    blocker = threading.Thread(target=lambda: hasher._run(release.wait))
+    blocker.start()
+    try:
+        while hasher._slots._value:
+            pass
+        with pytest.raises(HashingBusy):
+            hasher.verify("senha", hasher.hash("senha"))
+        assert hasher.stats["rejected_busy"] == 1
+    finally:
+        release.set()
+        blocker.join()
+        hasher._executor.shutdown(wait=True)
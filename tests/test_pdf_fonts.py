@@ -0,0 +1,41 @@
+# tests/test_pdf_fonts.py
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("fpdf")
+from fpdf import FPDF
+
+from pdf_fonts import add_cached_font
+
+FONT_PATH = Path(__file__).resolve().parent.parent / "fonts" / "DejaVuSans.ttf"
+CREATED_AT = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+# Conjuntos de glifos sem interseção relevante: o subconjunto embutido de um PDF não
+# pode vazar para o seguinte.
+TEXT_A = "Plano de Ação: ação, gestão, evolução 2025"
+TEXT_B = "Ωμέγα → ∑ ≈ ★ Жизнь ü ß ø"
+
+
+def build_pdf(text, cached):
+    pdf = FPDF()
+    pdf.set_creation_date(CREATED_AT)
+    if cached:
+        add_cached_font(pdf, "DejaVu", "", str(FONT_PATH))
+    else:
+        pdf.add_font("DejaVu", "", str(FONT_PATH))
+    pdf.add_page()
+    pdf.set_font("DejaVu", "", 14)
+    pdf.multi_cell(0, 10, text)
+    return bytes(pdf.output())
+
+
+def test_cached_font_matches_add_font_across_documents():
+    expected_a = build_pdf(TEXT_A, cached=False)
+    expected_b = build_pdf(TEXT_B, cached=False)
+
+    # Intercalados, para que o estado de um documento apareça no outro se for compartilhado.
+    assert build_pdf(TEXT_A, cached=True) == expected_a
+    assert build_pdf(TEXT_B, cached=True) == expected_b
+    assert build_pdf(TEXT_A, cached=True) == expected_a
@@ -0,0 +1,58 @@
+# tests/test_section_cache.py
+import queue
+
+import pytest
+
+pdi_analyzer = pytest.importorskip("pdi_analyzer")
+
+
+class DictCache:
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value):
+        self.entries[key] = value
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = DictCache()
+    monkeypatch.setattr(pdi_analyzer, "get_section_cache", lambda: cache)
+    return cache
+
+
+PROFILE = {"nome": "Ana", "cargo_atual": "Analista", "full_linkedin_text": ""}
+PLAN = {"objetivo_final": "Gerente"}
+
+
+def test_error_text_is_not_a_valid_section():
+    assert pdi_analyzer.is_valid_section("analise_geral", "Um plano coerente.")
+    assert not pdi_analyzer.is_valid_section("analise_geral", f"{pdi_analyzer.SECTION_ERROR_PREFIX}: 503")
+
+
+def test_failed_sections_are_never_cached(monkeypatch, cache):
+    def fake_generate_json(prompt, label):
+        if label == "proximos_passos":
+            return {"proximos_passos": ["Atualizar o currículo."]}
+        raise RuntimeError("503 Service Unavailable")
+
+    monkeypatch.setattr(pdi_analyzer, "generate_json", fake_generate_json)
+    ai_analysis = pdi_analyzer.generate_analysis(queue.Queue(), PROFILE, PLAN, mode="parallel")
+
+    # A seção de texto recebe a mensagem de erro, que tem o mesmo tipo de uma resposta válida.
+    assert ai_analysis["analise_geral"].startswith(pdi_analyzer.SECTION_ERROR_PREFIX)
+    assert list(cache.entries.values()) == [["Atualizar o currículo."]]
+
+
+def test_date_dependent_sections_are_keyed_by_date():
+    from datetime import date
+
+    day_one, day_two = date(2025, 3, 1), date(2025, 3, 22)
+    smart = [pdi_analyzer.section_cache_key("plano_smart_1_ano", PROFILE, PLAN, today=d) for d in (day_one, day_two)]
+    general = [pdi_analyzer.section_cache_key("analise_geral", PROFILE, PLAN, today=d) for d in (day_one, day_two)]
+
+    assert smart[0] != smart[1]
+    assert general[0] == general[1]
@@ -0,0 +1,105 @@
+# tests/test_stream_parser.py
+import json
+import queue
+
+import pytest
+
+pdi_analyzer = pytest.importorskip("pdi_analyzer")
+benchmarks = pytest.importorskip("benchmarks")
+import gemini_scheduler
+from pdi_analyzer import SectionStreamParser
+
+DOCUMENT = {
+    "analise_geral": 'Diz "não" a atalhos; usa {chaves}, [colchetes], vírgulas e \\ barras.',
+    "tipo_empresa_ideal": {"cultura": "Aberta, {flexível}", "setor": "Tecnologia", "tamanho": "Médio"},
+    "plano_smart_1_ano": {
+        "M": [{"metrica": "NPS", "detalhe": "subir de 30 para 45]"}],
+        "T": {"cronograma": [{"trimestre": "Q1", "acoes": ["a", ["b", {"c": "}"}]]}], "data_limite": "01/03/2026"},
+    },
+    "proximos_passos": ["Ler \"Clean Code\"", "Fazer, depois medir"],
+    "vazio": {},
+    "numero": 3,
+}
+TEXT = "```json\n" + json.dumps(DOCUMENT, ensure_ascii=False, indent=2) + "\n```"
+
+
+def feed_in_chunks(text, size):
+    parser = SectionStreamParser()
+    completed = []
+    for start in range(0, len(text), size):
+        completed.extend(parser.feed(text[start:start + size]))
+    return parser, completed
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 16, 64, len(TEXT)])
+def test_sections_complete_in_order_for_any_chunk_size(size):
+    parser, completed = feed_in_chunks(TEXT, size)
+
+    assert completed == list(DOCUMENT.items())
+    assert parser.result == DOCUMENT
+
+
+def test_every_split_point_gives_the_same_result():
+    for offset in range(len(TEXT) + 1):
+        parser = SectionStreamParser()
+        completed = parser.feed(TEXT[:offset]) + parser.feed(TEXT[offset:])
+        assert completed == list(DOCUMENT.items()), f"corte na posição {offset}"
+
+
+def test_section_is_reported_only_when_complete():
+    parser = SectionStreamParser()
+    assert parser.feed('```json\n{"analise_geral": "Texto com } e ]') == []
+    assert parser.feed(' ainda", "proximos') == [("analise_geral", "Texto com } e ] ainda")]
+    assert parser.feed('_passos": ["a"]}\n```') == [("proximos_passos", ["a"])]
+
+
+def test_truncated_stream_keeps_only_complete_sections():
+    cut = TEXT.index('"plano_smart_1_ano"') + 40
+    parser, completed = feed_in_chunks(TEXT[:cut], 5)
+
+    assert [key for key, _ in completed] == ["analise_geral", "tipo_empresa_ideal"]
+    assert set(parser.result) == {"analise_geral", "tipo_empresa_ideal"}
+
+
+class FreeLimiter:
+    def acquire(self, tokens=0, max_wait=None):
+        return 0.0
+
+    def adjust_tokens(self, delta):
+        pass
+
+
+class BrokenStreamModel:
+    """Envia as duas primeiras seções em pedaços e cai no meio da terceira."""
+
+    def generate_content(self, prompt, stream=False, request_options=None, **kwargs):
+        sections = dict(list(benchmarks.SAMPLE_SECTIONS.items())[:3])
+        text = "```json\n" + json.dumps(sections, ensure_ascii=False)
+        cut = text.index(json.dumps(list(sections)[2])) + 12
+
+        def chunks():
+            for start in range(0, cut, 9):
+                yield benchmarks.FakeResponse(text[start:min(start + 9, cut)])
+            raise ConnectionError("conexão interrompida")
+        return chunks()
+
+
+def test_error_mid_stream_keeps_received_sections_and_regenerates_the_rest(monkeypatch):
+    monkeypatch.setattr(pdi_analyzer, "model", BrokenStreamModel())
+    monkeypatch.setattr(pdi_analyzer, "STREAM_RESPONSES", True)
+    monkeypatch.setattr(pdi_analyzer, "get_gemini_limiter", lambda: FreeLimiter())
+    monkeypatch.setattr(gemini_scheduler, "get_gemini_limiter", lambda: FreeLimiter())
+    requested = []
+
+    def fake_generate_json(prompt, label):
+        requested.append(label)
+        return {label: benchmarks.SAMPLE_SECTIONS[label]}
+
+    monkeypatch.setattr(pdi_analyzer, "generate_json", fake_generate_json)
+    ui = queue.Queue()
+    ai_analysis = pdi_analyzer.run_consolidated(ui, benchmarks.SAMPLE_PROFILE, benchmarks.SAMPLE_PLAN)
+
+    streamed = list(benchmarks.SAMPLE_SECTIONS)[:2]
+    all_keys = [key for key, _, _ in pdi_analyzer.SECTIONS]
+    assert sorted(requested) == sorted(key for key in all_keys if key not in streamed)
+    assert ai_analysis == {key: benchmarks.SAMPLE_SECTIONS[key] for key in all_keys}
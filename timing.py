@@ -0,0 +1,128 @@
+# timing.py
+"""
+Medição leve do tempo gasto em cada etapa do diagnóstico.
+
+    with recording() as spans:         # abre a gravação de uma análise
+        with span("firestore_load"):   # mede uma etapa
+            ...
+    spans.as_list()                    # [{"step", "start_s", "duration_s"}, ...]
+
+Toda etapa medida também alimenta `recent_timings`, um histórico em memória (por
+processo) usado pelo painel de desempenho para calcular p50/p95 por etapa. Com
+PDI_TIMING_ENABLED=0, span() devolve um contexto vazio compartilhado e nada é medido.
+"""
+import os
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+TIMING_ENABLED = os.environ.get("PDI_TIMING_ENABLED", "1") == "1"
+# Quantas medições recentes de cada etapa o painel considera.
+RECENT_SPANS_PER_STEP = int(os.environ.get("PDI_TIMING_RECENT_PER_STEP", "200"))
+
+_NOOP = nullcontext()
+
+
+class SpanRecorder:
+    """Etapas medidas durante uma análise (inclusive nas threads das seções)."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans = []
+
+    def add(self, step, start, duration):
+        with self._lock:
+            self.spans.append({
+                "step": step,
+                "start_s": round(start - self.started, 4),
+                "duration_s": round(duration, 4),
+            })
+
+    def as_list(self):
+        with self._lock:
+            return sorted(self.spans, key=lambda s: s["start_s"])
+
+
+class RecentTimings:
+    """Últimas durações de cada etapa, para o cálculo de p50/p95 no painel."""
+
+    def __init__(self, per_step=RECENT_SPANS_PER_STEP):
+        self.per_step = per_step
+        self._lock = threading.Lock()
+        self._steps = {}
+
+    def add(self, step, duration):
+        with self._lock:
+            if step not in self._steps:
+                self._steps[step] = deque(maxlen=self.per_step)
+            self._steps[step].append(duration)
+
+    def extend(self, spans):
+        for entry in spans or []:
+            self.add(entry["step"], entry["duration_s"])
+
+    def summary(self) -> dict:
+        with self._lock:
+            steps = {step: sorted(values) for step, values in self._steps.items() if values}
+        return {
+            step: {
+                "n": len(values),
+                "p50_s": round(percentile(values, 50), 3),
+                "p95_s": round(percentile(values, 95), 3),
+                "max_s": round(values[-1], 3),
+            }
+            for step, values in sorted(steps.items())
+        }
+
+
+def percentile(values, pct):
+    """Percentil `pct` (0-100) pelo método do posto mais próximo; None se não houver valores."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+recent_timings = RecentTimings()
+_current_recorder = contextvars.ContextVar("span_recorder", default=None)
+
+
+class _Span:
+    __slots__ = ("step", "start")
+
+    def __init__(self, step):
+        self.step = step
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        recorder = _current_recorder.get()
+        if recorder is not None:
+            recorder.add(self.step, self.start, duration)
+        recent_timings.add(self.step, duration)
+        return False
+
+
+def span(step):
+    """Mede o bloco `with` como a etapa `step`."""
+    if not TIMING_ENABLED:
+        return _NOOP
+    return _Span(step)
+
+
+@contextmanager
+def recording():
+    """Grava as etapas medidas dentro do bloco (e nas threads criadas com submit_in_context)."""
+    recorder = SpanRecorder()
+    token = _current_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current_recorder.reset(token)